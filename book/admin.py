@@ -5,7 +5,9 @@ from book.models import Book, UserBookRelation
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'price')
+    list_display = ('title', 'price', 'likes_count', 'ratings')
+    readonly_fields = ('likes_count', 'bookmarks_count', 'readers_count',
+                       'ratings_count')
     list_display_links = ('title', 'price')
 
 
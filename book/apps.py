@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BookConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'book'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from book import signals  # noqa: F401
+        from book.metrics import install_query_hook
+
+        connection_created.connect(install_query_hook)
@@ -0,0 +1,95 @@
+"""
+Read endpoints of the book API for ASGI deployments.
+
+Django 4.0 has no async ORM yet, so these coroutine views keep the event
+loop free by running each database step on a shared, bounded pool of
+worker threads (``BOOK_ASYNC_DB_WORKERS``). Threads and their database
+connections are reused between requests instead of being created for every
+sync view call, and at most that many requests touch the database at once.
+Writes stay on the sync DRF views.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+
+from book.models import Book, UserBookRelation
+from book.serializers import UserBookRelationSerializer
+from book.views import BookViewSet
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, 'BOOK_ASYNC_DB_WORKERS', 8),
+        thread_name_prefix='book-db')
+
+
+def database_sync_to_async(func):
+    """
+    ``sync_to_async`` on the database pool. Worker threads outlive requests,
+    so they drop expired or broken connections the way request_started and
+    request_finished do for the request thread. Their queries count in the
+    request metrics.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            # The request's context, timings included, comes along.
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=get_executor())
+
+
+def _render(view, request, **kwargs):
+    response = view(request, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+_book_list = BookViewSet.as_view({'get': 'list'})
+_book_detail = BookViewSet.as_view({'get': 'retrieve'})
+
+
+async def book_list(request):
+    """Same response as ``GET /book/``, including cache and validators."""
+    return await database_sync_to_async(_render)(_book_list, request)
+
+
+async def book_detail(request, pk):
+    """Same response as ``GET /book/<pk>/``."""
+    return await database_sync_to_async(_render)(_book_detail, request, pk=pk)
+
+
+def _relation_data(request, book):
+    if not request.user.is_authenticated:
+        return None
+    relation = UserBookRelation.objects.filter(
+        user=request.user, book_id=book).first()
+    if relation is None:
+        # Unlike the PATCH endpoint, reading does not create the relation.
+        get_object_or_404(Book.objects.only('id'), pk=book)
+        relation = UserBookRelation(book_id=book)
+    return UserBookRelationSerializer(relation).data
+
+
+async def relation_detail(request, book):
+    """The current user's relation to ``book``, defaults if there is none."""
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not '
+                                       f'allowed.'}, status=405)
+    try:
+        data = await database_sync_to_async(_relation_data)(request, book)
+    except Http404:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    if data is None:
+        return JsonResponse({'detail': 'Authentication credentials were not '
+                                       'provided.'}, status=403)
+    return JsonResponse(data)
@@ -0,0 +1,130 @@
+"""
+Helpers shared by the ``bench_*`` management commands: a synthetic data
+generator and simple timers. Commands run them against a scratch database;
+they are not used by the application itself.
+"""
+import random
+import statistics
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.models import User
+
+from book.models import Book, UserBookRelation
+
+WORDS = (
+    'python', 'django', 'data', 'history', 'war', 'peace', 'garden', 'night',
+    'river', 'stone', 'winter', 'code', 'light', 'secret', 'city', 'ocean',
+    'мир', 'война', 'книга', 'сад', 'ночь', 'город', 'море', 'зима',
+)
+NAMES = (
+    'Ivan', 'Anna', 'Lev', 'Maria', 'David', 'Olga', 'Peter', 'Elena',
+    'Mark', 'Nina', 'Boris', 'Sofia',
+)
+
+
+def random_title(rnd):
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).title()
+
+
+def random_author(rnd):
+    return f'{rnd.choice(NAMES)} {rnd.choice(NAMES)}ov'
+
+
+def seed_users(count, prefix='bench-user', batch_size=5000, seed=0):
+    """Insert ``count`` users named ``<prefix>-<n>``, return their ids."""
+    rnd = random.Random(seed)
+    users = [User(username=f'{prefix}-{number}',
+                  first_name=rnd.choice(NAMES),
+                  last_name=f'{rnd.choice(NAMES)}ov')
+             for number in range(count)]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    return list(User.objects.filter(
+        username__startswith=f'{prefix}-').values_list('id', flat=True))
+
+
+def seed_books(count, batch_size=5000, seed=0, owners=()):
+    """
+    Insert ``count`` random books with bulk_create, ``batch_size`` a time,
+    owned by random user ids of ``owners``.
+    """
+    rnd = random.Random(seed)
+    owners = list(owners)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        Book.objects.bulk_create(
+            Book(title=random_title(rnd),
+                 author_name=random_author(rnd),
+                 price=Decimal(rnd.randint(100, 99999)) / 100,
+                 owner_id=rnd.choice(owners) if owners else None)
+            for _ in range(size)
+        )
+        created += size
+    return created
+
+
+def seed_readers(book_ids, user_ids, per_book, batch_size=5000, seed=0):
+    """
+    Relate ``per_book`` random users of ``user_ids`` to each book of
+    ``book_ids``. Counters are not maintained; call ``refresh_counters``
+    afterwards if they matter. Returns the number of relations.
+    """
+    rnd = random.Random(seed)
+    user_ids = list(user_ids)
+    relations = (
+        UserBookRelation(book_id=book_id, user_id=user_id,
+                         like=rnd.random() < 0.5,
+                         in_bookmarks=rnd.random() < 0.2,
+                         rate=rnd.choice((None, 1, 2, 3, 4, 5)))
+        for book_id in book_ids
+        for user_id in rnd.sample(user_ids, min(per_book, len(user_ids)))
+    )
+    created = 0
+    while batch := list(islice(relations, batch_size)):
+        UserBookRelation.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+class SqlTimer:
+    """
+    ``connection.execute_wrapper()`` hook counting queries and the time
+    spent in them.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def measure(func, repeat):
+    """Call ``func`` ``repeat`` times, return the wall times in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings, percent):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, int(round(percent / 100 * len(ordered))))
+    return ordered[index]
+
+
+def summary(timings):
+    return {
+        'p50_ms': statistics.median(timings) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+    }
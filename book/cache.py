@@ -0,0 +1,278 @@
+"""
+Versioned response cache for the book API.
+
+Cached entries are never deleted: every Book/UserBookRelation write bumps a
+version number instead, and the version is part of the cache key, so stale
+entries simply stop being read and age out of the backend. Responses to
+authenticated users carry their relation to each book, so those are cached
+per user, and also versioned by the user's relation writes. Only primitive
+cache operations (get/get_many/add/set/incr) are used, so the local-memory
+and file based backends work as well as memcached/redis.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from drf_practice.db.routers import primary_reads
+
+LIST_VERSION_KEY = 'book:version:list'
+RESET_VERSION_KEY = 'book:version:reset'
+CACHED_PARAMS = ('price', 'search', 'ordering', 'cursor', 'page_size')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOOK_CACHE_ALIAS', 'default')]
+
+
+def book_version_key(book_id):
+    return f'book:version:{book_id}'
+
+
+def user_version_key(user_id):
+    return f'book:version:user:{user_id}'
+
+
+def _new_version():
+    # Versions start from the clock rather than 1, so that a version key
+    # evicted from the cache never comes back with an old, still cached value.
+    return time.time_ns()
+
+
+def _get_versions(cache, keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def _recent_key(key):
+    return f'{key}:recent'
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+    # Replicas may lag behind the new version for as long as clients are
+    # pinned to the primary after writing.
+    cache.set(_recent_key(key), 1,
+              getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+
+
+def invalidate_books(book_ids=None):
+    """
+    Invalidate cached list pages and the detail pages of ``book_ids``
+    (of every book when ``book_ids`` is None).
+    """
+    cache = get_cache()
+    _bump(cache, LIST_VERSION_KEY)
+    if book_ids is None:
+        _bump(cache, RESET_VERSION_KEY)
+        return
+    for book_id in set(book_ids):
+        _bump(cache, book_version_key(book_id))
+
+
+def invalidate_user(user_id):
+    """Invalidate the cached responses of ``user_id``."""
+    _bump(get_cache(), user_version_key(user_id))
+
+
+def _normalize(name, value):
+    value = value.strip()
+    if name == 'search':
+        return ' '.join(value.lower().split())
+    if name == 'price':
+        try:
+            return str(Decimal(value).normalize())
+        except InvalidOperation:
+            return value
+    return value
+
+
+def make_key(request, action, pk=None):
+    params = sorted(
+        (name, _normalize(name, value))
+        for name in CACHED_PARAMS
+        for value in request.query_params.getlist(name)
+    )
+    user = request.user
+    auth_state = f'user:{user.pk}' if user.is_authenticated else 'anon'
+    # The path is part of the key because pagination links embed it.
+    raw = repr((action, pk, request.get_host(), request.path, auth_state,
+                params))
+    return f'book:response:{action}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _version_keys(action, pk=None, user_id=None):
+    if pk is None:
+        keys = [LIST_VERSION_KEY]
+    else:
+        keys = [RESET_VERSION_KEY, book_version_key(pk)]
+    if user_id is not None:
+        keys.append(user_version_key(user_id))
+    return keys
+
+
+def get_version(action, pk=None, user_id=None):
+    keys = _version_keys(action, pk, user_id)
+    versions = _get_versions(get_cache(), keys)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def recently_changed(action, pk=None, user_id=None):
+    """
+    Whether the version of the response changed within the replica lag
+    window (DATABASE_REPLICA_PIN_SECONDS).
+    """
+    keys = [_recent_key(key)
+            for key in _version_keys(action, pk, user_id)]
+    return bool(get_cache().get_many(keys))
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def get_or_build(key, version, build):
+    """
+    Return ``(value, outcome)`` where outcome is ``'hit'`` or ``'miss'``.
+
+    ``build`` returns the value to cache, or None for values that must not
+    be cached. Only the request that wins the lock rebuilds a cold key;
+    concurrent requests wait for its result up to BOOK_CACHE_LOCK_TIMEOUT
+    seconds and then build it themselves without caching.
+    """
+    cache = get_cache()
+    value = cache.get(key, version=version)
+    if value is not None:
+        _record('hit')
+        return value, 'hit'
+
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'BOOK_CACHE_LOCK_TIMEOUT', 10)
+    if cache.add(lock_key, 1, lock_timeout, version=version):
+        try:
+            value = build()
+            if value is not None:
+                cache.set(key, value,
+                          getattr(settings, 'BOOK_CACHE_TIMEOUT', 300),
+                          version=version)
+        finally:
+            cache.delete(lock_key, version=version)
+        _record('miss')
+        return value, 'miss'
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key, version=version)
+        if value is not None:
+            _record('hit')
+            return value, 'hit'
+        if cache.get(lock_key, version=version) is None:
+            break
+    _record('miss')
+    return build(), 'miss'
+
+
+def _validators(key, validators):
+    if validators is None:
+        return None, None
+    state, last_modified = validators()
+    if state is None:
+        return None, None
+    digest = hashlib.md5(f'{key}:{state}:{last_modified}'.encode()).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return f'W/"{digest}"', timestamp
+
+
+def _set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _is_conditional(request):
+    return ('HTTP_IF_NONE_MATCH' in request.META or
+            'HTTP_IF_MODIFIED_SINCE' in request.META)
+
+
+def cached_response(request, action, respond, pk=None, validators=None):
+    """
+    Serve ``respond()`` (a view call returning a DRF Response) through the
+    cache. Only 200 responses are cached; their outcome is reported in the
+    ``X-Cache`` header. Misses shortly after a write read from the primary
+    database.
+
+    ``validators`` returns a ``(state, last_modified)`` pair describing the
+    data of the response. Conditional requests that miss the cache call it
+    before ``respond()`` and get a 304 if nothing changed; otherwise it is
+    called after ``respond()`` and stored with the entry, so cache hits
+    answer If-None-Match/If-Modified-Since without touching the database.
+    """
+    key = make_key(request, action, pk)
+    user = request.user
+    user_id = user.pk if user.is_authenticated else None
+    version = get_version(action, pk, user_id)
+    entry = get_cache().get(key, version=version)
+    if entry is not None:
+        _record('hit')
+        outcome = 'hit'
+        data, etag, last_modified = entry
+    else:
+        # A replica may not have the writes behind a new version yet, and
+        # the entry built from it would outlive the pin of their clients.
+        reads = (primary_reads()
+                 if recently_changed(action, pk, user_id) else nullcontext())
+        with reads:
+            checked = None
+            if _is_conditional(request):
+                checked = _validators(key, validators)
+                not_modified = get_conditional_response(request, *checked)
+                if not_modified is not None:
+                    return _set_validators(not_modified, *checked)
+
+            uncached = []
+
+            def build():
+                response = respond()
+                if response.status_code != status.HTTP_200_OK:
+                    uncached.append(response)
+                    return None
+                return (response.data,
+                        *(checked or _validators(key, validators)))
+
+            entry, outcome = get_or_build(key, version, build)
+        if uncached:
+            return uncached[0]
+        data, etag, last_modified = entry
+
+    response = (get_conditional_response(request, etag, last_modified)
+                or Response(data))
+    response['X-Cache'] = outcome.upper()
+    return _set_validators(response, etag, last_modified)
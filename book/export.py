@@ -0,0 +1,81 @@
+"""
+Snapshots of books and relations as NDJSON or CSV, shared by the
+``export_books`` command and the admin export endpoint.
+
+Rows are read with ``QuerySet.iterator()`` (a named server-side cursor on
+PostgreSQL) and written ``batch_size`` rows at a time, so memory stays the
+same however many rows are exported. The columns are the ones
+``import_books`` reads back; computed counters are exported for analytics
+and recomputed on import.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from book.models import Book, UserBookRelation
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# (column, lookup) pairs.
+BOOK_COLUMNS = (
+    ('id', 'id'),
+    ('title', 'title'),
+    ('price', 'price'),
+    ('author_name', 'author_name'),
+    ('owner', 'owner__username'),
+    ('likes_count', 'likes_count'),
+    ('bookmarks_count', 'bookmarks_count'),
+    ('readers_count', 'readers_count'),
+    ('ratings_count', 'ratings_count'),
+    ('rating', 'ratings'),
+)
+RELATION_COLUMNS = (
+    ('user', 'user__username'),
+    ('book', 'book_id'),
+    ('like', 'like'),
+    ('in_bookmarks', 'in_bookmarks'),
+    ('rate', 'rate'),
+)
+KINDS = {
+    'books': (Book, BOOK_COLUMNS),
+    'relations': (UserBookRelation, RELATION_COLUMNS),
+}
+
+
+def _ndjson(columns, batch):
+    names = [name for name, _ in columns]
+    return ''.join(
+        json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder,
+                   ensure_ascii=False) + '\n'
+        for row in batch
+    )
+
+
+def _csv(columns, batch, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(name for name, _ in columns)
+    writer.writerows(batch)
+    return buffer.getvalue()
+
+
+def export_rows(kind, output_format, batch_size=2000):
+    """Yield the export of ``kind`` as strings of ``batch_size`` rows."""
+    model, columns = KINDS[kind]
+    rows = model.objects.order_by('id').values_list(
+        *(lookup for _, lookup in columns)
+    ).iterator(chunk_size=batch_size)
+    if output_format == 'csv':
+        yield _csv(columns, [], header=True)
+    while batch := list(islice(rows, batch_size)):
+        if output_format == 'csv':
+            yield _csv(columns, batch)
+        else:
+            yield _ndjson(columns, batch)
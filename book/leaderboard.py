@@ -0,0 +1,276 @@
+"""
+Top books leaderboards, served by ``/book/top/?board=``.
+
+``likes`` and ``rating`` (books with at least ``BOOK_TOP_MIN_VOTES``
+ratings) are materialized: each keeps its best ``BOOK_TOP_CAPACITY``
+books with their score in BookRanking, so a request reads at most
+``BOOK_TOP_SIZE`` rows of the (board, score) index, however many books
+there are. ``recent`` (the books whose relations or data changed last) is
+the same bounded index read on ``Book.updated_at``, which every counter
+change bumps already.
+
+Boards are updated incrementally once counters change, from ``book.logic``,
+in the request or with ``BOOK_RATING_MODE = 'background'`` in the rating
+worker, once for all the books a transaction changed. A book beats the
+board's floor, the best score left out of it, to get in. Books falling to
+the floor leave it, and a board left with fewer than ``BOOK_TOP_SIZE``
+books above its floor is rebuilt. Changes that cannot move a board, the
+common case, are ruled out with two reads and no lock.
+``rebuild_leaderboards`` (or the command of the same name) recomputes every
+board from scratch, which is needed after changing BOOK_TOP_CAPACITY or
+BOOK_TOP_MIN_VOTES. Reads never build a board: the Leaderboard rows are
+created by a migration.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from book.models import Book, BookRanking, Leaderboard
+
+RECENT = 'recent'
+# Materialized boards and the Book field they rank by.
+SCORE_FIELDS = {
+    'likes': 'likes_count',
+    'rating': 'ratings',
+}
+BOARDS = (*SCORE_FIELDS, RECENT)
+
+
+def top_size():
+    return getattr(settings, 'BOOK_TOP_SIZE', 20)
+
+
+def capacity():
+    return max(getattr(settings, 'BOOK_TOP_CAPACITY', 50), top_size())
+
+
+def min_votes():
+    return getattr(settings, 'BOOK_TOP_MIN_VOTES', 3)
+
+
+def eligible(board):
+    """Books ranked on ``board``."""
+    if board == 'likes':
+        return Q(likes_count__gt=0)
+    return Q(ratings__isnull=False, ratings_count__gte=min_votes())
+
+
+def score(board, book):
+    """The score of ``book`` (Book values) on ``board``, None if unranked."""
+    if board == 'likes':
+        return float(book['likes_count']) if book['likes_count'] > 0 else None
+    if book['ratings'] is None or book['ratings_count'] < min_votes():
+        return None
+    return float(book['ratings'])
+
+
+def _key(book_id, value):
+    # Ties go to the oldest book, like the ``-score, id`` ordering.
+    return value, -book_id
+
+
+def _floor(leaderboard):
+    if leaderboard.floor_score is None:
+        return None
+    return _key(leaderboard.floor_book, leaderboard.floor_score)
+
+
+def top_books(board, limit, books=None):
+    """
+    ``.values()`` rows of the best ``limit`` books (at most BOOK_TOP_SIZE)
+    of ``board``, best first, read from ``books`` (a Book queryset).
+    """
+    books = Book.objects.all() if books is None else books
+    limit = min(limit, top_size())
+    if board == RECENT:
+        return list(books.order_by('-updated_at')[:limit].values())
+
+    return list(books.filter(rankings__board=board).annotate(
+        rank_score=F('rankings__score')
+    ).order_by('-rank_score', 'id')[:limit].values())
+
+
+def rebuild_board(board):
+    """Recompute ``board`` from Book. Run it in a transaction."""
+    # The rows come from a migration, get_or_create covers deleted ones so
+    # there always is a row to lock.
+    Leaderboard.objects.get_or_create(name=board)
+    leaderboard = Leaderboard.objects.select_for_update().get(name=board)
+    field = SCORE_FIELDS[board]
+    rows = list(Book.objects.filter(eligible(board)).order_by(
+        f'-{field}', 'id').values_list('id', field)[:capacity() + 1])
+    kept, left_out = rows[:capacity()], rows[capacity():]
+    BookRanking.objects.filter(board=board).delete()
+    BookRanking.objects.bulk_create(
+        BookRanking(board=board, book_id=book_id, score=float(value))
+        for book_id, value in kept)
+    floor = {'floor_score': None, 'floor_book': None}
+    if left_out:
+        book_id, value = left_out[0]
+        floor = {'floor_score': float(value), 'floor_book': book_id}
+    for name, value in floor.items():
+        setattr(leaderboard, name, value)
+    leaderboard.save()
+
+
+def rebuild_leaderboards():
+    """Recompute every materialized board from Book."""
+    with transaction.atomic():
+        for board in SCORE_FIELDS:
+            rebuild_board(board)
+
+
+def _book_values(book_ids, membership=False):
+    books = Book.objects.filter(pk__in=book_ids)
+    if membership:
+        books = books.annotate(**{
+            f'in_{board}': Exists(BookRanking.objects.filter(
+                board=board, book=OuterRef('pk')))
+            for board in SCORE_FIELDS})
+    return list(books.values('id', 'likes_count', 'ratings', 'ratings_count',
+                             *(f'in_{board}' for board in SCORE_FIELDS
+                               if membership)))
+
+
+def _may_change(board, leaderboard, books):
+    if leaderboard is None:
+        return True
+    floor = _floor(leaderboard)
+    for book in books:
+        value = score(board, book)
+        if book[f'in_{board}'] or (value is not None and (
+                floor is None or _key(book['id'], value) > floor)):
+            return True
+    return False
+
+
+def _short_boards(leaderboards):
+    """
+    Boards left with fewer than BOOK_TOP_SIZE books above their floor, by
+    books deleted with their rankings.
+    """
+    floored = [board for board, leaderboard in leaderboards.items()
+               if leaderboard.floor_score is not None]
+    if not floored:
+        return []
+    counts = dict(BookRanking.objects.filter(board__in=floored).values(
+        'board').annotate(count=Count('id')).values_list('board', 'count'))
+    return [board for board in floored if counts.get(board, 0) < top_size()]
+
+
+def update_leaderboards(book_ids):
+    """
+    Move the books ``book_ids``, whose counters changed, in, within or out
+    of the boards.
+    """
+    book_ids = set(book_ids)
+    if not book_ids:
+        return
+    leaderboards = Leaderboard.objects.in_bulk(list(SCORE_FIELDS))
+    books = _book_values(book_ids, membership=True)
+    boards = [board for board in SCORE_FIELDS
+              if _may_change(board, leaderboards.get(board), books)]
+    if len(books) < len(book_ids):
+        # Deleted books left their boards along with their rankings.
+        boards.extend(board for board in _short_boards(leaderboards)
+                      if board not in boards)
+        book_ids = {book['id'] for book in books}
+    if not boards:
+        return
+    with transaction.atomic():
+        # Serializes board updates. Scores are read again under the lock:
+        # an update waiting for it may hold older ones than the last one.
+        leaderboards = {leaderboard.name: leaderboard
+                        for leaderboard in Leaderboard.objects
+                        .select_for_update().filter(name__in=boards)}
+        books = _book_values(book_ids)
+        for board in boards:
+            if board not in leaderboards:
+                rebuild_board(board)
+            else:
+                _update_board(leaderboards[board], book_ids, books)
+
+
+def _update_board(leaderboard, book_ids, books):
+    board = leaderboard.name
+    ranked = dict(BookRanking.objects.filter(board=board).values_list(
+        'book_id', 'score'))
+    scores = {book_id: value for book_id, value in ranked.items()
+              if book_id not in book_ids}
+    floor = _floor(leaderboard)
+    for book in books:
+        value = score(board, book)
+        # A book at or below the floor could rank below books left out.
+        if value is not None and (floor is None or
+                                  _key(book['id'], value) > floor):
+            scores[book['id']] = value
+    ordered = sorted(scores.items(), key=lambda item: _key(*item),
+                     reverse=True)
+    kept, left_out = ordered[:capacity()], ordered[capacity():]
+    if left_out:
+        best_left_out = _key(*left_out[0])
+        floor = best_left_out if floor is None else max(floor, best_left_out)
+    if floor is not None and len(kept) < top_size():
+        rebuild_board(board)
+        return
+
+    kept = dict(kept)
+    removed = ranked.keys() - kept.keys()
+    if removed:
+        BookRanking.objects.filter(board=board, book__in=removed).delete()
+    BookRanking.objects.bulk_create(
+        BookRanking(board=board, book_id=book_id, score=value)
+        for book_id, value in kept.items() if book_id not in ranked)
+    changed = [book_id for book_id, value in kept.items()
+               if book_id in ranked and ranked[book_id] != value]
+    for book_id in changed:
+        BookRanking.objects.filter(board=board, book=book_id).update(
+            score=kept[book_id])
+    if floor != _floor(leaderboard):
+        leaderboard.floor_score, minus_book = floor
+        leaderboard.floor_book = -minus_book
+        leaderboard.save()
+
+
+class PendingUpdate:
+    """The leaderboard update of the changes of a transaction."""
+
+    def __init__(self):
+        self.book_ids = set()
+        self.rebuild = False
+        self.done = False
+        # connection.run_on_commit when registered. Django replaces the
+        # list once it runs or drops callbacks, this one included.
+        self.callbacks = None
+
+    def add(self, book_ids):
+        if book_ids is None:
+            self.rebuild = True
+        else:
+            self.book_ids.update(book_ids)
+
+    def __call__(self):
+        self.done = True
+        if self.rebuild:
+            rebuild_leaderboards()
+        else:
+            update_leaderboards(self.book_ids)
+
+
+def books_changed(book_ids=None):
+    """
+    Update the leaderboards for ``book_ids`` (all books when None) once the
+    transaction commits, in one update for the whole transaction.
+    """
+    connection = transaction.get_connection()
+    update = getattr(connection, 'leaderboard_update', None)
+    if (update is None or update.done
+            or update.callbacks is not connection.run_on_commit):
+        update = PendingUpdate()
+        update.add(book_ids)
+        # Runs right away outside of transactions.
+        transaction.on_commit(update)
+        update.callbacks = connection.run_on_commit
+        connection.leaderboard_update = update
+    else:
+        update.add(book_ids)
@@ -1,9 +1,426 @@
-from django.db.models import Avg
+from collections import Counter
+from functools import partial
 
-from book.models import UserBookRelation
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Avg, Case, Count, DecimalField, \
+    ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
 
+from book.cache import invalidate_books, invalidate_user
+from book.leaderboard import books_changed
+from book.models import Book, UserBookRelation
+from book.rating_queue import background_mode, mark_dirty, queue_deltas
 
-def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
-    book.ratings = rating
-    book.save()
\ No newline at end of file
+
+def relation_counters(state):
+    """Contribution of a single relation to the counters of its book."""
+    return Counter({
+        'likes_count': int(bool(state.get('like'))),
+        'bookmarks_count': int(bool(state.get('in_bookmarks'))),
+        'readers_count': 1,
+        'ratings_count': int(state.get('rate') is not None),
+        'rating_sum': state.get('rate') or 0,
+    })
+
+
+# Counters that leaderboard scores are computed from.
+RANKED_COUNTERS = ('likes_count', 'ratings_count', 'rating_sum')
+
+
+def _rating_expression(sum_delta, count_delta):
+    # Both operands refer to the pre-update row, so the average is taken
+    # from the same running sum and count that the UPDATE writes.
+    return ExpressionWrapper(
+        (F('rating_sum') + sum_delta) * Value(1.0) /
+        NullIf(F('ratings_count') + count_delta, Value(0)),
+        output_field=DecimalField(max_digits=3, decimal_places=2)
+    )
+
+
+def apply_counter_deltas(book_id, deltas):
+    """
+    Atomically shift the counters of a book by ``deltas`` in one UPDATE.
+    The average rating is recalculated only when a rate changed.
+    """
+    changes = {name: F(name) + delta for name, delta in deltas.items()
+               if delta}
+    if 'rating_sum' in changes or 'ratings_count' in changes:
+        changes['ratings'] = _rating_expression(deltas['rating_sum'],
+                                                deltas['ratings_count'])
+    if changes:
+        Book.objects.filter(pk=book_id).update(updated_at=timezone.now(),
+                                               **changes)
+        transaction.on_commit(partial(invalidate_books, [book_id]))
+        if any(deltas[name] for name in RANKED_COUNTERS):
+            books_changed([book_id])
+
+
+def apply_counter_deltas_many(deltas_by_book):
+    """
+    ``apply_counter_deltas`` for several books at once: a single UPDATE
+    whose per-book deltas are picked with CASE.
+    """
+    deltas_by_book = {book_id: deltas
+                      for book_id, deltas in deltas_by_book.items()
+                      if any(deltas.values())}
+    if len(deltas_by_book) <= 1:
+        for book_id, deltas in deltas_by_book.items():
+            apply_counter_deltas(book_id, deltas)
+        return
+
+    def per_book(name):
+        whens = [When(pk=book_id, then=Value(deltas[name]))
+                 for book_id, deltas in deltas_by_book.items()
+                 if deltas[name]]
+        if not whens:
+            return None
+        return Case(*whens, default=Value(0), output_field=IntegerField())
+
+    changes = {}
+    for name in relation_counters({}):
+        delta = per_book(name)
+        if delta is not None:
+            changes[name] = F(name) + delta
+    rated = [book_id for book_id, deltas in deltas_by_book.items()
+             if deltas['rating_sum'] or deltas['ratings_count']]
+    if rated:
+        changes['ratings'] = Case(
+            When(pk__in=rated, then=_rating_expression(
+                per_book('rating_sum') or 0, per_book('ratings_count') or 0)),
+            default=F('ratings'))
+    Book.objects.filter(pk__in=list(deltas_by_book)).update(
+        updated_at=timezone.now(), **changes)
+    transaction.on_commit(partial(invalidate_books, list(deltas_by_book)))
+    books_changed(book_id for book_id, deltas in deltas_by_book.items()
+                  if any(deltas[name] for name in RANKED_COUNTERS))
+
+
+def change_counters(deltas_by_book):
+    """
+    ``apply_counter_deltas_many``, or with ``BOOK_RATING_MODE =
+    'background'`` leave the changed books to the rating queue.
+    """
+    if background_mode():
+        queue_deltas(deltas_by_book)
+    else:
+        apply_counter_deltas_many(deltas_by_book)
+
+
+def relations_changed(user_id):
+    """
+    Invalidate the cached responses of ``user_id``, which show its relations,
+    once the transaction commits. Their books are invalidated along with
+    their counters, which lag with ``BOOK_RATING_MODE = 'background'``.
+    """
+    transaction.on_commit(partial(invalidate_user, user_id))
+
+
+def update_counters(old_state, relation, adding=False):
+    """
+    Move the counters of the relation's book(s) from ``old_state``
+    (values the relation was loaded with) to its current values.
+    """
+    new_state = {name: getattr(relation, name)
+                 for name in UserBookRelation.TRACKED_FIELDS}
+    if adding or old_state != new_state:
+        relations_changed(relation.user_id)
+    if not adding and set(old_state) != set(new_state):
+        # Loaded with deferred fields: previous values are unknown.
+        book_ids = {old_state.get('book_id'), relation.book_id} - {None}
+        if background_mode():
+            mark_dirty(book_ids)
+        else:
+            refresh_counters(book_ids)
+        return
+
+    deltas = {relation.book_id: relation_counters(new_state)}
+    if not adding:
+        old = deltas.setdefault(old_state['book_id'], Counter())
+        old.subtract(relation_counters(old_state))
+    change_counters(deltas)
+
+
+def relation_states(relations):
+    """
+    Lock ``relations`` (a UserBookRelation queryset) about to be deleted and
+    read what remove_counters() needs. Run it in a transaction.
+    """
+    return list(relations.select_for_update().values(
+        'user_id', *UserBookRelation.TRACKED_FIELDS))
+
+
+def remove_counters(states):
+    """
+    Take the deleted relations of ``states`` (relation_states()) off the
+    counters of their books, all books in one UPDATE.
+    """
+    deltas = {}
+    for state in states:
+        deltas.setdefault(state['book_id'], Counter()).subtract(
+            relation_counters(state))
+    for user_id in {state['user_id'] for state in states}:
+        relations_changed(user_id)
+    change_counters(deltas)
+
+
+def _relations_count(**filters):
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk'), **filters
+    ).order_by().values('book').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(relations), Value(0))
+
+
+def refresh_counters(book_ids=None):
+    """
+    Recompute counters and rating of the given books (all books when
+    ``book_ids`` is None) from UserBookRelation. Returns updated rows.
+    """
+    books = Book.objects.all()
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk')
+    ).order_by().values('book')
+    rating = relations.annotate(rating=Avg('rate')).values('rating')
+    rating_sum = relations.annotate(total=Sum('rate')).values('total')
+    updated = books.update(
+        likes_count=_relations_count(like=True),
+        bookmarks_count=_relations_count(in_bookmarks=True),
+        readers_count=_relations_count(),
+        ratings_count=_relations_count(rate__isnull=False),
+        rating_sum=Coalesce(Subquery(rating_sum), Value(0)),
+        ratings=Subquery(rating),
+        updated_at=timezone.now(),
+    )
+    transaction.on_commit(partial(invalidate_books, book_ids))
+    books_changed(book_ids)
+    return updated
+
+
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+
+
+def _relation_sql(connection, fields):
+    """Quoted names and the ON CONFLICT clause setting only ``fields``."""
+    quote = connection.ops.quote_name
+    meta = UserBookRelation._meta
+    columns = {name: quote(meta.get_field(name).column)
+               for name in ('id', 'user', 'book', *RELATION_FIELDS)}
+    # An empty SET is not allowed, and DO NOTHING would return no row.
+    assignments = ', '.join(
+        f'{columns[name]} = excluded.{columns[name]}'
+        for name in fields) or f'{columns["user"]} = excluded.{columns["user"]}'
+    upsert = (f'INSERT INTO {quote(meta.db_table)} ({columns["user"]}, '
+              f'{columns["book"]}, '
+              + ', '.join(columns[name] for name in RELATION_FIELDS) +
+              ')')
+    conflict = (f'ON CONFLICT ({columns["user"]}, {columns["book"]}) '
+                f'DO UPDATE SET {assignments}')
+    return columns, upsert, conflict
+
+
+def _upsert_postgresql(connection, user_id, book_id, fields):
+    """
+    The old row is read with FOR UPDATE, so concurrent upserts of the same
+    relation wait for each other and each one's deltas start from the row
+    it overwrites. ``xmax = 0`` tells whether the upsert inserted a row.
+    """
+    columns, upsert, conflict = _relation_sql(connection, fields)
+    quote = connection.ops.quote_name
+    values = {name: UserBookRelation._meta.get_field(name).get_default()
+              for name in RELATION_FIELDS}
+    values.update(fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ' + ', '.join(columns[name] for name in RELATION_FIELDS)
+            + f' FROM {quote(UserBookRelation._meta.db_table)} '
+            f'WHERE {columns["user"]} = %s AND {columns["book"]} = %s '
+            f'FOR UPDATE',
+            [user_id, book_id])
+        old = cursor.fetchone()
+        cursor.execute(
+            f'{upsert} SELECT %s, {quote(Book._meta.pk.column)}, %s, %s, %s '
+            f'FROM {quote(Book._meta.db_table)} '
+            f'WHERE {quote(Book._meta.pk.column)} = %s '
+            f'{conflict} RETURNING {columns["id"]}, '
+            + ', '.join(columns[name] for name in RELATION_FIELDS) +
+            ', xmax = 0',
+            [user_id, *(values[name] for name in RELATION_FIELDS), book_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    relation_id, like, in_bookmarks, rate, inserted = row
+    new_state = dict(zip(RELATION_FIELDS, (like, in_bookmarks, rate)))
+    old_state = dict(zip(RELATION_FIELDS, old)) if old is not None else None
+    # Nothing to lock: a relation inserted concurrently after the SELECT
+    # was updated instead, from values old_state does not have.
+    raced = old is None and not inserted
+    return relation_id, old_state, new_state, raced
+
+
+def _upsert_sqlite(connection, user_id, book_id, fields):
+    """
+    One SELECT for the book and old row, then the upsert (none when an
+    existing relation is left unchanged).
+    """
+    columns, upsert, conflict = _relation_sql(connection, fields)
+    quote = connection.ops.quote_name
+    book_pk = quote(Book._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT r.{columns["id"]}, '
+            + ', '.join(f'r.{columns[name]}' for name in RELATION_FIELDS) +
+            f' FROM {quote(Book._meta.db_table)} b '
+            f'LEFT JOIN {quote(UserBookRelation._meta.db_table)} r '
+            f'ON r.{columns["book"]} = b.{book_pk} '
+            f'AND r.{columns["user"]} = %s WHERE b.{book_pk} = %s',
+            [user_id, book_id])
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        relation_id, *old = row
+        if relation_id is None:
+            old_state = None
+            new_state = {
+                name: UserBookRelation._meta.get_field(name).get_default()
+                for name in RELATION_FIELDS}
+        else:
+            old_state = dict(zip(RELATION_FIELDS, old))
+            # SQLite returns booleans as integers.
+            old_state['like'] = bool(old_state['like'])
+            old_state['in_bookmarks'] = bool(old_state['in_bookmarks'])
+            new_state = dict(old_state)
+        new_state.update(fields)
+        if old_state is None or new_state != old_state:
+            cursor.execute(
+                f'{upsert} VALUES (%s, %s, %s, %s, %s) {conflict}',
+                [user_id, book_id,
+                 *(new_state[name] for name in RELATION_FIELDS)])
+            if relation_id is None:
+                relation_id = cursor.lastrowid
+    return relation_id, old_state, new_state, False
+
+
+def upsert_relation(user, book_id, fields):
+    """
+    Create or update the relation of ``user`` to ``book_id``, changing only
+    ``fields`` (any of like/in_bookmarks/rate), with one INSERT ... ON
+    CONFLICT, then shift the counters of the book only if they changed.
+
+    Returns the relation, or None when the book does not exist.
+    """
+    using = router.db_for_write(UserBookRelation)
+    connection = connections[using]
+    upsert = {'postgresql': _upsert_postgresql,
+              'sqlite': _upsert_sqlite}.get(connection.vendor)
+    if upsert is None:
+        return _update_relation_orm(user, book_id, fields)
+    with transaction.atomic(using=using):
+        result = upsert(connection, user.pk, book_id, fields)
+        if result is None:
+            return None
+        relation_id, old_state, new_state, raced = result
+        if raced or old_state != new_state:
+            relations_changed(user.pk)
+        if raced:
+            if background_mode():
+                mark_dirty([book_id])
+            else:
+                refresh_counters([book_id])
+        else:
+            deltas = relation_counters(new_state)
+            if old_state is not None:
+                deltas.subtract(relation_counters(old_state))
+            change_counters({book_id: deltas})
+    return UserBookRelation(id=relation_id, user=user, book_id=book_id,
+                            **new_state)
+
+
+def _update_relation_orm(user, book_id, fields):
+    if not Book.objects.filter(pk=book_id).exists():
+        return None
+    try:
+        with transaction.atomic():
+            relation, _ = UserBookRelation.objects.get_or_create(
+                user=user, book_id=book_id)
+    except IntegrityError:
+        relation = UserBookRelation.objects.get(user=user, book_id=book_id)
+    for name, value in fields.items():
+        setattr(relation, name, value)
+    relation.save()
+    return relation
+
+
+def bulk_update_relations(user, items):
+    """
+    Create or update relations of ``user`` from ``items`` (dicts with a
+    ``book`` id and any of like/in_bookmarks/rate) in one transaction:
+    one bulk INSERT, one bulk UPDATE and one counters UPDATE for all books.
+
+    Returns a ``(status, relation)`` pair per item, status being one of
+    created/updated/unchanged/not_found.
+    """
+    try:
+        with transaction.atomic():
+            return _bulk_update_relations(user, items)
+    except IntegrityError:
+        # A relation missing from the locked rows was created concurrently.
+        # It exists now: the retry locks and updates it.
+        with transaction.atomic():
+            return _bulk_update_relations(user, items)
+
+
+def _bulk_update_relations(user, items):
+    book_ids = {item['book'] for item in items}
+    known = set(Book.objects.filter(
+        pk__in=book_ids).values_list('pk', flat=True))
+    relations = {
+        relation.book_id: relation
+        for relation in UserBookRelation.objects.select_for_update().filter(
+            user=user, book_id__in=known)
+    }
+    old_counters = {book_id: relation_counters(relation.__dict__)
+                    for book_id, relation in relations.items()}
+    created, updated, changed_fields = {}, {}, set()
+    results = []
+    for item in items:
+        book_id = item['book']
+        fields = {name: value for name, value in item.items()
+                  if name != 'book'}
+        if book_id not in known:
+            results.append(('not_found', None))
+            continue
+        relation = relations.get(book_id)
+        if relation is None:
+            relation = UserBookRelation(user=user, book_id=book_id,
+                                        **fields)
+            relations[book_id] = created[book_id] = relation
+            results.append(('created', relation))
+            continue
+        changed = {name for name, value in fields.items()
+                   if getattr(relation, name) != value}
+        for name in changed:
+            setattr(relation, name, fields[name])
+        if book_id in created:
+            status = 'created'
+        elif changed:
+            status = 'updated'
+            updated[book_id] = relation
+            changed_fields |= changed
+        else:
+            status = 'unchanged'
+        results.append((status, relation))
+
+    UserBookRelation.objects.bulk_create(created.values())
+    if updated:
+        UserBookRelation.objects.bulk_update(updated.values(),
+                                             sorted(changed_fields))
+    if created or updated:
+        relations_changed(user.pk)
+    deltas = {}
+    for book_id in created.keys() | updated.keys():
+        deltas[book_id] = relation_counters(relations[book_id].__dict__)
+        deltas[book_id].subtract(old_counters.get(book_id, Counter()))
+    change_counters(deltas)
+    return results
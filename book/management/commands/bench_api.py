@@ -0,0 +1,180 @@
+import json
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from book.bench import SqlTimer, seed_books, seed_readers, seed_users, \
+    summary, random_author, random_title
+from book.logic import refresh_counters
+from book.models import Book
+
+# Per endpoint: most queries per request (session and user lookups of the
+# logged-in client included) and p99 latency in milliseconds.
+BUDGETS = {
+    'list': {'queries': 4, 'p99_ms': 250},
+    'filter': {'queries': 4, 'p99_ms': 250},
+    'search': {'queries': 4, 'p99_ms': 500},
+    'ordering': {'queries': 4, 'p99_ms': 250},
+    'detail': {'queries': 4, 'p99_ms': 100},
+    'relation_patch': {'queries': 7, 'p99_ms': 100},
+    'create': {'queries': 4, 'p99_ms': 100},
+}
+
+
+class Command(BaseCommand):
+    help = 'Seed users, books and relations, then measure queries, SQL ' \
+           'time, p50/p99 latency and peak memory of every book API ' \
+           'endpoint and fail when a budget is exceeded. Seeded rows are ' \
+           'rolled back at the end; run it against a scratch database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--readers', type=int, default=5,
+                            help='Relations per book.')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--budgets',
+                            help='JSON file overriding BUDGETS, e.g. '
+                                 '{"list": {"p99_ms": 80}}.')
+        parser.add_argument('--only', action='append',
+                            choices=list(BUDGETS),
+                            help='Endpoint to measure (repeatable).')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the response cache; by default it is '
+                                 'disabled so every request reaches the '
+                                 'database.')
+        parser.add_argument('--json', dest='json_output',
+                            help='Also write the results to this file.')
+
+    def handle(self, *args, **options):
+        budgets = {name: dict(budget) for name, budget in BUDGETS.items()}
+        if options['budgets']:
+            with open(options['budgets']) as file:
+                for name, budget in json.load(file).items():
+                    budgets.setdefault(name, {}).update(budget)
+
+        overrides = {
+            # The host of django.test.Client requests.
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+        if not options['cache']:
+            overrides.update(
+                CACHES={**settings.CACHES, 'bench': {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                BOOK_CACHE_ALIAS='bench')
+        with transaction.atomic():
+            self.seed(options)
+            with override_settings(**overrides):
+                results = self.run(options)
+            transaction.set_rollback(True)
+
+        if options['json_output']:
+            with open(options['json_output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        failures = [
+            f'{name}: {metric} {results[name][metric]:.1f} > {limit}'
+            for name in results
+            for metric, limit in budgets.get(name, {}).items()
+            if results[name][metric] > limit
+        ]
+        if failures:
+            raise CommandError('Budget exceeded:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All budgets met'))
+
+    def seed(self, options):
+        start = time.monotonic()
+        self.stdout.write(f'Seeding {options["users"]} users, '
+                          f'{options["books"]} books and '
+                          f'{options["readers"]} relations per book...')
+        self.user_ids = seed_users(options['users'], seed=options['seed'])
+        first_id = (Book.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0) + 1
+        seed_books(options['books'], seed=options['seed'],
+                   owners=self.user_ids[:100])
+        self.book_ids = list(Book.objects.filter(
+            id__gte=first_id).values_list('id', flat=True))
+        seed_readers(self.book_ids, self.user_ids, options['readers'],
+                     seed=options['seed'])
+        refresh_counters()
+        self.stdout.write(f'Seeded in {time.monotonic() - start:.1f}s')
+
+    def requests(self, rnd):
+        """Endpoint name to a callable making one request with a client."""
+        price = str(Book.objects.filter(
+            id__in=self.book_ids[:100]).values_list('price', flat=True)[0])
+
+        def book_id():
+            return rnd.choice(self.book_ids)
+
+        return {
+            'list': lambda client: client.get('/book/'),
+            'filter': lambda client: client.get('/book/', {'price': price}),
+            'search': lambda client: client.get(
+                '/book/', {'search': random_title(rnd).split()[0]}),
+            'ordering': lambda client: client.get(
+                '/book/', {'ordering': rnd.choice(
+                    ('price', '-price', 'author_name', '-author_name'))}),
+            'detail': lambda client: client.get(f'/book/{book_id()}/'),
+            'relation_patch': lambda client: client.patch(
+                f'/book_relation/{book_id()}/',
+                json.dumps({'like': rnd.random() < 0.5,
+                            'rate': rnd.randint(1, 5)}),
+                content_type='application/json'),
+            'create': lambda client: client.post(
+                '/book/', json.dumps({'title': random_title(rnd),
+                                      'price': '9.99',
+                                      'author_name': random_author(rnd)}),
+                content_type='application/json'),
+        }
+
+    def run(self, options):
+        rnd = random.Random(options['seed'])
+        client = Client()
+        client.force_login(User.objects.get(pk=self.user_ids[0]))
+        results = {}
+        for name, request in self.requests(rnd).items():
+            if options['only'] and name not in options['only']:
+                continue
+            timer = SqlTimer()
+            timings = []
+            most_queries = 0
+            with connection.execute_wrapper(timer):
+                for _ in range(options['repeat']):
+                    before = timer.queries
+                    start = time.perf_counter()
+                    response = request(client)
+                    timings.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        raise CommandError(f'{name}: HTTP '
+                                           f'{response.status_code}')
+                    most_queries = max(most_queries, timer.queries - before)
+
+            # Separate run: tracemalloc slows everything down.
+            tracemalloc.start()
+            request(client)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[name] = {
+                'queries': most_queries,
+                'sql_ms': timer.seconds * 1000 / options['repeat'],
+                **summary(timings),
+                'peak_kib': peak / 1024,
+            }
+            result = results[name]
+            self.stdout.write(
+                f'{name:15} queries {result["queries"]:3} '
+                f'sql {result["sql_ms"]:8.2f} ms '
+                f'p50 {result["p50_ms"]:8.2f} ms '
+                f'p99 {result["p99_ms"]:8.2f} ms '
+                f'peak {result["peak_kib"]:8.1f} KiB')
+        return results
@@ -0,0 +1,185 @@
+import asyncio
+import io
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from book.bench import seed_books, summary
+from book.models import Book
+
+HOST = 'localhost'
+DEPLOYMENTS = (
+    ('wsgi', '/book/'),
+    ('asgi', '/book/'),
+    ('asgi', '/async/book/'),
+)
+
+
+class ThreadCounter:
+    """Highest number of live threads seen by the requests of a run."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+
+    def sample(self):
+        self.peak = max(self.peak, threading.active_count())
+
+
+def run_wsgi(path, query_string, requests, concurrency, threads):
+    application = get_wsgi_application()
+
+    def call():
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query_string,
+                   'HTTP_HOST': HOST, 'wsgi.input': io.BytesIO()}
+        setup_testing_defaults(environ)
+        start = time.perf_counter()
+        statuses = []
+        body = application(environ,
+                           lambda status, headers: statuses.append(status))
+        try:
+            b''.join(body)
+        finally:
+            body.close()
+        threads.sample()
+        assert statuses[0].startswith('200'), statuses[0]
+        return time.perf_counter() - start
+
+    # A threaded WSGI server: one thread per in-flight request.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: call(), range(requests)))
+
+
+def run_asgi(path, query_string, requests, concurrency, threads):
+    application = get_asgi_application()
+
+    async def call():
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(),
+            'query_string': query_string.encode(), 'root_path': '',
+            'headers': [(b'host', HOST.encode())],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        threads.sample()
+        assert messages[0]['status'] == 200, messages[0]
+        return time.perf_counter() - start
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await call()
+
+        return await asyncio.gather(*(limited() for _ in range(requests)))
+
+    return asyncio.run(main())
+
+
+RUNNERS = {'wsgi': run_wsgi, 'asgi': run_asgi}
+
+
+def add_latency(seconds):
+    """Make every query of new connections wait ``seconds`` first."""
+    def delayed(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def receiver(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delayed)
+
+    connection_created.connect(receiver, weak=False)
+
+
+class Command(BaseCommand):
+    help = 'Serve book list requests in-process through the WSGI and ASGI ' \
+           'handlers with the same concurrency and compare throughput, ' \
+           'latency, threads and memory per in-flight request. Needs a ' \
+           'database that other threads can read (not in-memory SQLite); ' \
+           'seeded rows are deleted at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--query', default='page_size=20',
+                            help='Query string of every request.')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Milliseconds added to every query, to '
+                                 'mimic a database across the network.')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the response cache; by default every '
+                                 'request is built from the database.')
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on: queries are recorded and the '
+                              'numbers are not representative.')
+        last_id = Book.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        owner = User.objects.create(username=f'bench-asgi-{time.time_ns()}')
+        try:
+            self.stdout.write(f'Seeding {options["rows"]} books...')
+            seed_books(options['rows'], owners=[owner.id])
+            if options['db_latency']:
+                add_latency(options['db_latency'] / 1000)
+            if options['cache']:
+                self.run(options)
+            else:
+                with override_settings(
+                        CACHES={**settings.CACHES, 'bench': {
+                            'BACKEND': 'django.core.cache.backends.dummy.'
+                                       'DummyCache'}},
+                        BOOK_CACHE_ALIAS='bench'):
+                    self.run(options)
+        finally:
+            Book.objects.filter(id__gt=last_id).delete()
+            owner.delete()
+
+    def run(self, options):
+        for deployment, path in DEPLOYMENTS:
+            runner = RUNNERS[deployment]
+            args = (path, options['query'], options['requests'],
+                    options['concurrency'])
+
+            threads = ThreadCounter()
+            start = time.perf_counter()
+            timings = runner(*args, threads)
+            elapsed = time.perf_counter() - start
+
+            # Separate pass: tracemalloc slows everything down.
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            runner(*args, ThreadCounter())
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+
+            stats = summary(timings)
+            self.stdout.write(
+                f'{deployment} {path:14} '
+                f'{len(timings) / elapsed:8.1f} req/s '
+                f'p50 {stats["p50_ms"]:8.2f} ms p99 {stats["p99_ms"]:8.2f} ms '
+                f'threads {threads.peak:4} '
+                f'heap/in-flight {peak / options["concurrency"] / 1024:8.1f} KiB'
+            )
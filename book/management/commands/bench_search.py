@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from book.bench import measure, seed_books, summary
+from book.models import Book
+from book.search import BookSearchFilter
+from book.views import BookViewSet
+
+# Rare titles are inserted last, so a scan has to walk the whole table.
+NEEDLES = ('Don Quixote', 'The Brothers Karamazov', 'Мастер и Маргарита')
+TERMS = ('python', 'secret garden night', 'quixote', 'karamazov',
+         'маргарита', 'nothing matches this')
+
+
+class Command(BaseCommand):
+    help = 'Compare icontains SearchFilter with the full-text BookSearchFilter ' \
+           'on a seeded catalogue. Seeded rows are rolled back at the end; ' \
+           'run it against a scratch database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f'Seeding {options["rows"]} books...')
+            seed_books(options['rows'])
+            Book.objects.bulk_create(
+                Book(title=title, author_name='Classic', price=10)
+                for title in NEEDLES)
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        factory = APIRequestFactory()
+        view = BookViewSet()
+        for term in TERMS:
+            request = Request(factory.get('/book/', {'search': term}))
+            results = {}
+            for name, backend in (('icontains', SearchFilter),
+                                  ('fulltext', BookSearchFilter)):
+                def page():
+                    books = backend().filter_queryset(
+                        request, Book.objects.all(), view)
+                    return list(books.order_by('id')[:options['page_size']])
+
+                results[name] = summary(measure(page, options['repeat']))
+            icontains, fulltext = results['icontains'], results['fulltext']
+            gain = icontains['p50_ms'] / max(fulltext['p50_ms'], 1e-6)
+            self.stdout.write(
+                f'{term!r:24} '
+                f'icontains p50 {icontains["p50_ms"]:8.2f} ms '
+                f'p99 {icontains["p99_ms"]:8.2f} ms | '
+                f'fulltext p50 {fulltext["p50_ms"]:8.2f} ms '
+                f'p99 {fulltext["p99_ms"]:8.2f} ms | x{gain:.1f}'
+            )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from book.bench import measure, seed_books, seed_readers, seed_users
+from book.logic import refresh_counters
+from book.models import Book
+from book.serializers import BookRowsSerializer, BookSerializer, \
+    prefetch_readers
+from book.views import BookViewSet
+
+
+class Command(BaseCommand):
+    help = 'Rows per second of BookSerializer(many=True) and of the ' \
+           'BookRowsSerializer fast path on seeded books. Seeded rows are ' \
+           'rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000,
+                            help='Books serialized per run.')
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Relations per book.')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f'Seeding {options["rows"]} books...')
+            users = seed_users(max(options['readers'] * 4, 1),
+                               prefix='bench-reader')
+            seed_books(options['rows'])
+            books = Book.objects.order_by('-id')[:options['rows']]
+            seed_readers([book.id for book in books], users,
+                         options['readers'])
+            refresh_counters()
+            self.run(options, sorted(book.id for book in books))
+            transaction.set_rollback(True)
+
+    def run(self, options, book_ids):
+        queryset = BookViewSet.queryset.filter(id__in=book_ids)
+        instances = list(queryset)
+        prefetch_readers(instances)
+        rows = list(queryset.values())
+
+        variants = (
+            ('BookSerializer', lambda: BookSerializer(instances,
+                                                      many=True).data),
+            ('BookRowsSerializer', lambda: BookRowsSerializer(rows).data),
+            ('BookSerializer + queries', lambda: BookSerializer(
+                queryset.all(), many=True).data),
+            ('BookRowsSerializer + queries', lambda: BookRowsSerializer(
+                list(queryset.values())).data),
+        )
+        # BookRowsSerializer always queries the readers; BookSerializer
+        # reads the prefetched ones in the serialization-only run.
+        for name, serialize in variants:
+            timings = measure(serialize, options['repeat'])
+            best = min(timings)
+            self.stdout.write(f'{name:30} {len(rows) / best:12.0f} rows/s '
+                              f'({best * 1000:.1f} ms per run)')
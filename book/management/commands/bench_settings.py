@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from book.bench import SqlTimer, summary
+
+PROFILES = ('drf_practice.settings.dev', 'drf_practice.settings.prod')
+PATHS = ('/metrics', '/book/')
+# What a WSGI worker does before serving its first request.
+STARTUP = '''
+import sys
+import django
+django.setup()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+print(len(sys.modules))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Compare the startup time, loaded modules and per-request time ' \
+           'of settings profiles, each in fresh interpreters, and fail ' \
+           'when the budgets of --budget-profile are exceeded. Requests ' \
+           'go through the full middleware stack with the response cache ' \
+           'disabled; /book/ needs a migrated database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='Settings module to measure (repeatable), '
+                                 f'{" and ".join(PROFILES)} by default.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable), '
+                                 f'{" and ".join(PATHS)} by default.')
+        parser.add_argument('--startups', type=int, default=10,
+                            help='Fresh interpreters started per profile.')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Requests per path and profile.')
+        parser.add_argument('--budget-profile', default=PROFILES[-1])
+        parser.add_argument('--max-startup-ms', type=float)
+        parser.add_argument('--max-modules', type=int)
+        parser.add_argument('--max-request-ms', type=float,
+                            help='p50 of each path.')
+        parser.add_argument('--json', dest='json_output',
+                            help='Also write the results to this file.')
+        # Set when the command runs itself under another profile.
+        parser.add_argument('--measure-requests', action='store_true',
+                            help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or PATHS
+        if options['measure_requests']:
+            self.stdout.write(json.dumps(
+                self.measure_requests(paths, options['repeat'])))
+            return
+
+        profiles = options['profiles'] or PROFILES
+        startups = self.startups(profiles, options['startups'])
+        baseline = startups.pop(None)['startup_ms']
+        self.stdout.write(f'Bare interpreter startup {baseline:.1f} ms, '
+                          f'subtracted below')
+        results = {}
+        for profile in profiles:
+            result = startups[profile]
+            result['startup_ms'] -= baseline
+            result['requests'] = self.requests(profile, paths, options)
+            results[profile] = result
+            self.stdout.write(f'{profile}: startup '
+                              f'{result["startup_ms"]:7.1f} ms, '
+                              f'{result["modules"]} modules')
+            for path, request in result['requests'].items():
+                self.stdout.write(
+                    f'  {path:20} queries {request["queries"]:3} '
+                    f'p50 {request["p50_ms"]:7.2f} ms '
+                    f'p99 {request["p99_ms"]:7.2f} ms')
+
+        if options['json_output']:
+            with open(options['json_output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        failures = self.check_budgets(results.get(options['budget_profile']), options)
+        if failures:
+            raise CommandError('Budget exceeded:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All budgets met'))
+
+    def run_python(self, args, profile=None):
+        env = dict(os.environ)
+        if profile:
+            env['DJANGO_SETTINGS_MODULE'] = profile
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, *args], env=env,
+                                 cwd=settings.BASE_DIR, capture_output=True,
+                                 text=True)
+        elapsed = time.perf_counter() - start
+        if process.returncode:
+            raise CommandError(f'{profile or "python"} failed:\n'
+                               f'{process.stderr}')
+        return elapsed, process.stdout
+
+    def startups(self, profiles, startups):
+        """
+        Median startup of every profile, None being a bare interpreter.
+        Profiles take turns so that drifting machine load hits them alike.
+        """
+        timings = {profile: [] for profile in (None, *profiles)}
+        modules = {None: 0}
+        for _ in range(startups):
+            for profile in timings:
+                elapsed, output = self.run_python(
+                    ['-c', STARTUP if profile else 'pass'], profile)
+                timings[profile].append(elapsed)
+                if profile:
+                    modules[profile] = int(output.split()[-1])
+        return {
+            profile: {'startup_ms': statistics.median(runs) * 1000,
+                      'modules': modules[profile]}
+            for profile, runs in timings.items()
+        }
+
+    def requests(self, profile, paths, options):
+        args = [os.path.join(settings.BASE_DIR, 'manage.py'),
+                'bench_settings', '--measure-requests',
+                '--repeat', str(options['repeat'])]
+        for path in paths:
+            args += ['--path', path]
+        output = self.run_python(args, profile)[1]
+        return json.loads(output.splitlines()[-1])
+
+    def measure_requests(self, paths, repeat):
+        """Time ``paths`` under the settings of this process."""
+        client = Client()
+        results = {}
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                CACHES={**settings.CACHES, 'bench': {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                BOOK_CACHE_ALIAS='bench'):
+            for path in paths:
+                # Warm up: URL resolution, connection, lazy imports.
+                response = client.get(path)
+                if response.status_code >= 400:
+                    raise CommandError(f'{path}: HTTP {response.status_code}')
+                timer = SqlTimer()
+                timings = []
+                with connection.execute_wrapper(timer):
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        client.get(path)
+                        timings.append(time.perf_counter() - start)
+                results[path] = {'queries': timer.queries // repeat,
+                                 **summary(timings)}
+        return results
+
+    def check_budgets(self, result, options):
+        if result is None:
+            return []
+        failures = []
+        limit = options['max_startup_ms']
+        if limit is not None and result['startup_ms'] > limit:
+            failures.append(f'startup {result["startup_ms"]:.1f} ms > {limit}')
+        limit = options['max_modules']
+        if limit is not None and result['modules'] > limit:
+            failures.append(f'modules {result["modules"]} > {limit}')
+        limit = options['max_request_ms']
+        if limit is not None:
+            failures.extend(
+                f'{path}: p50 {request["p50_ms"]:.2f} ms > {limit}'
+                for path, request in result['requests'].items()
+                if request['p50_ms'] > limit
+            )
+        return failures
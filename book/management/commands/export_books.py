@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from book.export import FORMATS, KINDS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Export books (with their counters and rating) or relations as ' \
+           'NDJSON or CSV. The output can be loaded back with import_books.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', nargs='?', choices=KINDS,
+                            default='books')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', default='-',
+                            help='Output file, stdout by default.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunks = export_rows(options['kind'], options['format'],
+                             options['batch_size'])
+        start = time.monotonic()
+        if options['output'] == '-':
+            written = self.write(chunks, self.stdout)
+        else:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as output:
+                written = self.write(chunks, output)
+        self.stderr.write(f'Exported {options["kind"]}: {written} bytes in '
+                          f'{time.monotonic() - start:.1f}s')
+
+    def write(self, chunks, output):
+        written = 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk.encode())
+        return written
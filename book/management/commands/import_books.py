@@ -0,0 +1,281 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from book.cache import invalidate_books
+from book.logic import refresh_counters
+from book.models import Book, UserBookRelation
+from book.serializers import BookSerializer, \
+    UserBookRelationBulkItemSerializer
+
+FORMATS = ('csv', 'jsonl')
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        # Empty cells are how export_books writes None.
+        yield {name: value if value != '' else None
+               for name, value in row.items() if name is not None}
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            row = error
+        yield row
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class ImportState:
+    """
+    Number of input rows already imported, kept in a small JSON file so an
+    interrupted import can skip them when it is started again.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as file:
+            state = json.load(file)
+        if state.get('source') != self.source:
+            raise CommandError(f'{self.path} belongs to an import of '
+                               f'{state.get("source")!r}; remove it or pass '
+                               f'another --state-file.')
+        return state['rows']
+
+    def save(self, rows):
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'source': self.source, 'rows': rows}, file)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = 'Import books from CSV or JSON lines (a file or "-" for stdin). ' \
+           'Rows are validated like POST /book/ and inserted in batches; ' \
+           'an optional "owner" column holds a username and an "id" column ' \
+           'keeps the ids of exported books. Other columns are ignored. ' \
+           'With --kind relations, rows are relations as written by ' \
+           'export_books ("user" being a username); existing ones are kept. ' \
+           'An interrupted import resumes where it stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, "-" for stdin.')
+        parser.add_argument('--kind', choices=('books', 'relations'),
+                            default='books')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format, by default from the file '
+                                 'extension.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--state-file',
+                            help='Where progress is kept for resuming; '
+                                 '<path>.import-state by default, none for '
+                                 'stdin.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        if input_format == 'ndjson':
+            input_format = 'jsonl'
+        if input_format not in FORMATS:
+            raise CommandError('Pass --format csv or --format jsonl.')
+        state_file = options['state_file']
+        if state_file is None and path != '-':
+            state_file = f'{path}.import-state'
+        state = ImportState(state_file, os.path.abspath(path)
+                            if path != '-' else path)
+        self.noun = f'{options["kind"][:-1]}(s)'
+        if options['kind'] == 'books':
+            self.serializer = BookSerializer()
+            self.build, self.insert = self.build_books, self.insert_books
+        else:
+            self.serializer = UserBookRelationBulkItemSerializer()
+            self.build = self.build_relations
+            self.insert = self.insert_relations
+        self.kept_ids = False
+
+        if path == '-':
+            self.run(sys.stdin, input_format, state, options['batch_size'])
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                self.run(stream, input_format, state, options['batch_size'])
+
+    def run(self, stream, input_format, state, batch_size):
+        done = state.load()
+        rows = READERS[input_format](stream)
+        if done:
+            self.stdout.write(f'Resuming after {done} row(s)')
+            for _ in islice(rows, done):
+                pass
+
+        imported = invalid = 0
+        start = time.monotonic()
+        while batch := list(islice(rows, batch_size)):
+            books, errors = self.build(batch, first_row=done + 1)
+            for row_number, error in errors:
+                self.stderr.write(f'row {row_number}: {error}')
+            with transaction.atomic():
+                self.insert(books)
+            done += len(batch)
+            state.save(done)
+            imported += len(books)
+            invalid += len(errors)
+            elapsed = time.monotonic() - start
+            self.stdout.write(f'{done} row(s) read, {imported} imported, '
+                              f'{imported / max(elapsed, 1e-9):.0f} rows/s')
+
+        if self.kept_ids:
+            self.reset_sequence()
+        invalidate_books()
+        state.clear()
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} {self.noun}, skipped {invalid} invalid '
+            f'row(s) in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/s)'))
+
+    def build_books(self, batch, first_row):
+        """Validate ``batch``, return ``(books, [(row number, error)])``."""
+        usernames = {row.get('owner') for row in batch
+                     if isinstance(row, dict) and row.get('owner')}
+        owners = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'id'))
+
+        books, errors = [], []
+        for row_number, row in enumerate(batch, first_row):
+            if not isinstance(row, dict):
+                errors.append((row_number, f'not an object: {row}'))
+                continue
+            try:
+                data = self.serializer.run_validation(row)
+            except ValidationError as error:
+                errors.append((row_number, error.detail))
+                continue
+            owner = row.get('owner') or None
+            if owner is not None and owner not in owners:
+                errors.append((row_number, f'unknown owner {owner!r}'))
+                continue
+            book = Book(owner_id=owners.get(owner), **data)
+            if row.get('id'):
+                try:
+                    book.pk = int(row['id'])
+                except (TypeError, ValueError):
+                    errors.append((row_number, f'invalid id {row["id"]!r}'))
+                    continue
+                self.kept_ids = True
+            books.append(book)
+        return books, errors
+
+    def insert_books(self, books):
+        if any(book.pk for book in books):
+            # Ids that already exist were imported before.
+            Book.objects.bulk_create(books, ignore_conflicts=True)
+        elif connection.vendor == 'postgresql' and books:
+            self.copy(books)
+        else:
+            Book.objects.bulk_create(books)
+
+    def build_relations(self, batch, first_row):
+        """``build_books()`` for relations."""
+        usernames = {row.get('user') for row in batch
+                     if isinstance(row, dict) and row.get('user')}
+        users = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'id'))
+
+        validated, errors = [], []
+        for row_number, row in enumerate(batch, first_row):
+            if not isinstance(row, dict):
+                errors.append((row_number, f'not an object: {row}'))
+                continue
+            try:
+                data = self.serializer.run_validation(row)
+            except ValidationError as error:
+                errors.append((row_number, error.detail))
+                continue
+            if row.get('user') not in users:
+                errors.append((row_number,
+                               f'unknown user {row.get("user")!r}'))
+                continue
+            validated.append((row_number, users[row['user']], data))
+
+        books = set(Book.objects.filter(pk__in={
+            data['book'] for _, _, data in validated
+        }).values_list('pk', flat=True))
+        relations = []
+        for row_number, user_id, data in validated:
+            if data['book'] not in books:
+                errors.append((row_number, f'unknown book {data["book"]}'))
+                continue
+            relations.append(UserBookRelation(
+                user_id=user_id, book_id=data.pop('book'), **data))
+        return relations, sorted(errors, key=lambda error: error[0])
+
+    def insert_relations(self, relations):
+        UserBookRelation.objects.bulk_create(relations, ignore_conflicts=True)
+        if relations:
+            refresh_counters({relation.book_id for relation in relations})
+
+    def copy(self, books):
+        """COPY new ``books`` in, the fastest insert PostgreSQL has."""
+        sql, buffer = self.copy_payload(books)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    def copy_payload(self, books):
+        """The COPY statement and CSV data of ``copy()``."""
+        fields = [field for field in Book._meta.concrete_fields
+                  if not field.primary_key]
+        now = timezone.now()
+        buffer = io.StringIO()
+        # Strings and None are both written quoted ("" for None), FORCE_NULL
+        # reads "" as NULL in the nullable columns, none of which is text.
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for book in books:
+            # COPY bypasses Field.pre_save(), which fills auto_now.
+            book.updated_at = now
+            writer.writerow([
+                field.get_db_prep_save(getattr(book, field.attname),
+                                       connection)
+                for field in fields
+            ])
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        nullable = ', '.join(quote(field.column) for field in fields
+                             if field.null)
+        return (f'COPY {quote(Book._meta.db_table)} ({columns}) '
+                f'FROM STDIN WITH (FORMAT csv, FORCE_NULL ({nullable}))',
+                buffer)
+
+    def reset_sequence(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), [Book])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
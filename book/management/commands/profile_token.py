@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from book.profiling import TOKEN_HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed header value that makes the book API profile ' \
+           'a request (valid for BOOK_PROFILE_TOKEN_MAX_AGE seconds).'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{TOKEN_HEADER}: {make_token()}')
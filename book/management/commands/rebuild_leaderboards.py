@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from book.leaderboard import SCORE_FIELDS, rebuild_leaderboards
+from book.models import BookRanking
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top books leaderboards from the book counters.'
+
+    def handle(self, *args, **options):
+        rebuild_leaderboards()
+        for board in SCORE_FIELDS:
+            ranked = BookRanking.objects.filter(board=board).count()
+            self.stdout.write(f'{board}: {ranked} book(s)')
+        self.stdout.write(self.style.SUCCESS('Rebuilt leaderboards'))
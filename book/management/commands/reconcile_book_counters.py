@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from book.logic import refresh_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/bookmark/reader/rating counters ' \
+           'of books from UserBookRelation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append',
+                            dest='book_ids',
+                            help='Book id to reconcile (repeatable). '
+                                 'All books by default.')
+
+    def handle(self, *args, **options):
+        updated = refresh_counters(options['book_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled counters of {updated} book(s)'))
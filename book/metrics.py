@@ -0,0 +1,345 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+RequestMetricsMiddleware fills histograms per view (``BookViewSet.list``,
+``UserBookRelationView.partial_update``...) with the duration, SQL query
+count and time, serializer time, render time and response size of every
+request; ``metrics`` serves them to staff users and to scrapers sending
+``Authorization: Bearer <BOOK_METRICS_TOKEN>``. Each process keeps its own
+numbers, as with any multi-process Prometheus client, so every worker has
+to be scraped. Database connection pools, the rating queue and the
+response cache report their own numbers.
+"""
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from book import cache
+from book.rating_queue import current_queue
+from drf_practice.db.pool import pools
+
+DURATION_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count)
+                      in sorted(self.series.items())]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket'
+                             f'{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(labels, le="+Inf")} '
+                         f'{count}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self.lock:
+            series = sorted(self.series.items())
+        lines.extend(f'{self.name}{_labels(labels)} {value}'
+                     for labels, value in series)
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by view and status.')
+DURATION = Histogram('http_request_duration_seconds',
+                     'Time spent in the Django stack.', DURATION_BUCKETS)
+SQL_QUERIES = Histogram('http_request_sql_queries',
+                        'SQL queries per request.', QUERY_BUCKETS)
+SQL_DURATION = Histogram('http_request_sql_seconds',
+                         'Time spent in SQL queries.', DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram('http_request_serializer_seconds',
+                                'Time spent building serializer data.',
+                                DURATION_BUCKETS)
+RENDER_DURATION = Histogram('http_request_render_seconds',
+                            'Time spent rendering the response.',
+                            DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes',
+                          'Size of non-streaming response bodies.',
+                          SIZE_BUCKETS)
+REGISTRY = [REQUESTS, DURATION, SQL_QUERIES, SQL_DURATION,
+            SERIALIZER_DURATION, RENDER_DURATION, RESPONSE_SIZE]
+
+
+class RequestTimings:
+    def __init__(self):
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.render_seconds = 0.0
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by record_query.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.sql_queries += 1
+
+
+_current = ContextVar('book_request_timings', default=None)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to ``<name>_seconds`` of the current
+    request. Nested blocks are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or timings.depth:
+        yield
+        return
+    timings.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth -= 1
+        setattr(timings, f'{name}_seconds',
+                getattr(timings, f'{name}_seconds')
+                + time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    ``connection.execute_wrapper()`` hook counting the query in the current
+    request, whichever thread runs it: sync views under ASGI and the async
+    views run theirs in worker threads, with the request's context.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install_query_hook(sender, connection, **kwargs):
+    """``connection_created`` receiver adding record_query to connections."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    cls = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if cls is None:
+        return f'{view.__module__}.{view.__name__}'
+    action = getattr(view, 'actions', {}).get(request.method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+def observe(request, response, timings, duration):
+    labels = (('view', view_name(request)),)
+    REQUESTS.inc(labels + (('status', response.status_code),))
+    DURATION.observe(labels, duration)
+    SQL_QUERIES.observe(labels, timings.sql_queries)
+    SQL_DURATION.observe(labels, timings.sql_seconds)
+    SERIALIZER_DURATION.observe(labels, timings.serializer_seconds)
+    RENDER_DURATION.observe(labels, timings.render_seconds)
+    if not getattr(response, 'streaming', False):
+        RESPONSE_SIZE.observe(labels, len(response.content))
+
+
+class RequestMetricsMiddleware:
+    """Fill the histograms above; cheap enough to keep on in production."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        observe(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        observe(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the DRF Response is rendered.
+        timings = _current.get()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timings.render_seconds += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    stats = cache.get_stats()
+    lines.append('# HELP book_cache_requests_total Book API response cache '
+                 'lookups.')
+    lines.append('# TYPE book_cache_requests_total counter')
+    lines.extend(f'book_cache_requests_total{_labels((("outcome", outcome),))}'
+                 f' {stats.get(outcome, 0)}' for outcome in ('hit', 'miss'))
+    lines.extend(render_rating_queue())
+    lines.extend(render_pools())
+    return '\n'.join(lines) + '\n'
+
+
+def render_rating_queue():
+    queue = current_queue()
+    status = queue.status() if queue is not None else {}
+    lines = ['# HELP book_rating_queue_depth Books waiting for their '
+             'counters and rating to be updated.',
+             '# TYPE book_rating_queue_depth gauge',
+             f'book_rating_queue_depth {status.get("depth", 0)}']
+    for name, documentation in (
+            ('recomputed', 'Books updated by the rating queue.'),
+            ('failures', 'Failed rating queue batches, retried later.')):
+        lines.append(f'# HELP book_rating_{name}_total {documentation}')
+        lines.append(f'# TYPE book_rating_{name}_total counter')
+        lines.append(f'book_rating_{name}_total {status.get(name, 0)}')
+    return lines
+
+
+POOL_COUNTERS = (
+    ('checkouts', 'Connections checked out of the pool.'),
+    ('timeouts', 'Checkouts that gave up waiting.'),
+    ('opened', 'Connections opened.'),
+    ('closed', 'Connections closed.'),
+    ('expired', 'Connections closed for exceeding MAX_LIFETIME.'),
+    ('failed_checks', 'Connections that failed the checkout health check.'),
+)
+
+
+def render_pools():
+    """Database connection pools of drf_practice.db, by alias."""
+    by_alias = {}
+    for (alias, *_), pool in pools().items():
+        status = pool.status()
+        total = by_alias.setdefault(alias, dict.fromkeys(status, 0))
+        for name, value in status.items():
+            total[name] += value
+    if not by_alias:
+        return []
+    series = sorted(by_alias.items())
+    lines = ['# HELP db_pool_connections Pooled database connections.',
+             '# TYPE db_pool_connections gauge']
+    lines.extend(f'db_pool_connections'
+                 f'{_labels((("alias", alias),), state=state)} '
+                 f'{status[state]}'
+                 for alias, status in series for state in ('idle', 'in_use'))
+    for name, documentation in POOL_COUNTERS:
+        lines.append(f'# HELP db_pool_{name}_total {documentation}')
+        lines.append(f'# TYPE db_pool_{name}_total counter')
+        lines.extend(f'db_pool_{name}_total{_labels((("alias", alias),))} '
+                     f'{status[name]}' for alias, status in series)
+    lines.append('# HELP db_pool_wait_seconds Time checkouts waited for a '
+                 'free connection.')
+    lines.append('# TYPE db_pool_wait_seconds summary')
+    for alias, status in series:
+        labels = _labels((('alias', alias),))
+        lines.append(f'db_pool_wait_seconds_sum{labels} '
+                     f'{status["wait_seconds"]}')
+        lines.append(f'db_pool_wait_seconds_count{labels} {status["waits"]}')
+    return lines
+
+
+def has_access(request):
+    token = getattr(settings, 'BOOK_METRICS_TOKEN', '')
+    if token and constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_staff
+
+
+def metrics(request):
+    if not has_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
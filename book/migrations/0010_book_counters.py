@@ -0,0 +1,55 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('book', 'Book')
+    UserBookRelation = apps.get_model('book', 'UserBookRelation')
+
+    def relations_count(**filters):
+        relations = UserBookRelation.objects.filter(
+            book=OuterRef('pk'), **filters
+        ).order_by().values('book').annotate(
+            count=Count('pk')).values('count')
+        return Coalesce(Subquery(relations), Value(0))
+
+    Book.objects.update(
+        likes_count=relations_count(like=True),
+        bookmarks_count=relations_count(in_bookmarks=True),
+        readers_count=relations_count(),
+        ratings_count=relations_count(rate__isnull=False),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0009_book_ratings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='readers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
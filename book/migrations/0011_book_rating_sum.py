@@ -0,0 +1,30 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:46
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_sum(apps, schema_editor):
+    Book = apps.get_model('book', 'Book')
+    UserBookRelation = apps.get_model('book', 'UserBookRelation')
+    rating_sum = UserBookRelation.objects.filter(
+        book=OuterRef('pk')
+    ).order_by().values('book').annotate(total=Sum('rate')).values('total')
+    Book.objects.update(rating_sum=Coalesce(Subquery(rating_sum), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0010_book_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_sum, migrations.RunPython.noop),
+    ]
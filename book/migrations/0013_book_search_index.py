@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The search index as of this migration, independent of book.search.
+FTS_TABLE = 'book_book_fts'
+
+SQLITE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, author_name, content='book_book', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT "
+    f"ON book_book BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author_name) "
+    f"VALUES (new.id, new.title, new.author_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE "
+    f"ON book_book BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author_name) "
+    f"VALUES ('delete', old.id, old.title, old.author_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE "
+    f"OF title, author_name ON book_book BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author_name) "
+    f"VALUES ('delete', old.id, old.title, old.author_name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author_name) "
+    f"VALUES (new.id, new.title, new.author_name); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+POSTGRESQL_SEARCH_SQL = (
+    "ALTER TABLE book_book ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', "
+    "coalesce(title, '') || ' ' || coalesce(author_name, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS book_book_search_vector_idx "
+    "ON book_book USING gin (search_vector)",
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_SEARCH_SQL
+    elif vendor == 'sqlite':
+        statements = SQLITE_FTS_SQL
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE book_book DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(
+                f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0012_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.models import Avg, Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def dedupe_relations(apps, schema_editor):
+    """
+    Keep only the newest relation of every (user, book) pair before the
+    unique constraint is added, and recount the books that had duplicates.
+    """
+    Book = apps.get_model('book', 'Book')
+    UserBookRelation = apps.get_model('book', 'UserBookRelation')
+
+    duplicates = UserBookRelation.objects.values('user', 'book').annotate(
+        newest=Max('id'), total=Count('id')).filter(total__gt=1)
+    book_ids = set()
+    for duplicate in duplicates:
+        UserBookRelation.objects.filter(
+            user=duplicate['user'], book=duplicate['book'],
+            id__lt=duplicate['newest']
+        ).delete()
+        book_ids.add(duplicate['book'])
+    if not book_ids:
+        return
+
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk')).order_by().values('book')
+
+    def relations_count(**filters):
+        return Coalesce(Subquery(relations.filter(**filters).annotate(
+            count=Count('pk')).values('count')), Value(0))
+
+    Book.objects.filter(pk__in=book_ids).update(
+        likes_count=relations_count(like=True),
+        bookmarks_count=relations_count(in_bookmarks=True),
+        readers_count=relations_count(),
+        ratings_count=relations_count(rate__isnull=False),
+        rating_sum=Coalesce(Subquery(relations.annotate(
+            total=Sum('rate')).values('total')), Value(0)),
+        ratings=Subquery(relations.annotate(
+            rating=Avg('rate')).values('rating')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0013_book_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_relations, migrations.RunPython.noop),
+    ]
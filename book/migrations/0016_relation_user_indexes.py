@@ -0,0 +1,25 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0015_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['user', 'id'], name='relation_user_like_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('in_bookmarks', True)), fields=['user', 'id'], name='relation_user_bookmark_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('rate__isnull', False)), fields=['user', 'id'], name='relation_user_rated_idx'),
+        ),
+    ]
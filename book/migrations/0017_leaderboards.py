@@ -0,0 +1,40 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0016_relation_user_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('name', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('floor_score', models.FloatField(null=True)),
+                ('floor_book', models.BigIntegerField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=16)),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='book.book')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bookranking',
+            index=models.Index(fields=['board', '-score', 'book'], name='ranking_board_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookranking',
+            constraint=models.UniqueConstraint(fields=('board', 'book'), name='ranking_board_book_uniq'),
+        ),
+    ]
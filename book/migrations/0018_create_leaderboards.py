@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Q
+
+# Materialized boards and the Book field they rank by, as of this migration.
+SCORE_FIELDS = {
+    'likes': 'likes_count',
+    'rating': 'ratings',
+}
+
+
+def create_leaderboards(apps, schema_editor):
+    """
+    Create the Leaderboard row of every materialized board, built from the
+    current books, so that board updates always have a row to lock.
+    """
+    Book = apps.get_model('book', 'Book')
+    BookRanking = apps.get_model('book', 'BookRanking')
+    Leaderboard = apps.get_model('book', 'Leaderboard')
+
+    capacity = max(getattr(settings, 'BOOK_TOP_CAPACITY', 50),
+                   getattr(settings, 'BOOK_TOP_SIZE', 20))
+    eligible = {
+        'likes': Q(likes_count__gt=0),
+        'rating': Q(ratings__isnull=False, ratings_count__gte=getattr(
+            settings, 'BOOK_TOP_MIN_VOTES', 3)),
+    }
+    for board, field in SCORE_FIELDS.items():
+        rows = list(Book.objects.filter(eligible[board]).order_by(
+            f'-{field}', 'id').values_list('id', field)[:capacity + 1])
+        kept, left_out = rows[:capacity], rows[capacity:]
+        BookRanking.objects.filter(board=board).delete()
+        BookRanking.objects.bulk_create(
+            BookRanking(board=board, book_id=book_id, score=float(value))
+            for book_id, value in kept)
+        floor = {'floor_score': None, 'floor_book': None}
+        if left_out:
+            book_id, value = left_out[0]
+            floor = {'floor_score': float(value), 'floor_book': book_id}
+        Leaderboard.objects.update_or_create(name=board, defaults=floor)
+
+
+def delete_leaderboards(apps, schema_editor):
+    apps.get_model('book', 'BookRanking').objects.filter(
+        board__in=list(SCORE_FIELDS)).delete()
+    apps.get_model('book', 'Leaderboard').objects.filter(
+        name__in=list(SCORE_FIELDS)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0017_leaderboards'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_leaderboards, delete_leaderboards),
+    ]
@@ -1,10 +1,25 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, router, transaction
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 
 
 
 class Book(models.Model):
+    # Maintained from UserBookRelation changes (see book.logic), never
+    # written by a regular Book.save() of a possibly stale instance.
+    DENORMALIZED_FIELDS = (
+        'likes_count',
+        'bookmarks_count',
+        'readers_count',
+        'ratings_count',
+        'rating_sum',
+        'ratings',
+    )
+
     title = models.CharField('Название', max_length=200)
     price = models.DecimalField('Цена', max_digits=7, decimal_places=2)
     author_name = models.CharField('Автор', max_length=255)
@@ -19,10 +34,73 @@ class Book(models.Model):
         default=None,
         null=True
     )
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    bookmarks_count = models.PositiveIntegerField(default=0, editable=False)
+    readers_count = models.PositiveIntegerField(default=0, editable=False)
+    ratings_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped by relation changes too: they change likes/rating in the payload.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # ?price= filter and keyset pages ordered by price/author_name.
+            models.Index(fields=['price', 'id'], name='book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'],
+                         name='book_author_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class UserBookRelationQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the relations and take them off the counters of books."""
+        from book.logic import relation_states, remove_counters
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            states = relation_states(self)
+            deleted = super().delete()
+            remove_counters(states)
+        return deleted
+
+    def readers_preview(self, size):
+        """
+        First ``size`` relations of every book, with only the reader
+        columns shown in the book payload loaded.
+
+        The relations are numbered per book with ROW_NUMBER() in one pass
+        over the (book, id) index, so filter the queryset by book first:
+        the numbering covers every relation it matches.
+        """
+        ranked = self.annotate(reader_number=Window(
+            RowNumber(), partition_by=[F('book')], order_by=F('id').asc(),
+        )).order_by().values('id', 'reader_number')
+        connection = connections[self.db]
+        try:
+            sql, params = ranked.query.get_compiler(
+                connection=connection).as_sql()
+        except EmptyResultSet:
+            return self.none()
+        quote = connection.ops.quote_name
+        first_relations = RawSQL(
+            f'SELECT {quote("id")} FROM ({sql}) {quote("ranked")} '
+            f'WHERE {quote("reader_number")} <= %s', (*params, size))
+        return self.filter(
+            id__in=first_relations
+        ).select_related('user').only(
+            'book', 'user', 'user__first_name', 'user__last_name'
+        ).order_by('id')
+
 
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
@@ -32,18 +110,102 @@ class UserBookRelation(models.Model):
         (4, 'Amazing'),
         (5, 'Perfect'),
     )
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    TRACKED_FIELDS = ('book_id', 'like', 'in_bookmarks', 'rate')
+
+    # Both foreign keys are covered by the composite indexes below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
     like = models.BooleanField(default=False)
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    objects = UserBookRelationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # UserBookRelationView looks relations up by (user, book).
+            models.UniqueConstraint(fields=['user', 'book'],
+                                    name='relation_user_book_uniq'),
+        ]
+        indexes = [
+            # Readers of a book in relation order (preview, /readers/).
+            models.Index(fields=['book', 'id'], name='relation_book_id_idx'),
+            models.Index(fields=['book'], condition=models.Q(like=True),
+                         name='relation_book_like_idx'),
+            # A user's library (/me/books/), newest relation first.
+            models.Index(fields=['user', 'id'], condition=models.Q(like=True),
+                         name='relation_user_like_idx'),
+            models.Index(fields=['user', 'id'],
+                         condition=models.Q(in_bookmarks=True),
+                         name='relation_user_bookmark_idx'),
+            models.Index(fields=['user', 'id'],
+                         condition=models.Q(rate__isnull=False),
+                         name='relation_user_rated_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._remember_state()
+
     def __str__(self):
         return f'User: {self.user.username.upper()} | ' \
                f'Book: {self.book.title} | ' \
                f'Rate: {self.rate}'
 
+    def _remember_state(self):
+        # Read through __dict__ so deferred fields are not loaded here.
+        self._loaded_state = {
+            name: self.__dict__[name]
+            for name in self.TRACKED_FIELDS if name in self.__dict__
+        }
+
     def save(self, *args, **kwargs):
-        from book.logic import set_rating
+        from book.logic import update_counters
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        set_rating(self.book)
\ No newline at end of file
+        update_counters(self._loaded_state, self, adding=adding)
+        self._remember_state()
+
+    def delete(self, *args, **kwargs):
+        from book.logic import relation_states, remove_counters
+        with transaction.atomic(using=router.db_for_write(type(self))):
+            states = relation_states(
+                UserBookRelation.objects.filter(pk=self.pk))
+            deleted = super().delete(*args, **kwargs)
+            remove_counters(states)
+        return deleted
+
+
+class Leaderboard(models.Model):
+    """State of a board of book.leaderboard, see BookRanking."""
+    name = models.CharField(max_length=16, primary_key=True)
+    # Best (score, book) left out of the board, every book left out ranks
+    # at or below it. Null when the board holds every eligible book.
+    floor_score = models.FloatField(null=True)
+    floor_book = models.BigIntegerField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class BookRanking(models.Model):
+    """A book of the top of a Leaderboard, with its score on that board."""
+    board = models.CharField(max_length=16)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE,
+                             related_name='rankings')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'book'],
+                                    name='ranking_board_book_uniq'),
+        ]
+        indexes = [
+            # /book/top/: the first rows of a board, best first.
+            models.Index(fields=['board', '-score', 'book'],
+                         name='ranking_board_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.board}: {self.book_id} ({self.score})'
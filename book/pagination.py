@@ -0,0 +1,171 @@
+import json
+from base64 import b64decode, b64encode
+from functools import reduce
+from operator import or_
+from urllib import parse
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination, Cursor
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination over a composite key.
+
+    The ordering chosen with OrderingFilter is completed with a unique
+    tiebreaker column and the cursor stores the values of every ordering
+    column of the boundary row, so each page is a single
+    ``WHERE (a, id) > (...) ORDER BY a, id LIMIT n`` query no matter how deep
+    it is, and duplicate values of ``a`` never need an OFFSET.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+    tiebreaker = 'id'
+    relevance_field = 'search_rank'
+
+    def get_ordering(self, request, queryset, view):
+        if self.relevance_field in queryset.query.annotations and \
+                not request.query_params.get(OrderingFilter.ordering_param):
+            # Search results without an explicit ordering: best match first.
+            ordering = [f'-{self.relevance_field}']
+        else:
+            ordering = list(super().get_ordering(request, queryset, view))
+        if self.tiebreaker not in (field.lstrip('-') for field in ordering):
+            descending = ordering[-1].startswith('-') if ordering else False
+            ordering.append(f'-{self.tiebreaker}' if descending
+                            else self.tiebreaker)
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}'
+                             for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(
+                ordering, self.cursor.position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_keyset_filter(self, ordering, position):
+        """
+        Rows strictly after ``position`` in ``ordering``:
+        ``a >= x AND (a > x OR (a = x AND b > y) OR ...)``.
+
+        The OR alone is not a range of the (a, b) index; the leading
+        ``a >= x`` is, so the scan starts at the cursor instead of the first
+        row. A row value comparison would do the same, but columns may be
+        ordered in opposite directions.
+        """
+        clauses = []
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+        keyset = reduce(or_, clauses)
+        if len(clauses) == 1:
+            return keyset
+        field, value = ordering[0], position[0]
+        lookup = 'lte' if field.startswith('-') else 'gte'
+        return Q(**{f'{field.lstrip("-")}__{lookup}': value}) & keyset
+
+    def get_position(self, instance):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(instance, dict):
+            # .values() rows
+            return [instance[name] for name in names]
+        return [getattr(instance, name) for name in names]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Walked back past the first row: the next page is the first one.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=self.get_position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = (self.get_position(self.page[0]) if self.page
+                    else self.cursor.position)
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=True, position=position
+        ))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = json.loads(tokens['p'][0])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            # The cursor was issued for another ordering.
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': json.dumps(cursor.position, cls=DjangoJSONEncoder)}
+        if cursor.reverse:
+            tokens['r'] = '1'
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded)
+
+
+class ReadersCursorPagination(KeysetCursorPagination):
+    """Readers of a book in the order they first related to it."""
+    page_size = 50
+
+    def get_ordering(self, request, queryset, view):
+        return (self.ordering,)
+
+
+class LibraryCursorPagination(KeysetCursorPagination):
+    """Books of a user's library, most recently related first."""
+    ordering = '-relation_id'
+    tiebreaker = 'relation_id'
+
+    def get_ordering(self, request, queryset, view):
+        return (self.ordering,)
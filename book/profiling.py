@@ -0,0 +1,247 @@
+"""
+Opt-in profiling of single API requests in production.
+
+A request is profiled when it carries a valid ``X-Profile`` token (see the
+``profile_token`` command) or is picked by ``BOOK_PROFILE_SAMPLE_RATE``.
+Its DRF dispatch then runs under a stack sampler writing flamegraph
+compatible collapsed stacks (``BOOK_PROFILE_MODE = 'sampler'``, the cheap
+default) or under cProfile writing pstats (``'cprofile'``), and every SQL
+query is logged with its duration. Each profile is a directory in
+``BOOK_PROFILE_DIR``; only the newest ``BOOK_PROFILE_KEEP`` are kept.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile'
+TOKEN_SALT = 'book.profiling'
+TOKEN_VALUE = 'profile'
+FILES = {
+    'meta': 'meta.json',
+    'sql': 'queries.sql',
+    'collapsed': 'stacks.collapsed',
+    'pstats': 'profile.pstats',
+}
+# The profile file of each BOOK_PROFILE_MODE.
+MODE_FILES = {
+    'sampler': 'collapsed',
+    'cprofile': 'pstats',
+}
+
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def has_valid_token(request):
+    token = request.headers.get(TOKEN_HEADER)
+    if not token:
+        return False
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=getattr(settings, 'BOOK_PROFILE_TOKEN_MAX_AGE',
+                                   3600))
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def should_profile(request):
+    rate = getattr(settings, 'BOOK_PROFILE_SAMPLE_RATE', 0)
+    return has_valid_token(request) or (rate and random.random() < rate)
+
+
+def profile_dir():
+    return str(getattr(settings, 'BOOK_PROFILE_DIR', 'profiles'))
+
+
+def list_profiles():
+    """Metadata of the kept profiles, newest first."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        try:
+            with open(os.path.join(directory, name, FILES['meta'])) as file:
+                profiles.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_file(profile_id, kind=None):
+    """
+    Path of a file of a kept profile, None if there is no such file. The
+    file of the profile's mode by default.
+    """
+    if not re.fullmatch(r'[\w-]+', profile_id):
+        return None
+    if kind is None:
+        meta = profile_file(profile_id, 'meta')
+        if meta is None:
+            return None
+        try:
+            with open(meta) as file:
+                kind = MODE_FILES.get(json.load(file).get('mode'))
+        except (OSError, ValueError):
+            return None
+    if kind not in FILES:
+        return None
+    path = os.path.join(profile_dir(), profile_id, FILES[kind])
+    return path if os.path.isfile(path) else None
+
+
+def _frame_name(frame):
+    return f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_name}'
+
+
+class StackSampler:
+    """Count the stacks of one thread every ``interval`` seconds."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='book-profiler')
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.stacks.most_common())
+
+
+class QueryLog:
+    """``connection.execute_wrapper()`` hook keeping every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql, params))
+
+    def text(self):
+        return ''.join(f'-- {seconds * 1000:.3f} ms params={params!r}\n'
+                       f'{sql};\n\n'
+                       for seconds, sql, params in self.queries)
+
+
+class ProfiledDispatchMixin:
+    """Profile the DRF dispatch of requests picked by ``should_profile``."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not should_profile(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        mode = getattr(settings, 'BOOK_PROFILE_MODE', 'sampler')
+        queries = QueryLog()
+        profiler = sampler = None
+        start = time.time()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(queries))
+            if mode == 'cprofile':
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiler is already active in this thread.
+                    return super().dispatch(request, *args, **kwargs)
+                stack.callback(profiler.disable)
+            else:
+                sampler = stack.enter_context(StackSampler(
+                    threading.get_ident(),
+                    getattr(settings, 'BOOK_PROFILE_INTERVAL', 0.005)))
+            response = super().dispatch(request, *args, **kwargs)
+        duration = time.time() - start
+
+        action = getattr(self, 'action', None)
+        meta = {
+            'id': f'{int(start * 1000)}-{type(self).__name__}-{action}-'
+                  f'{uuid.uuid4().hex[:8]}',
+            'view': f'{type(self).__name__}.{action}',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'started': start,
+            'duration_ms': duration * 1000,
+            'queries': len(queries.queries),
+            'sql_ms': sum(query[0] for query in queries.queries) * 1000,
+            'mode': mode,
+        }
+        try:
+            self.save_profile(meta, queries, profiler, sampler)
+        except OSError:
+            # A full disk or unwritable BOOK_PROFILE_DIR loses the profile,
+            # not the response.
+            logger.exception('Saving the profile of %s %s failed',
+                             request.method, request.get_full_path())
+        return response
+
+    def save_profile(self, meta, queries, profiler, sampler):
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so listings never see half a profile.
+        partial = tempfile.mkdtemp(dir=directory, prefix='.')
+        try:
+            with open(os.path.join(partial, FILES['sql']), 'w') as file:
+                file.write(queries.text())
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(partial, FILES['pstats']))
+            if sampler is not None:
+                with open(os.path.join(partial, FILES['collapsed']),
+                          'w') as file:
+                    file.write(sampler.collapsed())
+            with open(os.path.join(partial, FILES['meta']), 'w') as file:
+                json.dump(meta, file)
+            os.replace(partial, os.path.join(directory, meta['id']))
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        keep = getattr(settings, 'BOOK_PROFILE_KEEP', 50)
+        profiles = sorted(name for name in os.listdir(directory)
+                          if not name.startswith('.'))
+        for name in profiles[:-keep]:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
@@ -0,0 +1,223 @@
+"""
+Background updates of book counters and ratings, an opt-in mode.
+
+With ``BOOK_RATING_MODE = 'background'``, relation writes don't update
+their book in the request. Once the write commits, its counter deltas are
+added to the book's pending deltas here. Every ``BOOK_RATING_INTERVAL``
+seconds a worker thread applies each book's summed deltas with one UPDATE
+per batch, however many relations changed in between. Books whose deltas
+are unknown (a relation loaded with deferred fields, a raced upsert) are
+marked instead and recomputed from their relations with
+``refresh_counters``, which supersedes their pending deltas. A recompute
+may also count writes whose deltas are only added after it, once their
+transaction commits: their books are recomputed again rather than given
+those deltas. Counters and ratings then lag writes by about one interval.
+Pending work is flushed when the process exits.
+
+The queue lives in the process: deltas lost with it, for example when the
+process is killed, leave counters off until ``reconcile_book_counters``
+runs. That is why the default mode is ``'sync'``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def recompute(book_ids):
+    from book.logic import refresh_counters
+
+    with transaction.atomic():
+        refresh_counters(book_ids)
+
+
+def apply(deltas_by_book):
+    from book.logic import apply_counter_deltas_many
+
+    with transaction.atomic():
+        apply_counter_deltas_many(deltas_by_book)
+
+
+class DirtyBookQueue:
+    # Flushes whose recomputed books are remembered, see add().
+    history = 100
+
+    def __init__(self, recompute=recompute, interval=1.0, batch_size=500,
+                 apply=apply):
+        self.recompute = recompute
+        self.apply = apply
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dirty = set()
+        self.deltas = {}
+        # Finished flushes, and the flush that last recomputed each book
+        # among those after the first ``forgotten`` ones.
+        self.finished = 0
+        self.forgotten = 0
+        self.recomputed = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.stats = dict.fromkeys(('marked', 'recomputed', 'flushes',
+                                    'failures'), 0)
+
+    def mark(self, book_ids):
+        """Recompute ``book_ids`` from their relations."""
+        with self.lock:
+            self.dirty.update(book_ids)
+            self.stats['marked'] += len(book_ids)
+            self._start()
+
+    def add(self, deltas_by_book, since=None):
+        """
+        Add counter deltas (Counters) to those pending for their books.
+        ``since`` is the number of finished flushes when they were written,
+        now by default. A book recomputed by a later flush may already count
+        them, it is recomputed again instead.
+        """
+        with self.lock:
+            if since is None:
+                since = self.finished
+            for book_id, deltas in deltas_by_book.items():
+                if (since < self.forgotten
+                        or self.recomputed.get(book_id, 0) > since):
+                    self.dirty.add(book_id)
+                else:
+                    self.deltas.setdefault(book_id, Counter()).update(deltas)
+            self.stats['marked'] += len(deltas_by_book)
+            self._start()
+
+    def _start(self):
+        if self.thread is None and not self.stopping.is_set():
+            self.thread = threading.Thread(
+                target=self.run, daemon=True, name='book-ratings')
+            self.thread.start()
+
+    def depth(self):
+        with self.lock:
+            return len(self.dirty | self.deltas.keys())
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            # The thread outlives requests: drop expired or broken
+            # connections like request_started/finished do.
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Update the pending books now; return how many were done."""
+        with self.flush_lock:
+            with self.lock:
+                number = self.finished + 1
+                book_ids, self.dirty = sorted(self.dirty), set()
+                deltas, self.deltas = self.deltas, {}
+                self.recomputed.update(dict.fromkeys(book_ids, number))
+            for book_id in book_ids:
+                deltas.pop(book_id, None)
+            deltas = sorted(deltas.items())
+            done = 0
+            for start in range(0, len(deltas), self.batch_size):
+                batch = dict(deltas[start:start + self.batch_size])
+                try:
+                    self.apply(batch)
+                except Exception:
+                    logger.exception('Updating books %s failed', list(batch))
+                    with self.lock:
+                        # Retried with the next flush.
+                        for book_id, book_deltas in deltas[start:]:
+                            self.deltas.setdefault(
+                                book_id, Counter()).update(book_deltas)
+                        self.dirty.update(book_ids)
+                        self.stats['failures'] += 1
+                    book_ids = []
+                    break
+                done += len(batch)
+            for start in range(0, len(book_ids), self.batch_size):
+                batch = book_ids[start:start + self.batch_size]
+                try:
+                    self.recompute(batch)
+                except Exception:
+                    logger.exception('Recomputing books %s failed', batch)
+                    with self.lock:
+                        self.dirty.update(book_ids[start:])
+                        self.stats['failures'] += 1
+                    break
+                done += len(batch)
+            with self.lock:
+                self.finished = number
+                if number - self.history > self.forgotten:
+                    self.forgotten = number - self.history
+                    self.recomputed = {
+                        book_id: recomputed for book_id, recomputed
+                        in self.recomputed.items()
+                        if recomputed > self.forgotten}
+                self.stats['recomputed'] += done
+                self.stats['flushes'] += 1
+            return done
+
+    def stop(self):
+        """Stop the worker and flush what is left."""
+        self.stopping.set()
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def status(self):
+        with self.lock:
+            return {'depth': len(self.dirty | self.deltas.keys()),
+                    **self.stats}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = DirtyBookQueue(
+                interval=getattr(settings, 'BOOK_RATING_INTERVAL', 1.0))
+            atexit.register(_queue.stop)
+        return _queue
+
+
+def current_queue():
+    """The queue if any book was marked in this process, else None."""
+    return _queue
+
+
+def background_mode():
+    return getattr(settings, 'BOOK_RATING_MODE', 'sync') == 'background'
+
+
+def mark_dirty(book_ids):
+    """Have the worker recompute ``book_ids`` once the transaction commits."""
+    book_ids = set(book_ids) - {None}
+    if book_ids:
+        transaction.on_commit(lambda: get_queue().mark(book_ids))
+
+
+def queue_deltas(deltas_by_book):
+    """
+    Have the worker apply ``deltas_by_book`` (Counters by book id) once the
+    transaction commits.
+    """
+    deltas_by_book = {book_id: Counter(deltas)
+                      for book_id, deltas in deltas_by_book.items()
+                      if book_id is not None and any(deltas.values())}
+    if deltas_by_book:
+        queue = get_queue()
+        # Flushes finished by now cannot count this transaction's writes.
+        since = queue.finished
+        transaction.on_commit(lambda: queue.add(deltas_by_book, since))
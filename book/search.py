@@ -0,0 +1,62 @@
+"""
+Indexed full-text search for books.
+
+PostgreSQL keeps a generated ``search_vector`` tsvector column with a GIN
+index, SQLite an FTS5 shadow table kept in sync by triggers (see migration
+0013). Any other backend falls back to DRF's ``icontains`` SearchFilter.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from book.models import Book
+
+FTS_TABLE = 'book_book_fts'
+RANK_FIELD = 'search_rank'
+
+
+def search_tokens(terms):
+    return [token for term in terms for token in re.findall(r'\w+', term)]
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    SearchFilter with the same ``?search=`` parameter that matches every
+    word as a prefix through the full-text index instead of OR-ed
+    ``icontains`` scans, and annotates ``search_rank`` for relevance
+    ordering (see KeysetCursorPagination).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        tokens = search_tokens(self.get_search_terms(request))
+        connection = connections[queryset.db]
+        if not tokens or queryset.model is not Book or \
+                connection.vendor not in ('postgresql', 'sqlite'):
+            return super().filter_queryset(request, queryset, view)
+
+        table = connection.ops.quote_name(Book._meta.db_table)
+        if connection.vendor == 'postgresql':
+            query = ' & '.join(f"'{token}':*" for token in tokens)
+            matches = RawSQL(
+                f"{table}.search_vector @@ to_tsquery('simple', %s)",
+                (query,), output_field=BooleanField())
+            rank = RawSQL(
+                f"ts_rank({table}.search_vector, "
+                f"to_tsquery('simple', %s))::float8",
+                (query,), output_field=FloatField())
+            return queryset.filter(matches).annotate(**{RANK_FIELD: rank})
+
+        # The FTS table is joined: bm25() in a correlated subquery would
+        # re-run the MATCH for every matching book.
+        query = ' AND '.join(f'"{token}"*' for token in tokens)
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[query],
+        )
+        # bm25() is lower for better matches.
+        rank = RawSQL(f'-bm25({FTS_TABLE})', (), output_field=FloatField())
+        return queryset.annotate(**{RANK_FIELD: rank})
@@ -1,19 +1,81 @@
+from functools import lru_cache
+
 from django.contrib.auth.models import User
+from django.db.models import Exists, Manager, OuterRef, Subquery
 from rest_framework import serializers
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ListSerializer, ModelSerializer
 
+from book.metrics import timed
 from book.models import Book, UserBookRelation
 
 
-class BookReaderSerializer(ModelSerializer):
+class TimedDataMixin:
+    """Count the time spent building ``.data`` in the request metrics."""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, ListSerializer):
+    pass
+
+
+class BookReaderSerializer(TimedDataMixin, ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name')
+        list_serializer_class = TimedListSerializer
+
+
+READERS_PREVIEW_SIZE = 5
+MY_RELATION_FIELDS = ('my_like', 'my_bookmark', 'my_rate')
+
 
+def prefetch_readers(books, size=READERS_PREVIEW_SIZE):
+    """
+    Set ``readers_preview`` of the books of ``books`` that have none yet,
+    in one query.
+    """
+    books = [book for book in books if not hasattr(book, 'readers_preview')]
+    if not books:
+        return
+    previews = {book.pk: [] for book in books}
+    relations = UserBookRelation.objects.filter(
+        book__in=previews
+    ).readers_preview(size)
+    for relation in relations:
+        previews[relation.book_id].append(relation)
+    for book in books:
+        book.readers_preview = previews[book.pk]
 
-class BookSerializer(ModelSerializer):
-    annotate_likes = serializers.IntegerField(read_only=True)
+
+class BookListSerializer(TimedListSerializer):
+    def to_representation(self, data):
+        books = list(data.all() if isinstance(data, Manager) else data)
+        prefetch_readers(books)
+        return super().to_representation(books)
+
+
+def my_relation_annotations(user):
+    """
+    Annotations of a Book queryset with the relation of ``user`` to every
+    book, read with index lookups on (user, book) in the same query.
+    """
+    relation = UserBookRelation.objects.filter(user=user, book=OuterRef('pk'))
+    return {
+        'my_like': Exists(relation.filter(like=True)),
+        'my_bookmark': Exists(relation.filter(in_bookmarks=True)),
+        'my_rate': Subquery(relation.values('rate')[:1]),
+    }
+
+
+class BookSerializer(TimedDataMixin, ModelSerializer):
+    annotate_likes = serializers.IntegerField(source='likes_count',
+                                              read_only=True)
     rating = serializers.DecimalField(
+        source='ratings',
         max_digits=3,
         decimal_places=2,
         read_only=True
@@ -21,7 +83,12 @@ class BookSerializer(ModelSerializer):
     owner_name = serializers.CharField(
         read_only=True
     )
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers = serializers.SerializerMethodField()
+    # Only with context['my_relation'], from my_relation_annotations().
+    # A book without them, e.g. a new one, has no relation yet.
+    my_like = serializers.BooleanField(read_only=True, default=False)
+    my_bookmark = serializers.BooleanField(read_only=True, default=False)
+    my_rate = serializers.IntegerField(read_only=True, default=None)
 
     class Meta:
         model = Book
@@ -33,11 +100,110 @@ class BookSerializer(ModelSerializer):
             'annotate_likes',
             'rating',
             'owner_name',
-            'readers'
+            'readers_count',
+            'readers',
+            *MY_RELATION_FIELDS,
         )
+        list_serializer_class = BookListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.context.get('my_relation'):
+            for name in MY_RELATION_FIELDS:
+                del fields[name]
+        return fields
+
+    def get_readers(self, obj):
+        # Filled by BookListSerializer with one query per page.
+        preview = getattr(obj, 'readers_preview', None)
+        if preview is None:
+            preview = UserBookRelation.objects.filter(
+                book=obj
+            ).readers_preview(READERS_PREVIEW_SIZE)
+        return BookReaderSerializer([relation.user for relation in preview],
+                                    many=True).data
+
+
+def _decimal_representation(field):
+    places = -field.decimal_places
+
+    def to_representation(value):
+        # Database decimals usually come with the right number of places
+        # already; only the others need DecimalField's quantize().
+        if value.as_tuple().exponent == places:
+            return '{:f}'.format(value)
+        return field.to_representation(value)
+    return to_representation
+
+
+@lru_cache(maxsize=None)
+def _book_columns(my_relation=False):
+    columns = []
+    serializer = BookSerializer(context={'my_relation': my_relation})
+    for name, field in serializer.fields.items():
+        if name == 'readers':
+            continue
+        if isinstance(field, serializers.DecimalField):
+            to_representation = _decimal_representation(field)
+        else:
+            to_representation = field.to_representation
+        columns.append((name, field.source, to_representation))
+    return tuple(columns)
+
+
+def readers_by_book(book_ids, size=READERS_PREVIEW_SIZE):
+    """BookSerializer's ``readers`` of every book, in one query."""
+    readers = {book_id: [] for book_id in book_ids}
+    rows = UserBookRelation.objects.filter(
+        book__in=readers
+    ).readers_preview(size).values_list(
+        'book_id', 'user__first_name', 'user__last_name')
+    for book_id, first_name, last_name in rows:
+        readers[book_id].append({'first_name': first_name,
+                                 'last_name': last_name})
+    return readers
+
+
+class BookRowsSerializer:
+    """
+    Read-only ``BookSerializer(many=True)`` for ``.values()`` rows of
+    BookViewSet's queryset (with the ``owner_name`` annotation, and those of
+    ``my_relation_annotations`` when ``my_relation`` is set). The output is
+    the same, but it is built column by column from plain dicts, without
+    ModelSerializer's per-instance field dispatch.
+    """
+
+    def __init__(self, rows, my_relation=False):
+        self.rows = rows
+        self.my_relation = my_relation
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            columns = _book_columns(self.my_relation)
+            readers = readers_by_book([row['id'] for row in self.rows])
+            data = []
+            for row in self.rows:
+                item = {}
+                for name, source, to_representation in columns:
+                    value = row[source]
+                    item[name] = (None if value is None
+                                  else to_representation(value))
+                item['readers'] = readers[row['id']]
+                data.append(item)
+            return data
+
+
+class UserBookRelationSerializer(TimedDataMixin, ModelSerializer):
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'like', 'rate', 'in_bookmarks')
+        list_serializer_class = TimedListSerializer
+
 
+class UserBookRelationBulkItemSerializer(ModelSerializer):
+    book = serializers.IntegerField(min_value=1)
 
-class UserBookRelationSerializer(ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'rate', 'in_bookmarks')
@@ -0,0 +1,38 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from book.cache import invalidate_books
+from book.leaderboard import books_changed
+from book.logic import relation_states, remove_counters
+from book.models import Book, UserBookRelation
+
+# No delete receivers on UserBookRelation, so that the relations of a
+# deleted book or user go in one DELETE. UserBookRelation.delete() and its
+# queryset's move the counters, the receivers below those of deleted users.
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    instance._relation_states = relation_states(
+        UserBookRelation.objects.filter(user=instance))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    remove_counters(instance.__dict__.pop('_relation_states', []))
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_books, [instance.pk]))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    # Its rankings went with it, a board may need to be filled again.
+    books_changed([instance.pk])
+
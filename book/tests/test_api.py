@@ -1,20 +1,28 @@
 import json
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import connection
-from django.db.models import Count, Case, When, Avg
+from django.db.models import F
 from django.urls import reverse
 from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APITestCase
 
+from book.bench import seed_books, seed_readers, seed_users
+from book.logic import refresh_counters
 from book.models import Book, UserBookRelation
-from book.serializers import BookSerializer
+from book.serializers import BookSerializer, READERS_PREVIEW_SIZE, \
+    MY_RELATION_FIELDS, my_relation_annotations
+from book.views import BookViewSet
 
 
 class BookApiTestCase(APITestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = User.objects.create(username='test_username', )
         self.book_1 = Book.objects.create(title='Test book 1', price=25,
                                           author_name='Author 1',
@@ -34,65 +42,86 @@ class BookApiTestCase(APITestCase):
             response = self.client.get(url)
             self.assertEqual(2, len(queries))
         books = Book.objects.all().annotate(
-            annotated_likes=Count(
-                Case(When(userbookrelation__like=True, then=1)))
+            owner_name=F('owner__username')
         ).order_by('id')
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
         self.assertEqual(serializer_data[0]['rating'], '5.00')
-        self.assertEqual(serializer_data[0]['annotated_likes'], 1)
+        self.assertEqual(serializer_data[0]['annotate_likes'], 1)
 
     def test_get_item(self):
         books = Book.objects.filter(id=self.book_3.id).annotate(
-            annotate_likes=Count(Case(When(userbookrelation__like=True,
-                                           then=1))),
-
+            owner_name=F('owner__username'),
+            **my_relation_annotations(self.user)
         ).order_by('id').first()
 
         url = reverse('book-detail', args=(self.book_3.pk,))
         self.client.force_login(self.user)
         response = self.client.get(url)
-        serializer_data = BookSerializer(books).data
+        serializer_data = BookSerializer(
+            books, context={'my_relation': True}).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         self.assertEqual(serializer_data, response.data)
 
+    def test_get_my_relation(self):
+        other = User.objects.create(username='test_username2')
+        UserBookRelation.objects.create(user=other, book=self.book_2,
+                                        in_bookmarks=True)
+        url = reverse('book-list')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        # Session and user, then the same two queries as anonymous ones.
+        self.assertEqual(4, len(queries))
+        self.assertEqual([(True, False, 5), (False, False, None),
+                          (False, False, None)],
+                         [tuple(book[name] for name in MY_RELATION_FIELDS)
+                          for book in response.data['results']])
+
+        self.client.force_login(other)
+        response = self.client.get(url)
+        self.assertEqual([False, True, False],
+                         [book['my_bookmark']
+                          for book in response.data['results']])
+
+        self.client.logout()
+        response = self.client.get(url)
+        for name in MY_RELATION_FIELDS:
+            self.assertNotIn(name, response.data['results'][0])
+
     def test_get_filter(self):
         url = reverse('book-list')
         books = Book.objects.filter(
             id__in=[self.book_2.id, self.book_3.id]).annotate(
-            annotated_likes=Count(
-                Case(When(userbookrelation__like=True, then=1)))
+            owner_name=F('owner__username')
         ).order_by('id')
         response = self.client.get(url, data={'price': 55})
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_search(self):
         url = reverse('book-list')
         books = Book.objects.filter(
             id__in=[self.book_1.id, self.book_3.id]).annotate(
-            annotated_likes=Count(
-                Case(When(userbookrelation__like=True, then=1)))
+            owner_name=F('owner__username')
         ).order_by('id')
         response = self.client.get(url, data={'search': 'Author 1'})
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_ordering(self):
         books = Book.objects.filter(
             id__in=[self.book_1.pk, self.book_2.id, self.book_3.id]).annotate(
-            annotate_likes=Count(Case(When(userbookrelation__like=True,
-                                           then=1))),
-
-        ).order_by('-price')
+            owner_name=F('owner__username')
+        ).order_by('-price', '-id')
         url = reverse('book-list')
         response = self.client.get(url, data={'ordering': '-price'})
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_create(self):
         self.assertEqual(3, Book.objects.all().count())
@@ -108,6 +137,7 @@ class BookApiTestCase(APITestCase):
                                     data=json_data,
                                     content_type='application/json')
         self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertFalse(response.data['my_like'])
         self.assertEqual(4, Book.objects.all().count())
         self.assertEqual(self.user, Book.objects.last().owner)
 
@@ -174,8 +204,198 @@ class BookApiTestCase(APITestCase):
         self.assertEqual(575, self.book_1.price)
 
 
+
+class BookPaginationApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        prices = [30, 10, 20, 10, 30, 20, 10]
+        self.books = [
+            Book.objects.create(title=f'Book {number}', price=price,
+                                author_name=f'Author {number % 3}')
+            for number, price in enumerate(prices)
+        ]
+
+    def walk(self, params, link='next'):
+        ids = []
+        response = self.client.get(reverse('book-list'), data=params)
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data[link]:
+                return ids, response
+            response = self.client.get(response.data[link])
+
+    def cursor(self, response, link):
+        return parse_qs(urlparse(response.data[link]).query)['cursor'][0]
+
+    def test_pages_by_id(self):
+        ids, last = self.walk({'page_size': 3})
+        self.assertEqual([book.id for book in self.books], ids)
+
+        previous_ids, _ = self.walk({'page_size': 3,
+                                     'cursor': self.cursor(last, 'previous')},
+                                    link='previous')
+        self.assertEqual([book.id for book in self.books[:6]],
+                         sorted(previous_ids))
+
+    def test_pages_by_price_with_ties(self):
+        for ordering in ('price', '-price', 'author_name'):
+            ids, _ = self.walk({'page_size': 2, 'ordering': ordering})
+            descending = ordering.startswith('-')
+            expected = Book.objects.order_by(
+                ordering, '-id' if descending else 'id'
+            ).values_list('id', flat=True)
+            self.assertEqual(list(expected), ids)
+
+    def test_pages_with_filter(self):
+        ids, _ = self.walk({'page_size': 1, 'price': 10, 'ordering': '-price'})
+        expected = Book.objects.filter(price=10).order_by('-id')
+        self.assertEqual([book.id for book in expected], ids)
+
+    def test_deep_page_queries(self):
+        first = self.client.get(reverse('book-list'), data={'page_size': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, len(queries))
+        sql = queries[0]['sql']
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT', sql)
+
+    def test_keyset_range(self):
+        first = self.client.get(reverse('book-list'),
+                                data={'page_size': 2, 'ordering': '-price'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # The OR of the keyset alone would not bound the index scan.
+        self.assertIn('WHERE ("book_book"."price" <= ', queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('book-list'),
+                                   data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        response = self.client.get(reverse('book-list'),
+                                   data={'page_size': 2})
+        response = self.client.get(response.data['next'] + '&ordering=price')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BookStreamApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username',
+                                        first_name='Reader')
+        self.books = [
+            Book.objects.create(title=f'Book {number}', price=price,
+                                author_name=f'Author {number % 3}')
+            for number, price in enumerate([30, 10, 20, 10, 30, 20, 10])
+        ]
+        UserBookRelation.objects.create(user=self.user, book=self.books[2],
+                                        like=True, rate=4)
+
+    def stream(self, params):
+        response = self.client.get(reverse('book-list'),
+                                   data={'stream': 1, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual('application/json', response['Content-Type'])
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_stream(self):
+        with mock.patch.object(BookViewSet, 'stream_chunk_size', 3):
+            data = self.stream({})
+        expected = BookSerializer(BookViewSet.queryset.all(), many=True).data
+        self.assertEqual(json.loads(json.dumps(expected)), data)
+
+    def test_stream_filter_ordering(self):
+        data = self.stream({'price': 10, 'ordering': '-author_name'})
+        expected = Book.objects.filter(price=10).order_by('-author_name',
+                                                          '-id')
+        self.assertEqual([book.id for book in expected],
+                         [book['id'] for book in data])
+
+    def test_stream_empty(self):
+        self.assertEqual([], self.stream({'price': 1}))
+
+    def test_stream_queries(self):
+        with mock.patch.object(BookViewSet, 'stream_chunk_size', 3):
+            response = self.client.get(reverse('book-list'), {'stream': 1})
+            with CaptureQueriesContext(connection) as queries:
+                b''.join(response.streaming_content)
+        # The books, then the readers of each of the three chunks.
+        self.assertEqual(4, len(queries))
+        self.assertNotIn('X-Cache', response)
+
+    async def test_stream_asgi(self):
+        with mock.patch.object(BookViewSet, 'stream_chunk_size', 3):
+            response = await self.async_client.get(reverse('book-list'),
+                                                   {'stream': 1})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([book.id for book in self.books],
+                         [book['id'] for book in data])
+
+
+class BookReadersApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.book = Book.objects.create(title='Popular book', price=10,
+                                        author_name='Author')
+        self.other_book = Book.objects.create(title='Other book', price=10,
+                                              author_name='Author')
+        self.readers = [
+            User.objects.create(username=f'reader{number}',
+                                first_name=f'Name {number}',
+                                last_name=f'Surname {number}')
+            for number in range(READERS_PREVIEW_SIZE + 3)
+        ]
+        for reader in self.readers:
+            UserBookRelation.objects.create(user=reader, book=self.book)
+        UserBookRelation.objects.create(user=self.readers[0],
+                                        book=self.other_book)
+
+    def names(self, readers):
+        return [{'first_name': reader.first_name,
+                 'last_name': reader.last_name} for reader in readers]
+
+    def test_preview(self):
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('password', queries[1]['sql'])
+        book_data, other_data = response.data['results']
+        self.assertEqual(len(self.readers), book_data['readers_count'])
+        self.assertEqual(self.names(self.readers[:READERS_PREVIEW_SIZE]),
+                         book_data['readers'])
+        self.assertEqual(1, other_data['readers_count'])
+        self.assertEqual(self.names(self.readers[:1]), other_data['readers'])
+
+    def test_readers(self):
+        url = reverse('book-readers', args=(self.book.id,))
+        response = self.client.get(url, data={'page_size': 5})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(self.names(self.readers[:5]),
+                         response.data['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.names(self.readers[5:]),
+                         response.data['results'])
+        self.assertIsNone(response.data['next'])
+
+    def test_readers_not_found(self):
+        for pk in (self.other_book.id + 100, 'abc'):
+            url = reverse('book-readers', args=(pk,))
+            response = self.client.get(url)
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code,
+                             pk)
+
+
 class UserBookRelationApiTestCase(APITestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = User.objects.create(username='Andrey')
         self.user2 = User.objects.create(username='Andrey2')
         self.book1 = Book.objects.create(title='Book 1',
@@ -200,6 +420,8 @@ class UserBookRelationApiTestCase(APITestCase):
         relation = UserBookRelation.objects.get(user=self.user,
                                                 book=self.book1)
         self.assertTrue(relation.like)
+        self.book1.refresh_from_db()
+        self.assertEqual(1, self.book1.likes_count)
 
         data2 = {
             "in_bookmarks": True,
@@ -240,3 +462,313 @@ class UserBookRelationApiTestCase(APITestCase):
         relation = UserBookRelation.objects.get(user=self.user,
                                                 book=self.book1)
         self.assertEqual(relation.rate, None)
+
+    def patch(self, book_id, data, queries):
+        url = reverse('userbookrelation-detail', args=(book_id,))
+        with self.assertNumQueries(queries):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.patch(url, data=json.dumps(data),
+                                         content_type='application/json')
+
+    def test_upsert_queries(self):
+        # Session and user, then inside the savepoint: book and old relation,
+        # the upsert and the counters UPDATE of the book, when they change.
+        # On commit, when ranked counters changed, the leaderboard update:
+        # boards and book, then for a board the book may move on, in a
+        # savepoint, its lock, the book, its rankings and their changes.
+        self.client.force_login(self.user)
+        response = self.patch(self.book1.id, {'like': True}, 15)
+        self.assertEqual({'book': self.book1.id, 'like': True, 'rate': None,
+                          'in_bookmarks': False}, response.data)
+        self.patch(self.book1.id, {'like': True}, 5)
+        response = self.patch(self.book1.id, {'rate': 4}, 14)
+        self.assertEqual({'book': self.book1.id, 'like': True, 'rate': 4,
+                          'in_bookmarks': False}, response.data)
+        self.book1.refresh_from_db()
+        self.assertEqual((1, 1, 1, '4.00'), (
+            self.book1.likes_count, self.book1.readers_count,
+            self.book1.ratings_count, str(self.book1.ratings)))
+
+    def test_upsert_keeps_other_fields(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book1,
+                                        like=True, rate=3)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1,
+                                        rate=5)
+        self.client.force_login(self.user)
+        response = self.patch(self.book1.id, {'in_bookmarks': True}, 7)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        relation = UserBookRelation.objects.get(user=self.user,
+                                                book=self.book1)
+        self.assertEqual((True, True, 3), (relation.like,
+                                           relation.in_bookmarks,
+                                           relation.rate))
+        self.book1.refresh_from_db()
+        self.assertEqual((1, 1, 2, '4.00'), (
+            self.book1.likes_count, self.book1.bookmarks_count,
+            self.book1.readers_count, str(self.book1.ratings)))
+        self.assertEqual(
+            1, UserBookRelation.objects.filter(user=self.user).count())
+
+    def test_upsert_missing_book(self):
+        self.client.force_login(self.user)
+        response = self.patch(self.book2.id + 100, {'like': True}, 5)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+
+class UserBookRelationBulkApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.other = User.objects.create(username='other_username')
+        self.books = [Book.objects.create(title=f'Book {i}', price=10 + i,
+                                          author_name=f'Author {i}')
+                      for i in range(4)]
+        UserBookRelation.objects.create(user=self.user, book=self.books[0],
+                                        like=True, rate=2)
+        UserBookRelation.objects.create(user=self.other, book=self.books[0],
+                                        rate=5)
+        self.url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post(self.url, data=json.dumps(data),
+                                content_type='application/json')
+
+    def test_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([
+                {'book': self.books[0].id, 'like': False, 'rate': 4},
+                {'book': self.books[1].id, 'like': True, 'rate': 3},
+                {'book': self.books[2].id, 'in_bookmarks': True},
+                {'book': self.books[0].id, 'rate': 4},
+            ])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['updated', 'created', 'created', 'unchanged'],
+                         [r['status'] for r in response.data['results']])
+        self.assertEqual({'book': self.books[1].id, 'status': 'created',
+                          'like': True, 'rate': 3, 'in_bookmarks': False},
+                         response.data['results'][1])
+
+        relation = UserBookRelation.objects.get(user=self.user,
+                                                book=self.books[0])
+        self.assertFalse(relation.like)
+        self.assertEqual(4, relation.rate)
+        for book in self.books:
+            book.refresh_from_db()
+        self.assertEqual(0, self.books[0].likes_count)
+        self.assertEqual('4.50', str(self.books[0].ratings))
+        self.assertEqual(1, self.books[1].likes_count)
+        self.assertEqual('3.00', str(self.books[1].ratings))
+        self.assertEqual(1, self.books[2].bookmarks_count)
+        self.assertIsNone(self.books[2].ratings)
+        self.assertEqual(0, self.books[3].readers_count)
+
+    def test_bulk_errors(self):
+        response = self.post([
+            {'book': self.books[1].id, 'rate': 7},
+            {'book': 999999, 'like': True},
+            'garbage',
+            {'book': self.books[3].id, 'like': True},
+        ])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        results = response.data['results']
+        self.assertEqual(['invalid', 'not_found', 'invalid', 'created'],
+                         [r['status'] for r in results])
+        self.assertIn('rate', results[0]['errors'])
+        self.assertFalse(UserBookRelation.objects.filter(
+            book=self.books[1]).exists())
+        self.assertEqual(1, Book.objects.get(pk=self.books[3].id).likes_count)
+
+    def test_bulk_not_a_list(self):
+        response = self.post({'book': self.books[1].id})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_bulk_too_many(self):
+        response = self.post([{'book': self.books[1].id}] * 1001)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_bulk_anonymous(self):
+        self.client.logout()
+        response = self.post([{'book': self.books[1].id, 'like': True}])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_bulk_concurrent_create(self):
+        UserBookRelation.objects.create(user=self.user, book=self.books[1],
+                                        rate=1)
+        select_for_update = UserBookRelation.objects.select_for_update
+        calls = []
+
+        def racing_select_for_update():
+            calls.append(1)
+            relations = select_for_update()
+            if len(calls) == 1:
+                # Another request commits the relation after this read.
+                relations = relations.exclude(book=self.books[1])
+            return relations
+
+        with mock.patch.object(UserBookRelation.objects, 'select_for_update',
+                               racing_select_for_update):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post([
+                    {'book': self.books[1].id, 'like': True, 'rate': 3},
+                    {'book': self.books[2].id, 'like': True},
+                ])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(['updated', 'created'],
+                         [r['status'] for r in response.data['results']])
+        relation = UserBookRelation.objects.get(user=self.user,
+                                                book=self.books[1])
+        self.assertEqual((True, 3), (relation.like, relation.rate))
+        self.books[1].refresh_from_db()
+        self.assertEqual(1, self.books[1].likes_count)
+        self.assertEqual(1, self.books[1].readers_count)
+        self.assertEqual('3.00', str(self.books[1].ratings))
+        self.assertEqual(1, UserBookRelation.objects.filter(
+            book=self.books[2]).count())
+
+    def test_bulk_queries(self):
+        books = [Book.objects.create(title=f'More {i}', price=i,
+                                     author_name='Author')
+                 for i in range(30)]
+        data = [{'book': book.id, 'like': True, 'rate': 1 + i % 5}
+                for i, book in enumerate(books)]
+        data.append({'book': self.books[0].id, 'like': False})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(data)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # session/user, books, relations, insert, update, counters and
+        # the savepoint around them.
+        self.assertLessEqual(len(queries), 9)
+        self.assertEqual(31, UserBookRelation.objects.filter(
+            user=self.user).count())
+        self.assertEqual(1, Book.objects.get(pk=books[7].id).likes_count)
+        self.assertEqual('3.00', str(Book.objects.get(pk=books[7].id).ratings))
+
+
+class MyBooksApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_username')
+        other = User.objects.create(username='test_username2')
+        self.books = [Book.objects.create(title=f'Book {number}', price=10,
+                                          author_name='Author 1')
+                      for number in range(5)]
+        # Related in another order than the books were created.
+        for book, like, in_bookmarks, rate in (
+                (self.books[3], True, False, None),
+                (self.books[0], True, True, 4),
+                (self.books[4], False, True, None),
+                (self.books[1], True, False, 2)):
+            UserBookRelation.objects.create(user=self.user, book=book,
+                                            like=like,
+                                            in_bookmarks=in_bookmarks,
+                                            rate=rate)
+        UserBookRelation.objects.create(user=other, book=self.books[2],
+                                        like=True)
+        self.client.force_login(self.user)
+
+    def walk(self, params):
+        ids = []
+        response = self.client.get(reverse('my-book-list'), data=params)
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_filters(self):
+        book_ids = [book.id for book in self.books]
+        for params, expected in (
+                ({'like': 1}, [1, 0, 3]),
+                ({'bookmarks': 1}, [4, 0]),
+                ({'rated': 1}, [1, 0]),
+                ({'like': 1, 'bookmarks': 1}, [0])):
+            ids, _ = self.walk({**params, 'page_size': 1})
+            self.assertEqual([book_ids[number] for number in expected], ids,
+                             params)
+
+    def test_payload(self):
+        response = self.client.get(reverse('my-book-list'), {'rated': 1})
+        book = response.data['results'][1]
+        self.assertEqual(self.books[0].id, book['id'])
+        self.assertEqual((True, True, 4), (book['my_like'],
+                                           book['my_bookmark'],
+                                           book['my_rate']))
+        self.assertEqual('4.00', book['rating'])
+        self.assertEqual(1, book['readers_count'])
+
+    def test_no_filter(self):
+        response = self.client.get(reverse('my-book-list'), {'like': 0})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(reverse('my-book-list'), {'like': 1})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_queries(self):
+        first = self.client.get(reverse('my-book-list'),
+                                {'like': 1, 'page_size': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first.data['next'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Session, user, the page and its readers.
+        self.assertEqual(4, len(queries))
+
+
+class QueryCountApiTestCase(APITestCase):
+    """Query counts of the book API must not grow with the data (N+1)."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user_ids = seed_users(30)
+        self.client.force_login(User.objects.get(pk=self.user_ids[0]))
+
+    def grow(self, books, readers):
+        first = Book.objects.count()
+        seed_books(books, seed=first, owners=self.user_ids)
+        book_ids = list(Book.objects.order_by('id').values_list(
+            'id', flat=True)[first:])
+        seed_readers(book_ids, self.user_ids, readers, seed=first)
+        refresh_counters()
+        return book_ids
+
+    def count_queries(self, book_id):
+        # Non-empty results and a relation to create, whatever was seeded.
+        book = Book.objects.get(pk=book_id)
+        UserBookRelation.objects.filter(user_id=self.user_ids[0],
+                                        book=book).delete()
+        requests = {
+            'list': lambda: self.client.get(reverse('book-list')),
+            'filter': lambda: self.client.get(reverse('book-list'),
+                                              {'price': book.price}),
+            'search': lambda: self.client.get(reverse('book-list'),
+                                              {'search': book.title}),
+            'ordering': lambda: self.client.get(reverse('book-list'),
+                                                {'ordering': '-price'}),
+            'detail': lambda: self.client.get(
+                reverse('book-detail', args=(book_id,))),
+            'readers': lambda: self.client.get(
+                reverse('book-readers', args=(book_id,))),
+            'relation': lambda: self.client.patch(
+                reverse('userbookrelation-detail', args=(book_id,)),
+                {'like': True}, format='json'),
+            # Liked by the request above.
+            'library': lambda: self.client.get(reverse('my-book-list'),
+                                               {'like': 1}),
+        }
+        counts = {}
+        for name, request in requests.items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            self.assertEqual(status.HTTP_200_OK, response.status_code, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_no_n_plus_one(self):
+        small = self.count_queries(self.grow(3, 1)[0])
+        large = self.count_queries(self.grow(60, 12)[0])
+        self.assertEqual(small, large)
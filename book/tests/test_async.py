@@ -0,0 +1,101 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from book.metrics import SQL_QUERIES
+from book.models import Book, UserBookRelation
+from book.serializers import BookSerializer
+from book.views import BookViewSet
+
+
+class AsyncBookApiTestCase(TransactionTestCase):
+    # The async views query from pool threads, which only see committed rows.
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(title='Test book 1', price=25,
+                                          author_name='Author 1',
+                                          owner=self.user)
+        self.book_2 = Book.objects.create(title='Test book 2', price=55,
+                                          author_name='Author 5')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1,
+                                        like=True, rate=5)
+
+    def expected(self, *books):
+        queryset = BookViewSet.queryset.filter(
+            pk__in=[book.pk for book in books])
+        return json.loads(json.dumps(
+            BookSerializer(queryset, many=True).data))
+
+    async def test_list(self):
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(await self.sync(self.expected, self.book_1,
+                                         self.book_2),
+                         response.json()['results'])
+
+        response = await self.async_client.get(
+            reverse('async-book-list'),
+            # AsyncClient of Django 4.0 sends extras as raw header names.
+            **{'If-None-Match': response['ETag']})
+        self.assertEqual(304, response.status_code)
+
+    async def test_list_search(self):
+        response = await self.async_client.get(reverse('async-book-list'),
+                                               {'price': 55})
+        self.assertEqual(await self.sync(self.expected, self.book_2),
+                         response.json()['results'])
+
+    async def test_detail(self):
+        response = await self.async_client.get(
+            reverse('async-book-detail', args=(self.book_1.id,)))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((await self.sync(self.expected, self.book_1))[0],
+                         response.json())
+
+        response = await self.async_client.get(
+            reverse('async-book-detail', args=(999999,)))
+        self.assertEqual(404, response.status_code)
+
+    async def test_sql_metrics(self):
+        labels = (('view', 'book.async_views.book_list'),)
+
+        def total():
+            return SQL_QUERIES.series.get(labels, [None, 0])[1]
+
+        before = total()
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(200, response.status_code)
+        # Page and readers preview, run by the pool threads.
+        self.assertEqual(2, total() - before)
+
+    async def test_relation(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_1.id,))
+        response = await self.async_client.get(url)
+        self.assertEqual(403, response.status_code)
+
+        await self.sync(self.async_client.force_login, self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual({'book': self.book_1.id, 'like': True, 'rate': 5,
+                          'in_bookmarks': False}, response.json())
+
+        response = await self.async_client.get(
+            reverse('async-userbookrelation-detail', args=(self.book_2.id,)))
+        self.assertEqual({'book': self.book_2.id, 'like': False,
+                          'rate': None, 'in_bookmarks': False},
+                         response.json())
+        self.assertFalse(await self.sync(
+            UserBookRelation.objects.filter(book=self.book_2).exists))
+
+        response = await self.async_client.get(
+            reverse('async-userbookrelation-detail', args=(999999,)))
+        self.assertEqual(404, response.status_code)
+
+    async def sync(self, func, *args):
+        return await sync_to_async(func)(*args)
@@ -0,0 +1,32 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from book.management.commands.bench_api import BUDGETS
+from book.models import Book
+
+
+class BenchApiTestCase(TestCase):
+    # As in settings: the test runner would allow 'testserver' otherwise.
+    @override_settings(ALLOWED_HOSTS=[])
+    def test_smoke(self):
+        with tempfile.TemporaryDirectory() as directory:
+            budgets = os.path.join(directory, 'budgets.json')
+            results = os.path.join(directory, 'results.json')
+            with open(budgets, 'w') as file:
+                # Only the query budgets: timings are noise in tests.
+                json.dump({name: {'p99_ms': 10 ** 6} for name in BUDGETS},
+                          file)
+            stdout = StringIO()
+            call_command('bench_api', books=5, users=3, readers=1, repeat=2,
+                         budgets=budgets, json_output=results,
+                         stdout=stdout)
+            with open(results) as file:
+                measured = json.load(file)
+        self.assertIn('All budgets met', stdout.getvalue())
+        self.assertEqual(set(BUDGETS), set(measured))
+        self.assertEqual(0, Book.objects.count())
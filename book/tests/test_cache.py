@@ -0,0 +1,274 @@
+import json
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book.cache import get_or_build, get_stats
+from book.models import Book, UserBookRelation
+
+
+class BookCacheApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(title='Test book 1', price=25,
+                                          author_name='Author 1',
+                                          owner=self.user)
+        self.book_2 = Book.objects.create(title='Test book 2', price=55,
+                                          author_name='Author 2')
+
+    def test_list_hit(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url)
+        self.assertEqual(0, len(queries))
+        self.assertEqual('HIT', cached['X-Cache'])
+        self.assertEqual(response.content, cached.content)
+
+    def test_normalized_params(self):
+        url = reverse('book-list')
+        self.client.get(url, data={'price': '55', 'search': 'Test  Book'})
+        response = self.client.get(url, data={'search': 'test book',
+                                              'price': '55.00',
+                                              'utm_source': 'mail'})
+        self.assertEqual('HIT', response['X-Cache'])
+        response = self.client.get(url, data={'price': '25'})
+        self.assertEqual('MISS', response['X-Cache'])
+
+    def test_auth_state(self):
+        url = reverse('book-list')
+        self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+
+    def test_per_user(self):
+        url = reverse('book-list')
+        other = User.objects.create(username='test_username2')
+        self.client.force_login(self.user)
+        self.client.get(url)
+        self.assertEqual('HIT', self.client.get(url)['X-Cache'])
+        self.client.force_login(other)
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+
+    @override_settings(BOOK_RATING_MODE='background')
+    def test_relation_write_invalidates_user(self):
+        # Counters, hence books, are not invalidated until the rating queue
+        # gets to them, but the user sees the write right away.
+        list_url = reverse('book-list')
+        self.client.get(list_url)
+        self.client.force_login(self.user)
+        self.client.get(list_url)
+        with mock.patch('book.rating_queue.get_queue'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                data=json.dumps({'in_bookmarks': True}),
+                content_type='application/json')
+
+        response = self.client.get(list_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertTrue(response.data['results'][0]['my_bookmark'])
+        self.client.logout()
+        self.assertEqual('HIT', self.client.get(list_url)['X-Cache'])
+
+    def test_relation_write_invalidates(self):
+        list_url = reverse('book-list')
+        detail_url = reverse('book-detail', args=(self.book_1.id,))
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        for url in (list_url, detail_url, other_url):
+            self.client.get(url)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                data=json.dumps({'like': True}),
+                content_type='application/json')
+        self.client.logout()
+
+        response = self.client.get(list_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(1, response.data['results'][0]['annotate_likes'])
+        response = self.client.get(detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(1, response.data['annotate_likes'])
+        response = self.client.get(other_url)
+        self.assertEqual('HIT', response['X-Cache'])
+
+    def test_book_write_invalidates(self):
+        detail_url = reverse('book-detail', args=(self.book_2.id,))
+        self.client.get(detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_2.title = 'New title'
+            self.book_2.save()
+        response = self.client.get(detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('New title', response.data['title'])
+
+    def test_not_found_not_cached(self):
+        url = reverse('book-detail', args=(self.book_2.id + 100,))
+        self.assertEqual(404, self.client.get(url).status_code)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(1, len(queries))
+
+    def test_stats(self):
+        before = get_stats()
+        url = reverse('book-list')
+        self.client.get(url)
+        self.client.get(url)
+        after = get_stats()
+        self.assertEqual(before.get('miss', 0) + 1, after['miss'])
+        self.assertEqual(before.get('hit', 0) + 1, after['hit'])
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.'
+                                  'FileBasedCache',
+                       'LOCATION': location}
+            with override_settings(CACHES={'default': backend}):
+                url = reverse('book-list')
+                self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+                self.assertEqual('HIT', self.client.get(url)['X-Cache'])
+
+
+class StampedeTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_single_rebuild(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(get_or_build('key', 1, build)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['value'] * 5, [value for value, _ in results])
+        self.assertEqual(1, [outcome for _, outcome in results].count('miss'))
+
+
+class ConditionalGetApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(title='Test book 1', price=25,
+                                          author_name='Author 1')
+        self.book_2 = Book.objects.create(title='Test book 2', price=55,
+                                          author_name='Author 2')
+
+    def test_list_etag(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(1, len(queries))
+        self.assertNotIn('userbookrelation', queries[0]['sql'])
+
+    def test_list_etag_after_delete(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_2.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.book_1.id],
+                         [book['id'] for book in response.data['results']])
+
+    def test_detail_last_modified(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url,
+                                       HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(1, len(queries))
+
+    def test_relation_change_updates_etag(self):
+        list_url = reverse('book-list')
+        detail_url = reverse('book-detail', args=(self.book_1.id,))
+        list_etag = self.client.get(list_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+        other_etag = self.client.get(
+            reverse('book-detail', args=(self.book_2.id,)))['ETag']
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book_1.id,)),
+                data=json.dumps({'rate': 4}),
+                content_type='application/json')
+        self.client.logout()
+
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(200, response.status_code)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('4.00', response.data['rating'])
+        response = self.client.get(
+            reverse('book-detail', args=(self.book_2.id,)),
+            HTTP_IF_NONE_MATCH=other_etag)
+        self.assertEqual(304, response.status_code)
+
+    def test_my_relation_etag(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        etag = self.client.get(url)['ETag']
+        UserBookRelation.objects.create(user=self.user, book=self.book_1,
+                                        in_bookmarks=True)
+        # Same book row: only the relation tells the versions apart.
+        Book.objects.filter(pk=self.book_1.pk).update(
+            updated_at=self.book_1.updated_at)
+
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.data['my_bookmark'])
+
+    def test_deleted_book_updates_etag(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book_2.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.data['results']))
@@ -0,0 +1,270 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+from book.metrics import render
+from drf_practice.db.pool import ConnectionPool, PoolTimeout, close_pools, \
+    pools
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        if self.broken:
+            raise RuntimeError('server closed the connection')
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError('server closed the connection')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            connection = FakeConnection()
+            self.opened.append(connection)
+            return connection
+
+        return ConnectionPool(connect, **kwargs)
+
+    def test_reuse(self):
+        pool = self.make_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(connection, pool.acquire())
+        self.assertEqual(1, len(self.opened))
+        self.assertEqual(1, connection.rollbacks)
+        status = pool.status()
+        self.assertEqual((1, 0, 1, 2), (status['size'], status['idle'],
+                                        status['in_use'], status['checkouts']))
+
+    def test_fill(self):
+        pool = self.make_pool(min_size=2, max_size=3)
+        pool.fill()
+        self.assertEqual(2, len(self.opened))
+        self.assertEqual(2, pool.status()['idle'])
+
+    def test_timeout(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(1, pool.status()['timeouts'])
+
+    def test_wait(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        connection = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, (connection,))
+        timer.start()
+        self.assertIs(connection, pool.acquire())
+        timer.join()
+        status = pool.status()
+        self.assertEqual(1, status['waits'])
+        self.assertGreater(status['wait_seconds'], 0)
+
+    def test_max_lifetime(self):
+        clock = Clock()
+        pool = self.make_pool(max_lifetime=60, clock=clock)
+        old = pool.acquire()
+        pool.release(old)
+        clock.now = 61
+        new = pool.acquire()
+        self.assertIsNot(old, new)
+        self.assertTrue(old.closed)
+        self.assertEqual(1, pool.status()['size'])
+        self.assertEqual(1, pool.status()['expired'])
+
+    def test_health_check(self):
+        clock = Clock()
+        pool = self.make_pool(check_interval=10, clock=clock)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.broken = True
+        # Recently used: not checked.
+        self.assertIs(connection, pool.acquire())
+        connection.broken = False
+        pool.release(connection)
+        connection.broken = True
+        clock.now = 10
+        new = pool.acquire()
+        self.assertIsNot(connection, new)
+        self.assertTrue(connection.closed)
+        self.assertEqual(1, pool.status()['failed_checks'])
+
+    def test_broken_connection_not_reused(self):
+        pool = self.make_pool()
+        connection = pool.acquire()
+        connection.broken = True
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(0, pool.status()['size'])
+
+    def test_discard(self):
+        pool = self.make_pool()
+        connection = pool.acquire()
+        pool.release(connection, discard=True)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(connection, pool.acquire())
+
+    def test_connect_error_frees_slot(self):
+        pool = ConnectionPool(lambda: 1 / 0, max_size=1, timeout=0.01)
+        for _ in range(2):
+            with self.assertRaises(ZeroDivisionError):
+                pool.acquire()
+        self.assertEqual(0, pool.status()['size'])
+
+    def test_close(self):
+        pool = self.make_pool()
+        idle, in_use = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(in_use.closed)
+        pool.release(in_use)
+        self.assertTrue(in_use.closed)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+    def test_threads(self):
+        pool = self.make_pool(max_size=4)
+        lock = threading.Lock()
+        in_use = []
+        peak = []
+
+        def work():
+            for _ in range(50):
+                connection = pool.acquire()
+                with lock:
+                    in_use.append(connection)
+                    peak.append(len(in_use))
+                time.sleep(0.0001)
+                with lock:
+                    in_use.remove(connection)
+                pool.release(connection)
+
+        threads = [threading.Thread(target=work) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(peak), 4)
+        self.assertLessEqual(len(self.opened), 4)
+        self.assertEqual(16 * 50, pool.status()['checkouts'])
+
+
+class PooledBackendTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(close_pools)
+        self.name = os.path.join(directory.name, 'pool.sqlite3')
+
+    def make_handler(self, **pool):
+        return ConnectionHandler({'default': {
+            'ENGINE': 'drf_practice.db.backends.sqlite3',
+            'NAME': self.name,
+            'POOL': {'MAX_SIZE': 2, **pool},
+        }})
+
+    def in_thread(self, func):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(func()))
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def test_connection_returned_and_reused(self):
+        connection = self.make_handler()['default']
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = connection.connection
+        connection.close()
+        [pool] = pools().values()
+        self.assertEqual(1, pool.status()['idle'])
+        connection.ensure_connection()
+        self.assertIs(raw, connection.connection)
+        self.assertEqual(1, pool.status()['opened'])
+        connection.close()
+
+    def test_uncommitted_work_rolled_back(self):
+        connection = self.make_handler()['default']
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        connection.set_autocommit(False)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO item VALUES (1)')
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+            self.assertEqual((0,), cursor.fetchone())
+        self.assertTrue(connection.get_autocommit())
+        connection.close()
+
+    def test_threads_share_pool(self):
+        handler = self.make_handler(MAX_SIZE=1, TIMEOUT=0.01)
+        connection = handler['default']
+        connection.ensure_connection()
+        raw = connection.connection
+
+        def connect():
+            try:
+                handler['default'].ensure_connection()
+            except OperationalError as error:
+                return error
+
+        self.assertIn('No database connection was released',
+                      str(self.in_thread(connect)))
+        connection.close()
+
+        def reuse():
+            other = handler['default']
+            other.ensure_connection()
+            try:
+                return other.connection
+            finally:
+                other.close()
+
+        self.assertIs(raw, self.in_thread(reuse))
+
+    def test_in_memory_not_pooled(self):
+        connection = ConnectionHandler({'default': {
+            'ENGINE': 'drf_practice.db.backends.sqlite3', 'NAME': ':memory:',
+        }})['default']
+        connection.ensure_connection()
+        self.assertIsNone(connection.pool)
+        self.assertEqual({}, pools())
+
+    def test_metrics(self):
+        connection = self.make_handler()['default']
+        connection.ensure_connection()
+        text = render()
+        self.assertIn('db_pool_connections{alias="default",state="in_use"} 1',
+                      text)
+        self.assertIn('db_pool_checkouts_total{alias="default"} 1', text)
+        connection.close()
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from book.models import Book, UserBookRelation
+
+
+class ExportTestMixin:
+    def create_catalogue(self):
+        self.owner = User.objects.create(username='owner')
+        self.reader = User.objects.create(username='reader')
+        self.book1 = Book.objects.create(title='Book 1', price='10.50',
+                                         author_name='Author, "1"',
+                                         owner=self.owner)
+        self.book2 = Book.objects.create(title='Книга 2', price=20,
+                                         author_name='Автор 2')
+        UserBookRelation.objects.create(user=self.reader, book=self.book1,
+                                        like=True, rate=4)
+        UserBookRelation.objects.create(user=self.owner, book=self.book1,
+                                        in_bookmarks=True, rate=5)
+        UserBookRelation.objects.create(user=self.reader, book=self.book2)
+
+    def snapshot(self):
+        books = list(Book.objects.order_by('id').values_list(
+            'id', 'title', 'price', 'author_name', 'owner__username',
+            'likes_count', 'bookmarks_count', 'readers_count', 'ratings'))
+        relations = list(UserBookRelation.objects.order_by(
+            'book', 'user__username').values_list(
+            'user__username', 'book', 'like', 'in_bookmarks', 'rate'))
+        return books, relations
+
+
+class ExportBooksTestCase(ExportTestMixin, TestCase):
+    def setUp(self) -> None:
+        self.create_catalogue()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def export(self, kind, output_format):
+        stdout = StringIO()
+        call_command('export_books', kind, format=output_format,
+                     batch_size=1, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_ndjson(self):
+        lines = self.export('books', 'ndjson').splitlines()
+        self.assertEqual({
+            'id': self.book1.id, 'title': 'Book 1', 'price': '10.50',
+            'author_name': 'Author, "1"', 'owner': 'owner',
+            'likes_count': 1, 'bookmarks_count': 1, 'readers_count': 2,
+            'ratings_count': 2, 'rating': '4.50',
+        }, json.loads(lines[0]))
+        self.assertEqual(2, len(lines))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(
+            self.export('relations', 'csv'))))
+        self.assertEqual(3, len(rows))
+        self.assertEqual({'user': 'reader', 'book': str(self.book1.id),
+                          'like': 'True', 'in_bookmarks': 'False',
+                          'rate': '4'}, rows[0])
+        self.assertEqual('', rows[2]['rate'])
+
+    def test_bytes_written(self):
+        path = os.path.join(self.directory.name, 'books.csv')
+        stderr = StringIO()
+        call_command('export_books', 'books', format='csv', output=path,
+                     stdout=StringIO(), stderr=stderr)
+        self.assertIn(f': {os.path.getsize(path)} bytes in ',
+                      stderr.getvalue())
+
+    def test_round_trip(self):
+        for output_format in ('ndjson', 'csv'):
+            with self.subTest(output_format):
+                expected = self.snapshot()
+                paths = {}
+                for kind in ('books', 'relations'):
+                    paths[kind] = os.path.join(
+                        self.directory.name, f'{kind}.{output_format}')
+                    with open(paths[kind], 'w', encoding='utf-8') as file:
+                        file.write(self.export(kind, output_format))
+                Book.objects.all().delete()
+                self.assertFalse(UserBookRelation.objects.exists())
+
+                for kind in ('books', 'relations'):
+                    call_command('import_books', paths[kind], kind=kind,
+                                 format='jsonl' if output_format == 'ndjson'
+                                 else 'csv',
+                                 stdout=StringIO(), stderr=StringIO())
+                self.assertEqual(expected, self.snapshot())
+
+
+class ExportApiTestCase(ExportTestMixin, APITestCase):
+    def setUp(self) -> None:
+        self.create_catalogue()
+        self.url = reverse('book-export')
+
+    def test_export(self):
+        self.client.force_login(User.objects.create(username='admin',
+                                                    is_staff=True))
+        response = self.client.get(self.url, {'kind': 'relations',
+                                              'output': 'csv'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual('attachment; filename="relations.csv"',
+                         response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(4, len(content.splitlines()))
+
+    async def test_export_asgi(self):
+        admin = await sync_to_async(User.objects.create)(username='admin',
+                                                         is_staff=True)
+        await sync_to_async(self.async_client.force_login)(admin)
+        response = await self.async_client.get(
+            self.url, {'kind': 'relations', 'output': 'csv'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(4, len(content.splitlines()))
+
+    def test_export_invalid(self):
+        self.client.force_login(User.objects.create(username='admin',
+                                                    is_staff=True))
+        response = self.client.get(self.url, {'kind': 'users'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_export_not_admin(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
@@ -0,0 +1,119 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from book.management.commands.import_books import Command
+from book.models import Book
+
+
+class ImportBooksTestCase(TestCase):
+    def setUp(self) -> None:
+        self.owner = User.objects.create(username='publisher')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', path, stdout=stdout, stderr=stderr,
+                     **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv(self):
+        path = self.write('books.csv',
+                          'title,price,author_name,owner,likes\n'
+                          'Book 1,10.50,Author 1,publisher,100\n'
+                          'Книга 2,20,Автор 2,,\n')
+        stdout, stderr = self.run_import(path, batch_size=1)
+        self.assertIn('Imported 2 book(s)', stdout)
+        self.assertEqual('', stderr)
+        books = Book.objects.order_by('id')
+        self.assertEqual(
+            [('Book 1', '10.50', 'Author 1', self.owner.id, 0),
+             ('Книга 2', '20.00', 'Автор 2', None, 0)],
+            [(book.title, str(book.price), book.author_name, book.owner_id,
+              book.likes_count) for book in books])
+        self.assertFalse(os.path.exists(f'{path}.import-state'))
+
+    def test_jsonl_invalid_rows(self):
+        path = self.write('books.jsonl', '\n'.join([
+            json.dumps({'title': 'Book 1', 'price': '1', 'author_name': 'A'}),
+            json.dumps({'title': '', 'price': '1', 'author_name': 'A'}),
+            json.dumps({'title': 'Book 3', 'price': 'x', 'author_name': 'A'}),
+            json.dumps({'title': 'Book 4', 'price': '1', 'author_name': 'A',
+                        'owner': 'nobody'}),
+            '[1, 2]',
+            '{broken',
+            json.dumps({'title': 'Book 7', 'price': '7', 'author_name': 'A',
+                        'owner': 'publisher'}),
+        ]))
+        stdout, stderr = self.run_import(path)
+        self.assertIn('Imported 2 book(s), skipped 5 invalid row(s)', stdout)
+        for row in ('row 2:', 'row 3:', "row 4: unknown owner 'nobody'",
+                    'row 5:', 'row 6:'):
+            self.assertIn(row, stderr)
+        self.assertEqual(['Book 1', 'Book 7'], list(
+            Book.objects.order_by('id').values_list('title', flat=True)))
+
+    def test_keeps_ids(self):
+        path = self.write('books.jsonl', '\n'.join(
+            json.dumps({'id': pk, 'title': f'Book {pk}', 'price': '1',
+                        'author_name': 'A'}) for pk in (50, 70)))
+        self.run_import(path)
+        self.run_import(path)
+        self.assertEqual([50, 70], list(
+            Book.objects.order_by('id').values_list('id', flat=True)))
+        self.assertGreater(
+            Book.objects.create(title='New', price=1, author_name='A').id, 70)
+
+    def test_resume(self):
+        path = self.write('books.csv',
+                          'title,price,author_name\n' +
+                          ''.join(f'Book {i},{i},A\n' for i in range(5)))
+        with open(f'{path}.import-state', 'w') as file:
+            json.dump({'source': os.path.abspath(path), 'rows': 3}, file)
+        stdout, _ = self.run_import(path, batch_size=1)
+        self.assertIn('Resuming after 3 row(s)', stdout)
+        self.assertEqual(['Book 3', 'Book 4'], list(
+            Book.objects.order_by('id').values_list('title', flat=True)))
+        self.assertFalse(os.path.exists(f'{path}.import-state'))
+
+    def test_state_of_another_file(self):
+        path = self.write('books.csv', 'title,price,author_name\n')
+        with open(f'{path}.import-state', 'w') as file:
+            json.dump({'source': '/elsewhere.csv', 'rows': 3}, file)
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.run_import(self.write('books.txt', ''))
+
+    def test_copy_payload(self):
+        books = [Book(title='Book, "1"', price='10.50', author_name='',
+                      owner=self.owner),
+                 Book(title='Book 2', price=3, author_name='Author 2')]
+        sql, buffer = Command().copy_payload(books)
+        self.assertIn('FORMAT csv, FORCE_NULL ("owner_id", "ratings")', sql)
+        columns = sql[sql.index('(') + 1:sql.index(')')].replace(
+            '"', '').split(', ')
+        rows = [dict(zip(columns, row)) for row in csv.reader(buffer)]
+        self.assertEqual(2, len(rows))
+        self.assertEqual(('Book, "1"', '', '10.50', str(self.owner.pk)),
+                         (rows[0]['title'], rows[0]['author_name'],
+                          rows[0]['price'], rows[0]['owner_id']))
+        # Quoted empty cells: NULL only in the FORCE_NULL columns.
+        self.assertEqual(('', ''), (rows[1]['owner_id'], rows[1]['ratings']))
+        self.assertEqual('0', rows[1]['likes_count'])
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.db import connection, IntegrityError
+from django.db.models import F
+from django.test import TestCase
+
+from book.models import Book, UserBookRelation
+from book.serializers import READERS_PREVIEW_SIZE
+from book.views import BookViewSet
+
+# SQLite names the index of a table level UNIQUE constraint itself.
+UNIQUE_RELATION_INDEXES = ('relation_user_book_uniq',
+                           'sqlite_autoindex_book_userbookrelation_1')
+
+
+class IndexUsageTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='user1')
+        self.book = Book.objects.create(title='Test book 1', price=55,
+                                        author_name='Author 1')
+        UserBookRelation.objects.create(user=self.user, book=self.book,
+                                        like=True)
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheaper to scan sequentially.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names),
+                        f'None of {index_names} in plan:\n{plan}')
+
+    def test_price_filter(self):
+        books = BookViewSet.queryset.filter(price=55).order_by('price', 'id')
+        self.assertUsesIndex(books[:21], 'book_price_id_idx')
+
+    def test_ordering(self):
+        books = BookViewSet.queryset
+        self.assertUsesIndex(books.order_by('-price', '-id')[:21],
+                             'book_price_id_idx')
+        self.assertUsesIndex(books.order_by('author_name', 'id')[:21],
+                             'book_author_id_idx')
+
+    def test_relation_lookup(self):
+        relations = UserBookRelation.objects.filter(user=self.user,
+                                                    book=self.book)
+        self.assertUsesIndex(relations, *UNIQUE_RELATION_INDEXES)
+
+    def test_likes_by_book(self):
+        relations = UserBookRelation.objects.filter(book=self.book, like=True)
+        self.assertUsesIndex(relations, 'relation_book_like_idx')
+
+    def test_library(self):
+        for lookup, value, index_name in (
+                ('like', True, 'relation_user_like_idx'),
+                ('in_bookmarks', True, 'relation_user_bookmark_idx'),
+                ('rate__isnull', False, 'relation_user_rated_idx')):
+            books = Book.objects.filter(**{
+                'userbookrelation__user': self.user,
+                f'userbookrelation__{lookup}': value,
+            }).annotate(relation_id=F('userbookrelation__id'))
+            self.assertUsesIndex(
+                books.filter(relation_id__lt=100).order_by('-relation_id')[:21],
+                index_name)
+
+    def test_top_books(self):
+        books = Book.objects.filter(rankings__board='likes').annotate(
+            rank_score=F('rankings__score')).order_by('-rank_score', 'id')
+        self.assertUsesIndex(books[:20], 'ranking_board_score_idx')
+
+    def test_readers(self):
+        relations = UserBookRelation.objects.filter(book=self.book)
+        self.assertUsesIndex(relations.order_by('id')[:50],
+                             'relation_book_id_idx')
+        self.assertUsesIndex(
+            relations.readers_preview(READERS_PREVIEW_SIZE),
+            'relation_book_id_idx')
+
+
+class UniqueRelationTestCase(TestCase):
+    def test_duplicate(self):
+        user = User.objects.create(username='user1')
+        book = Book.objects.create(title='Test book 1', price=55,
+                                   author_name='Author 1')
+        UserBookRelation.objects.create(user=user, book=book)
+        with self.assertRaises(IntegrityError):
+            UserBookRelation.objects.create(user=user, book=book)
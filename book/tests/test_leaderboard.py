@@ -0,0 +1,172 @@
+import random
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book.leaderboard import SCORE_FIELDS, PendingUpdate, eligible, \
+    rebuild_leaderboards, top_books, update_leaderboards
+from book.models import Book, BookRanking, Leaderboard, UserBookRelation
+
+
+@override_settings(BOOK_TOP_SIZE=3, BOOK_TOP_CAPACITY=4, BOOK_TOP_MIN_VOTES=2)
+class LeaderboardTestCase(TestCase):
+    def setUp(self) -> None:
+        self.users = [User.objects.create(username=f'user{i}')
+                      for i in range(4)]
+        self.books = [Book.objects.create(title=f'Book {i}', price=10,
+                                          author_name='Author 1')
+                      for i in range(8)]
+
+    def relate(self, user, book, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            relation, _ = UserBookRelation.objects.get_or_create(user=user,
+                                                                 book=book)
+            for name, value in fields.items():
+                setattr(relation, name, value)
+            relation.save()
+
+    def expected(self, board):
+        field = SCORE_FIELDS[board]
+        return list(Book.objects.filter(eligible(board)).order_by(
+            f'-{field}', 'id').values_list('id', flat=True)[:3])
+
+    def ranked(self, board):
+        return [row['id'] for row in top_books(board, 3)]
+
+    def test_likes(self):
+        for book, likes in zip(self.books, (1, 3, 0, 2)):
+            for user in self.users[:likes]:
+                self.relate(user, book, like=True)
+        self.assertEqual([self.books[1].id, self.books[3].id,
+                          self.books[0].id], self.ranked('likes'))
+
+    def test_rating_min_votes(self):
+        self.relate(self.users[0], self.books[0], rate=5)
+        self.relate(self.users[0], self.books[1], rate=3)
+        self.relate(self.users[1], self.books[1], rate=4)
+        self.assertEqual([self.books[1].id], self.ranked('rating'))
+        self.relate(self.users[1], self.books[0], rate=4)
+        self.assertEqual([self.books[0].id, self.books[1].id],
+                         self.ranked('rating'))
+
+    def test_matches_rebuild(self):
+        rebuild_leaderboards()
+        generator = random.Random(25)
+        for _ in range(150):
+            self.relate(generator.choice(self.users),
+                        generator.choice(self.books),
+                        like=generator.random() < 0.6,
+                        rate=generator.choice((None, 1, 3, 5)))
+            for board in SCORE_FIELDS:
+                self.assertEqual(self.expected(board), self.ranked(board))
+            self.assertLessEqual(BookRanking.objects.count(), 8)
+
+    def test_deleted_book(self):
+        for book in self.books[:5]:
+            self.relate(self.users[0], book, like=True)
+        self.assertEqual(4, BookRanking.objects.filter(board='likes').count())
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(pk__in=[book.id for book in self.books[:2]]
+                                ).delete()
+        self.assertEqual(self.expected('likes'), self.ranked('likes'))
+        self.assertEqual(3, len(self.ranked('likes')))
+
+    def test_deleted_unranked_book(self):
+        for book in self.books[:5]:
+            self.relate(self.users[0], book, like=True)
+        book_id = self.books[7].id
+        self.books[7].delete()
+        # The likes board is still full: nothing to lock.
+        with CaptureQueriesContext(connection) as queries:
+            update_leaderboards([book_id])
+        self.assertEqual(3, len(queries))
+
+    def test_one_update_per_transaction(self):
+        book_ids = {book.id for book in self.books[:3]} | {self.books[4].id}
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for book in self.books[:3]:
+                    UserBookRelation.objects.create(user=self.users[0],
+                                                    book=book, like=True)
+                self.books[4].delete()
+        updates = [callback for callback in callbacks
+                   if isinstance(callback, PendingUpdate)]
+        self.assertEqual(1, len(updates))
+        self.assertEqual(book_ids, updates[0].book_ids)
+
+    def test_unchanged_boards_not_locked(self):
+        for book in self.books[:5]:
+            self.relate(self.users[0], book, like=True)
+        self.relate(self.users[1], self.books[0], like=True)
+        # Below the floor of the full likes board, not rated.
+        with CaptureQueriesContext(connection) as queries:
+            update_leaderboards([self.books[6].id])
+        self.assertEqual(2, len(queries))
+
+    def test_boards_created(self):
+        self.assertEqual(set(SCORE_FIELDS), set(
+            Leaderboard.objects.values_list('name', flat=True)))
+
+    def test_missing_board(self):
+        self.relate(self.users[0], self.books[0], like=True)
+        Leaderboard.objects.all().delete()
+        BookRanking.objects.all().delete()
+        # Reads do not build the board, the next update does.
+        self.assertEqual([], self.ranked('likes'))
+        self.assertFalse(Leaderboard.objects.exists())
+        self.relate(self.users[1], self.books[1], like=True)
+        self.assertEqual([self.books[0].id, self.books[1].id],
+                         self.ranked('likes'))
+
+    def test_recent(self):
+        self.relate(self.users[0], self.books[2], in_bookmarks=True)
+        self.assertEqual(self.books[2].id, self.ranked('recent')[0])
+
+    def test_command(self):
+        self.relate(self.users[0], self.books[0], like=True)
+        BookRanking.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn('likes: 1 book(s)', out.getvalue())
+        self.assertEqual([self.books[0].id], self.ranked('likes'))
+
+
+class TopBooksApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_username')
+        self.books = [Book.objects.create(title=f'Book {i}', price=10,
+                                          author_name='Author 1')
+                      for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(user=self.user,
+                                            book=self.books[1], like=True)
+
+    def test_top(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-top'))
+        self.assertEqual(200, response.status_code)
+        # Session, user, the board and its readers.
+        self.assertEqual(4, len(queries))
+        self.assertEqual([self.books[1].id],
+                         [book['id'] for book in response.data])
+        self.assertEqual(1, response.data[0]['annotate_likes'])
+        self.assertTrue(response.data[0]['my_like'])
+
+    def test_recent_limit(self):
+        response = self.client.get(reverse('book-top'),
+                                   {'board': 'recent', 'limit': 2})
+        self.assertEqual([self.books[1].id, self.books[2].id],
+                         [book['id'] for book in response.data])
+        self.assertNotIn('my_like', response.data[0])
+
+    def test_invalid(self):
+        for params in ({'board': 'price'}, {'limit': 'all'}, {'limit': 0}):
+            response = self.client.get(reverse('book-top'), params)
+            self.assertEqual(400, response.status_code, params)
@@ -1,33 +1,178 @@
+from threading import Barrier, Thread
+from unittest import skipUnless
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
-from book.logic import set_rating
+from book.logic import refresh_counters, upsert_relation
 from book.models import UserBookRelation, Book
 
 
-class SetRatingTestCase(TestCase):
+class CountersTestCase(TestCase):
     def setUp(self) -> None:
-        user1 = User.objects.create(
-            username='user1',
-            first_name='Ivan',
-            last_name='Petrov'
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.book_1 = Book.objects.create(title='Test book 1', price=25,
+                                          author_name='Author 1')
+        self.book_2 = Book.objects.create(title='Test book 2', price=55,
+                                          author_name='Author 2')
+        self.relation = UserBookRelation.objects.create(
+            user=self.user1, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1,
+                                        in_bookmarks=True)
+
+    def assertCounters(self, book, likes, bookmarks, readers, ratings):
+        book.refresh_from_db()
+        self.assertEqual(
+            (likes, bookmarks, readers, ratings),
+            (book.likes_count, book.bookmarks_count, book.readers_count,
+             book.ratings_count)
         )
-        user2 = User.objects.create(username='user2',
-                                    first_name='Ivan', last_name='Sidorov')
-        user3 = User.objects.create(username='user3',
-                                    first_name='1', last_name='2')
 
-        self.book_1 = Book.objects.create(title='Test book 1', price=25,
-                                          author_name='Author 1', owner=user1)
+    def test_create(self):
+        self.assertCounters(self.book_1, 1, 1, 2, 1)
+        self.assertCounters(self.book_2, 0, 0, 0, 0)
 
-        UserBookRelation.objects.create(user=user1, book=self.book_1, like=True,
-                                        rate=5)
-        UserBookRelation.objects.create(user=user2, book=self.book_1, like=True,
+    def test_update(self):
+        self.relation.like = False
+        self.relation.in_bookmarks = True
+        self.relation.save()
+        self.assertCounters(self.book_1, 0, 2, 2, 1)
+
+    def test_move_to_other_book(self):
+        self.relation.book = self.book_2
+        self.relation.save()
+        self.assertCounters(self.book_1, 0, 1, 1, 0)
+        self.assertCounters(self.book_2, 1, 0, 1, 1)
+
+    def test_deferred_fields(self):
+        relation = UserBookRelation.objects.only('id', 'book').get(
+            pk=self.relation.pk)
+        relation.like = False
+        relation.save()
+        self.assertCounters(self.book_1, 0, 1, 2, 1)
+
+    def test_delete(self):
+        UserBookRelation.objects.filter(user=self.user2).delete()
+        self.assertCounters(self.book_1, 1, 0, 1, 1)
+        self.relation.delete()
+        self.assertCounters(self.book_1, 0, 0, 0, 0)
+
+    def test_delete_user(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book_2,
+                                        like=True)
+        self.user1.delete()
+        self.assertCounters(self.book_1, 0, 1, 1, 0)
+        self.assertCounters(self.book_2, 0, 0, 0, 0)
+
+    def test_delete_book_queries(self):
+        for number in range(5):
+            user = User.objects.create(username=f'reader{number}')
+            UserBookRelation.objects.create(user=user, book=self.book_1,
+                                            like=True)
+        book_id = self.book_1.pk
+        # The relations and rankings of the book, then the book, whatever
+        # the number of relations.
+        with self.assertNumQueries(3):
+            self.book_1.delete()
+        self.assertFalse(UserBookRelation.objects.filter(
+            book=book_id).exists())
+
+    def test_book_save_keeps_counters(self):
+        stale_book = Book.objects.get(pk=self.book_2.pk)
+        UserBookRelation.objects.create(user=self.user1, book=self.book_2,
+                                        like=True)
+        stale_book.price = 60
+        stale_book.save()
+        self.assertCounters(self.book_2, 1, 0, 1, 0)
+
+    def test_refresh_counters(self):
+        Book.objects.update(likes_count=10, readers_count=10, ratings=None)
+        self.assertEqual(2, refresh_counters())
+        self.assertCounters(self.book_1, 1, 1, 2, 1)
+        self.assertCounters(self.book_2, 0, 0, 0, 0)
+        self.assertEqual('5.00', str(self.book_1.ratings))
+
+
+class IncrementalRatingTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+        self.book_1 = Book.objects.create(title='Test book 1', price=25,
+                                          author_name='Author 1')
+        self.relation = UserBookRelation.objects.create(
+            user=self.user1, book=self.book_1, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1,
                                         rate=5)
-        UserBookRelation.objects.create(user=user3, book=self.book_1, like=True,
+        UserBookRelation.objects.create(user=self.user3, book=self.book_1,
                                         rate=4)
 
-    def test_ok(self):
-        set_rating(self.book_1)
+    def test_running_average(self):
         self.book_1.refresh_from_db()
+        self.assertEqual(14, self.book_1.rating_sum)
+        self.assertEqual(3, self.book_1.ratings_count)
         self.assertEqual('4.67', str(self.book_1.ratings))
+
+    def test_rate_changed(self):
+        self.relation.rate = 2
+        self.relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual('3.67', str(self.book_1.ratings))
+
+        self.relation.rate = None
+        self.relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual('4.50', str(self.book_1.ratings))
+
+    def test_last_rate_removed(self):
+        UserBookRelation.objects.all().delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(0, self.book_1.rating_sum)
+        self.assertIsNone(self.book_1.ratings)
+
+    def test_rate_not_changed(self):
+        self.relation.like = True
+        with CaptureQueriesContext(connection) as queries:
+            self.relation.save()
+        self.assertEqual(2, len(queries))
+        self.assertNotIn('ratings', queries[-1]['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.relation.save()
+        self.assertEqual(1, len(queries))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'row locks need PostgreSQL')
+class ConcurrentUpsertTestCase(TransactionTestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='user1')
+        self.book = Book.objects.create(title='Test book 1', price=25,
+                                        author_name='Author 1')
+
+    def upsert_concurrently(self, fields, threads=8):
+        barrier = Barrier(threads)
+
+        def upsert():
+            try:
+                barrier.wait()
+                upsert_relation(self.user, self.book.id, fields)
+            finally:
+                connections.close_all()
+
+        workers = [Thread(target=upsert) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def test_same_relation(self):
+        self.upsert_concurrently({'like': True, 'rate': 4})
+        self.upsert_concurrently({'like': False})
+        self.book.refresh_from_db()
+        self.assertEqual(1, UserBookRelation.objects.count())
+        self.assertEqual(0, self.book.likes_count)
+        self.assertEqual(1, self.book.ratings_count)
+        self.assertEqual(4, self.book.rating_sum)
@@ -0,0 +1,129 @@
+import json
+import re
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book.metrics import SQL_QUERIES, Counter, Histogram
+from book.models import Book
+from drf_practice.settings import base
+
+
+class HistogramTestCase(TestCase):
+    def test_render(self):
+        histogram = Histogram('test_seconds', 'Test.', (0.1, 1))
+        labels = (('view', 'a"b'),)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(labels, value)
+        self.assertEqual([
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 3.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ], histogram.render())
+
+    def test_counter(self):
+        counter = Counter('test_total', 'Test.')
+        counter.inc((('status', 200),))
+        counter.inc((('status', 200),), 2)
+        self.assertEqual('test_total{status="200"} 3', counter.render()[-1])
+
+
+@override_settings(BOOK_METRICS_TOKEN='scraper-token')
+class MetricsApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.book = Book.objects.create(title='Book', price=10,
+                                        author_name='Author')
+
+    def sample(self, text, name, **labels):
+        selector = ','.join(f'{key}="{value}"' for key, value in
+                            labels.items())
+        match = re.search(rf'^{name}{{{re.escape(selector)}}} (\S+)$', text,
+                          re.MULTILINE)
+        return float(match.group(1)) if match else 0
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_views(self):
+        before = self.scrape()
+        self.client.get(reverse('book-list'))
+        self.client.force_login(self.user)
+        self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book.id,)),
+            json.dumps({'like': True}), content_type='application/json')
+        after = self.scrape()
+
+        def delta(name, **labels):
+            return (self.sample(after, name, **labels)
+                    - self.sample(before, name, **labels))
+
+        self.assertEqual(1, delta('http_requests_total',
+                                  view='BookViewSet.list', status=200))
+        self.assertEqual(1, delta('http_requests_total',
+                                  view='UserBookRelationView.partial_update',
+                                  status=200))
+        list_view = {'view': 'BookViewSet.list'}
+        # Page and readers preview.
+        self.assertEqual(2, delta('http_request_sql_queries_sum',
+                                  **list_view))
+        for name in ('http_request_sql_seconds_sum',
+                     'http_request_serializer_seconds_sum',
+                     'http_request_render_seconds_sum',
+                     'http_response_size_bytes_sum'):
+            self.assertGreater(delta(name, **list_view), 0, name)
+        self.assertEqual(1, delta('book_cache_requests_total',
+                                  outcome='miss'))
+
+    async def test_asgi(self):
+        labels = (('view', 'BookViewSet.list'),)
+
+        def total():
+            return SQL_QUERIES.series.get(labels, [None, 0])[1]
+
+        before = total()
+        response = await self.async_client.get(reverse('book-list'))
+        self.assertEqual(200, response.status_code)
+        # Page and readers preview, run in the thread of the sync view.
+        self.assertEqual(2, total() - before)
+
+    def test_access(self):
+        url = reverse('metrics')
+        self.assertEqual(403, self.client.get(url).status_code)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(403, response.status_code)
+        self.client.force_login(self.user)
+        self.assertEqual(403, self.client.get(url).status_code)
+
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(200, self.client.get(url).status_code)
+
+    @override_settings(BOOK_METRICS_TOKEN='')
+    def test_no_token(self):
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(403, response.status_code)
+
+
+class AsgiMiddlewareTestCase(TestCase):
+    @override_settings(DEBUG=True, MIDDLEWARE=base.MIDDLEWARE)
+    def test_not_adapted(self):
+        with mock.patch('django.core.handlers.base.logger') as logger:
+            ASGIHandler()
+        self.assertEqual([], [call.args for call in logger.debug.call_args_list
+                              if 'adapted' in call.args[0]])
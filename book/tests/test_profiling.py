@@ -0,0 +1,117 @@
+import os
+import pstats
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book.models import Book
+from book.profiling import list_profiles, make_token, profile_file
+
+
+class ProfilingApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(BOOK_PROFILE_DIR=directory.name,
+                                     BOOK_PROFILE_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        Book.objects.create(title='Test book', price=25,
+                            author_name='Author 1')
+
+    def get_list(self, **headers):
+        return self.client.get(reverse('book-list'), **headers)
+
+    def test_token(self):
+        response = self.get_list(HTTP_X_PROFILE=make_token())
+        self.assertEqual(200, response.status_code)
+        [profile] = list_profiles()
+        self.assertEqual('BookViewSet.list', profile['view'])
+        self.assertEqual(200, profile['status'])
+        self.assertEqual('sampler', profile['mode'])
+        self.assertGreater(profile['queries'], 0)
+        with open(profile_file(profile['id'], 'sql')) as file:
+            self.assertIn('book_book', file.read())
+        self.assertIsNotNone(profile_file(profile['id'], 'collapsed'))
+
+    def test_no_or_invalid_token(self):
+        self.get_list()
+        self.get_list(HTTP_X_PROFILE='profile:forged:signature')
+        self.assertEqual([], list_profiles())
+
+    def test_sample_rate(self):
+        with self.settings(BOOK_PROFILE_SAMPLE_RATE=1):
+            self.get_list()
+        self.assertEqual(1, len(list_profiles()))
+
+    @override_settings(BOOK_PROFILE_MODE='cprofile')
+    def test_cprofile(self):
+        self.get_list(HTTP_X_PROFILE=make_token())
+        [profile] = list_profiles()
+        stats = pstats.Stats(profile_file(profile['id'], 'pstats'))
+        self.assertGreater(stats.total_calls, 0)
+        self.assertEqual(profile_file(profile['id'], 'pstats'),
+                         profile_file(profile['id']))
+
+    @override_settings(BOOK_PROFILE_KEEP=2, BOOK_PROFILE_SAMPLE_RATE=1)
+    def test_keep_newest(self):
+        for _ in range(4):
+            self.get_list()
+        profiles = list_profiles()
+        self.assertEqual(2, len(profiles))
+        self.assertGreaterEqual(profiles[0]['id'], profiles[1]['id'])
+
+    def test_save_failure(self):
+        # BOOK_PROFILE_DIR cannot be created below a file.
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        with self.settings(BOOK_PROFILE_DIR=os.path.join(blocker, 'profiles')):
+            with self.assertLogs('book.profiling', 'ERROR'):
+                response = self.get_list(HTTP_X_PROFILE=make_token())
+        self.assertEqual(200, response.status_code)
+
+    def test_admin_views(self):
+        self.get_list(HTTP_X_PROFILE=make_token())
+        [profile] = list_profiles()
+        self.client.force_login(self.admin)
+
+        response = self.client.get(reverse('profile-list'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([profile['id']],
+                         [item['id'] for item in response.data])
+
+        url = reverse('profile-download', args=(profile['id'],))
+        # The sampler's stacks by default.
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('stacks.collapsed', response['Content-Disposition'])
+        response.close()
+        response = self.client.get(url, {'file': 'sql'})
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'book_book', b''.join(response.streaming_content))
+        response.close()
+        self.assertEqual(404, self.client.get(
+            url, {'file': 'pstats'}).status_code)
+        self.assertEqual(404, self.client.get(
+            url, {'file': '../../etc'}).status_code)
+
+    def test_admin_views_forbidden(self):
+        self.get_list(HTTP_X_PROFILE=make_token())
+        [profile] = list_profiles()
+        self.client.force_login(User.objects.create(username='user'))
+        self.assertEqual(403, self.client.get(
+            reverse('profile-list')).status_code)
+        self.assertEqual(403, self.client.get(reverse(
+            'profile-download', args=(profile['id'],))).status_code)
+
+    def test_profile_dir_not_listed_when_missing(self):
+        with self.settings(BOOK_PROFILE_DIR=os.path.join(
+                tempfile.gettempdir(), 'book-no-such-profiles')):
+            self.assertEqual([], list_profiles())
@@ -0,0 +1,200 @@
+import json
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book import rating_queue
+from book.metrics import render
+from book.models import Book, UserBookRelation
+from book.rating_queue import DirtyBookQueue
+
+
+class DirtyBookQueueTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.batches = []
+        self.queue = DirtyBookQueue(self.batches.append, interval=3600,
+                                    batch_size=2)
+        self.addCleanup(self.queue.stop)
+
+    def test_coalesce(self):
+        self.queue.mark({3, 1})
+        self.queue.mark({1})
+        self.queue.mark({2})
+        self.assertEqual(3, self.queue.depth())
+        self.assertEqual(3, self.queue.flush())
+        self.assertEqual([[1, 2], [3]], self.batches)
+        self.assertEqual(0, self.queue.depth())
+        self.assertEqual(0, self.queue.flush())
+
+    def test_failed_batch_retried(self):
+        def recompute(book_ids):
+            if book_ids == [3]:
+                raise RuntimeError('database is locked')
+            self.batches.append(book_ids)
+
+        self.queue.recompute = recompute
+        self.queue.mark({1, 2, 3})
+        with self.assertLogs('book.rating_queue', 'ERROR'):
+            self.assertEqual(2, self.queue.flush())
+        self.assertEqual(1, self.queue.depth())
+        self.assertEqual(1, self.queue.status()['failures'])
+        self.queue.recompute = self.batches.append
+
+    def test_deltas_summed(self):
+        applied = []
+        self.queue.apply = applied.append
+        self.queue.add({1: Counter(likes_count=1, rating_sum=5)})
+        self.queue.add({1: Counter(likes_count=-1, rating_sum=2),
+                        2: Counter(readers_count=1)})
+        self.queue.add({3: Counter(readers_count=1)})
+        self.assertEqual(3, self.queue.depth())
+        self.assertEqual(3, self.queue.flush())
+        self.assertEqual([{1: Counter(likes_count=0, rating_sum=7),
+                           2: Counter(readers_count=1)},
+                          {3: Counter(readers_count=1)}], applied)
+        self.assertEqual([], self.batches)
+
+    def test_mark_supersedes_deltas(self):
+        applied = []
+        self.queue.apply = applied.append
+        self.queue.add({1: Counter(likes_count=1),
+                        2: Counter(likes_count=1)})
+        self.queue.mark({1})
+        self.assertEqual(2, self.queue.depth())
+        self.assertEqual(2, self.queue.flush())
+        self.assertEqual([{2: Counter(likes_count=1)}], applied)
+        self.assertEqual([[1]], self.batches)
+
+    def test_deltas_after_recompute(self):
+        applied = []
+        self.queue.apply = applied.append
+        since = self.queue.finished
+        self.queue.mark({1})
+        # The recompute may count writes whose deltas come after it.
+        self.assertEqual(1, self.queue.flush())
+        self.queue.add({1: Counter(likes_count=1),
+                        2: Counter(likes_count=1)}, since)
+        self.assertEqual(2, self.queue.flush())
+        self.assertEqual([{2: Counter(likes_count=1)}], applied)
+        self.assertEqual([[1], [1]], self.batches)
+
+        # Too old to tell which books were recomputed since.
+        self.queue.history = 1
+        since = self.queue.finished
+        self.queue.flush()
+        self.queue.flush()
+        self.queue.add({3: Counter(likes_count=1)}, since)
+        self.queue.add({4: Counter(likes_count=1)})
+        self.assertEqual(2, self.queue.flush())
+        self.assertEqual([[1], [1], [3]], self.batches)
+        self.assertEqual({4: Counter(likes_count=1)}, applied[-1])
+
+    def test_failed_deltas_retried(self):
+        def apply(deltas_by_book):
+            raise RuntimeError('database is locked')
+
+        self.queue.apply = apply
+        self.queue.add({1: Counter(likes_count=1)})
+        self.queue.mark({2})
+        with self.assertLogs('book.rating_queue', 'ERROR'):
+            self.assertEqual(0, self.queue.flush())
+        self.queue.add({1: Counter(likes_count=1)})
+        applied = []
+        self.queue.apply = applied.append
+        self.assertEqual(2, self.queue.flush())
+        self.assertEqual([{1: Counter(likes_count=2)}], applied)
+        self.assertEqual([[2]], self.batches)
+
+    def test_stop_flushes(self):
+        self.queue.mark({1})
+        self.queue.stop()
+        self.assertEqual([[1]], self.batches)
+        self.assertFalse(self.queue.thread.is_alive())
+
+    def test_worker(self):
+        self.queue.interval = 0.01
+        self.queue.mark({1})
+        self.queue.thread.join(0.5)
+        self.queue.stop()
+        self.assertEqual([[1]], self.batches)
+
+
+@override_settings(BOOK_RATING_MODE='background')
+class BackgroundRatingApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.queue = DirtyBookQueue(interval=3600)
+        self.addCleanup(self.queue.stopping.set)
+        patcher = mock.patch.object(rating_queue, '_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [User.objects.create(username=f'user{i}')
+                      for i in range(3)]
+        self.book = Book.objects.create(title='Book 1', price=10,
+                                        author_name='Author 1')
+
+    def patch(self, user, data):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book.id,)),
+                json.dumps(data), content_type='application/json')
+        self.assertEqual(200, response.status_code)
+
+    def test_coalesced_recompute(self):
+        for user, rate in zip(self.users, (5, 4, 2)):
+            self.patch(user, {'rate': rate, 'like': True})
+        self.book.refresh_from_db()
+        self.assertEqual((0, None), (self.book.likes_count, self.book.ratings))
+        self.assertEqual(1, self.queue.depth())
+        self.assertIn('book_rating_queue_depth 1', render())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(1, self.queue.flush())
+        self.book.refresh_from_db()
+        self.assertEqual(3, self.book.likes_count)
+        self.assertEqual(3, self.book.ratings_count)
+        self.assertEqual(Decimal('3.67'), self.book.ratings)
+
+    def test_recompute_before_deltas(self):
+        self.queue.mark({self.book.id})
+        self.client.force_login(self.users[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(
+                reverse('userbookrelation-detail', args=(self.book.id,)),
+                json.dumps({'like': True}), content_type='application/json')
+        # The write committed: the recompute counts it, then its deltas come.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.flush()
+        for callback in callbacks:
+            callback()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.flush()
+        self.book.refresh_from_db()
+        self.assertEqual((1, 1), (self.book.likes_count,
+                                  self.book.readers_count))
+
+    def test_delete(self):
+        self.patch(self.users[0], {'rate': 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.filter(book=self.book).delete()
+        self.assertEqual(1, self.queue.depth())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.flush()
+        self.book.refresh_from_db()
+        self.assertEqual((0, None), (self.book.ratings_count,
+                                     self.book.ratings))
+
+    def test_marked_on_commit(self):
+        # The test transaction never commits.
+        UserBookRelation.objects.create(user=self.users[0], book=self.book,
+                                        rate=3)
+        self.assertEqual(0, self.queue.depth())
@@ -0,0 +1,160 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from book.models import Book, UserBookRelation
+from drf_practice.db.routers import PIN_COOKIE, ReplicaRouter, \
+    primary_reads, replica_reads
+
+REPLICA = 'replica'
+NO_CACHE = {'CACHES': {**settings.CACHES, 'bench': {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    'BOOK_CACHE_ALIAS': 'bench'}
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.router = ReplicaRouter()
+
+    def test_outside_of_requests(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        self.assertEqual('default', self.router.db_for_write(Book))
+
+    def test_safe_request(self):
+        with replica_reads():
+            self.assertEqual(REPLICA, self.router.db_for_read(Book))
+            self.assertEqual(REPLICA,
+                             self.router.db_for_read(UserBookRelation))
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_reads_after_write(self):
+        with replica_reads() as state:
+            self.assertEqual('default', self.router.db_for_write(Book))
+            self.assertTrue(state.wrote)
+            self.assertEqual('default', self.router.db_for_read(Book))
+
+    def test_pinned(self):
+        with replica_reads(pinned=True):
+            self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_primary_reads(self):
+        with replica_reads() as state:
+            with primary_reads():
+                self.assertIsNone(self.router.db_for_read(Book))
+            self.assertEqual(REPLICA, self.router.db_for_read(Book))
+            self.assertFalse(state.wrote)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'book'))
+        self.assertIsNone(self.router.allow_migrate('default', 'book'))
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], **NO_CACHE)
+class ReplicaApiTestCase(APITestCase):
+    """
+    Two SQLite databases standing in for a primary and its replica. The
+    replica is added after TestCase wrapped the test databases, so it keeps
+    its own rows.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'],
+            'NAME': 'file:book_replica?mode=memory&cache=shared',
+        }
+        with connections[REPLICA].schema_editor() as editor:
+            for model in (User, Book, UserBookRelation):
+                editor.create_model(model)
+        Book.objects.using(REPLICA).create(title='Replica book', price=25,
+                                           author_name='Author 1')
+
+    @classmethod
+    def tearDownClass(cls):
+        # An in-memory database goes away with its last connection.
+        connections[REPLICA].connection.close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_username')
+        Book.objects.create(title='Primary book', price=25,
+                            author_name='Author 1')
+
+    def titles(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(200, response.status_code)
+        return [book['title'] for book in response.data['results']]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(['Replica book'], self.titles())
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+    def test_pinned_after_write(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('book-list'), json.dumps({
+            'title': 'New book', 'price': '10.00', 'author_name': 'Author 2',
+        }), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual('5', str(response.cookies[PIN_COOKIE]['max-age']))
+        self.assertEqual(['Primary book', 'New book'], self.titles())
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(['Replica book'], self.titles())
+
+    async def test_asgi(self):
+        response = await self.async_client.get(reverse('book-list'))
+        self.assertEqual(['Replica book'], [
+            book['title'] for book in response.json()['results']])
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(reverse('book-list'), {
+            'title': 'New book', 'price': '10.00', 'author_name': 'Author 2',
+        }, content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = await self.async_client.get(reverse('book-list'))
+        self.assertEqual(['Primary book', 'New book'], [
+            book['title'] for book in response.json()['results']])
+
+    def test_reads_after_write_in_same_request(self):
+        with replica_reads() as state:
+            self.assertEqual(['Replica book'], list(
+                Book.objects.values_list('title', flat=True)))
+            Book.objects.create(title='New book', price=10,
+                                author_name='Author 2')
+            self.assertTrue(state.wrote)
+            self.assertEqual(['Primary book', 'New book'], list(
+                Book.objects.order_by('id').values_list('title', flat=True)))
+
+    @override_settings(BOOK_CACHE_ALIAS='default')
+    def test_cached_from_primary_after_write(self):
+        cache.clear()
+        self.assertEqual(['Replica book'], self.titles())
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('book-list'), json.dumps({
+                'title': 'New book', 'price': '10.00',
+                'author_name': 'Author 2',
+            }), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        # Logging out drops the pin cookie too.
+        self.client.logout()
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+        # Another client, not pinned, caches the page of the new version.
+        self.assertEqual(['Primary book', 'New book'], self.titles())
+        self.assertEqual(['Primary book', 'New book'], self.titles())
@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from book.models import Book
+from book.search import FTS_TABLE
+
+
+class BookSearchApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.book_1 = Book.objects.create(title='Python cookbook', price=25,
+                                          author_name='David Beazley')
+        self.book_2 = Book.objects.create(title='Fluent Python', price=55,
+                                          author_name='Luciano Ramalho')
+        self.book_3 = Book.objects.create(title='Война и мир', price=55,
+                                          author_name='Лев Толстой')
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('book-list'),
+                                   data={'search': term, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book['id'] for book in response.data['results']]
+
+    def test_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('python')
+        sql = queries[0]['sql']
+        self.assertNotIn('LIKE', sql)
+        if connection.vendor == 'sqlite':
+            self.assertIn(FTS_TABLE, sql)
+        elif connection.vendor == 'postgresql':
+            self.assertIn('search_vector', sql)
+
+    def test_words_and_prefixes(self):
+        self.assertEqual({self.book_1.id, self.book_2.id},
+                         set(self.search('PYTHON')))
+        self.assertEqual([self.book_2.id], self.search('pyth ramal'))
+        self.assertEqual([self.book_3.id], self.search('толст'))
+        self.assertEqual([], self.search('python tolstoy'))
+
+    def test_ranking(self):
+        book = Book.objects.create(title='Python', price=10,
+                                   author_name='Python Software Foundation')
+        self.assertEqual(book.id, self.search('python')[0])
+        self.assertEqual([self.book_2.id, self.book_1.id, book.id],
+                         self.search('python', ordering='-price'))
+
+    def test_paginated_by_rank(self):
+        books = [Book.objects.create(title='Python ' * number, price=number,
+                                     author_name='Author')
+                 for number in range(1, 6)]
+        expected = self.search('python', page_size=20)
+        ids = []
+        response = self.client.get(reverse('book-list'),
+                                   data={'search': 'python', 'page_size': 2})
+        while True:
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(expected, ids)
+        self.assertEqual(len(books) + 2, len(ids))
+
+    def test_index_follows_changes(self):
+        self.book_3.title = 'Анна Каренина'
+        self.book_3.save()
+        self.assertEqual([], self.search('война'))
+        self.assertEqual([self.book_3.id], self.search('каренина'))
+        self.book_1.delete()
+        self.assertEqual([self.book_2.id], self.search('python'))
+
+    def test_non_word_search(self):
+        self.assertEqual([], self.search('+++'))
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import User
 from django.db.models import Count, Case, When, Avg, F
 from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
 
 from book.models import Book, UserBookRelation
-from book.serializers import BookSerializer, UserBookRelationSerializer
+from book.serializers import BookSerializer, UserBookRelationSerializer, \
+    BookRowsSerializer, READERS_PREVIEW_SIZE, MY_RELATION_FIELDS, \
+    my_relation_annotations
+from book.views import BookViewSet
 
 
 class BookSerializerTestCase(TestCase):
@@ -170,3 +174,64 @@ class BookSerializerTestCase(TestCase):
             },
         ]
         self.assertEqual(relation_data, data)
+
+
+class BookRowsSerializerTestCase(TestCase):
+    def setUp(self) -> None:
+        owner = User.objects.create(username='owner')
+        users = [User.objects.create(username=f'user{i}',
+                                     first_name=f'Name {i}',
+                                     last_name=f'Фамилия {i}')
+                 for i in range(READERS_PREVIEW_SIZE + 2)]
+        self.book1 = Book.objects.create(title='Book 1', price='122.5',
+                                         author_name='Author 1', owner=owner)
+        self.book2 = Book.objects.create(title='Книга 2', price=0,
+                                         author_name='Author 2')
+        Book.objects.create(title='Book 3', price='99999.99',
+                            author_name='')
+        for user, rate in zip(users, (5, 4, 4, None, 1, 3, 5)):
+            UserBookRelation.objects.create(user=user, book=self.book1,
+                                            like=True, rate=rate)
+        UserBookRelation.objects.create(user=users[0], book=self.book2,
+                                        in_bookmarks=True)
+
+    def test_same_output(self):
+        queryset = BookViewSet.queryset.all()
+        expected = BookSerializer(queryset, many=True).data
+        data = BookRowsSerializer(
+            list(queryset.values())).data
+        self.assertEqual(expected, data)
+        self.assertEqual(JSONRenderer().render(expected),
+                         JSONRenderer().render(data))
+        self.assertEqual('3.67', data[0]['rating'])
+        self.assertEqual(READERS_PREVIEW_SIZE, len(data[0]['readers']))
+        self.assertIsNone(data[1]['owner_name'])
+        self.assertIsNone(data[2]['rating'])
+        self.assertEqual([], data[2]['readers'])
+
+    def test_queries(self):
+        rows = list(BookViewSet.queryset.values())
+        with self.assertNumQueries(1):
+            BookRowsSerializer(rows).data
+
+    def test_instance_queries(self):
+        books = list(BookViewSet.queryset.all())
+        # The readers of every book.
+        with self.assertNumQueries(1):
+            data = BookSerializer(books, many=True).data
+        self.assertEqual(READERS_PREVIEW_SIZE, len(data[0]['readers']))
+        self.assertEqual(1, len(data[1]['readers']))
+
+    def test_my_relation(self):
+        user = User.objects.get(username='user0')
+        queryset = BookViewSet.queryset.annotate(
+            **my_relation_annotations(user))
+        context = {'my_relation': True}
+        expected = BookSerializer(queryset, many=True, context=context).data
+        data = BookRowsSerializer(
+            list(queryset.values()), True).data
+        self.assertEqual(expected, data)
+        self.assertEqual([(True, False, 5), (False, True, None),
+                          (False, False, None)],
+                         [tuple(item[name] for name in MY_RELATION_FIELDS)
+                          for item in data])
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+from importlib import import_module
+from unittest import mock
+
+from decouple import UndefinedValueError
+from django.conf import settings
+from django.test import SimpleTestCase
+
+DEV_APPS = {'debug_toolbar', 'django_extensions'}
+CACHE_URL = 'redis://cache:6379/1'
+# Settings and the modules loaded for them, in a fresh interpreter.
+LOADED = (
+    'import json, sys; from django.conf import settings; '
+    'print(json.dumps([settings.DEBUG, sorted(name for name in sys.modules '
+    'if name.startswith("drf_practice.settings."))]))'
+)
+
+
+def import_prod():
+    sys.modules.pop('drf_practice.settings.prod', None)
+    return import_module('drf_practice.settings.prod')
+
+
+class SettingsProfilesTestCase(SimpleTestCase):
+    @mock.patch.dict(os.environ, {'cache_url': CACHE_URL})
+    def test_prod_drops_dev_apps_and_middleware(self):
+        prod = import_prod()
+        self.assertFalse(prod.DEBUG)
+        self.assertFalse(DEV_APPS & set(prod.INSTALLED_APPS))
+        self.assertFalse([name for name in prod.MIDDLEWARE
+                          if 'debug_toolbar' in name])
+        self.assertEqual('drf_practice.db.backends.postgresql',
+                         prod.DATABASES['default']['ENGINE'])
+        self.assertEqual(CACHE_URL, prod.CACHES['default']['LOCATION'])
+
+    def test_prod_requires_shared_cache(self):
+        environ = {name: value for name, value in os.environ.items()
+                   if name != 'cache_url'}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            with self.assertRaises(UndefinedValueError):
+                import_prod()
+
+    def test_default_is_dev(self):
+        dev = import_module('drf_practice.settings.dev')
+        default = import_module('drf_practice.settings')
+        self.assertTrue(default.DEBUG)
+        self.assertEqual(dev.INSTALLED_APPS, default.INSTALLED_APPS)
+        self.assertEqual(dev.MIDDLEWARE, default.MIDDLEWARE)
+        self.assertLessEqual(DEV_APPS, set(default.INSTALLED_APPS))
+        self.assertNotIn('POOL', default.DATABASES['default'])
+
+    def load(self, **environ):
+        process = subprocess.run(
+            [sys.executable, '-c', LOADED], cwd=settings.BASE_DIR,
+            env={**os.environ, 'cache_url': CACHE_URL, **environ},
+            capture_output=True, text=True)
+        self.assertEqual(0, process.returncode, process.stderr)
+        return json.loads(process.stdout)
+
+    def test_profile_selected_exclusively(self):
+        base = 'drf_practice.settings.base'
+        self.assertEqual(
+            [False, [base, 'drf_practice.settings.prod']],
+            self.load(DJANGO_SETTINGS_MODULE='drf_practice.settings.prod'))
+        self.assertEqual(
+            [False, [base, 'drf_practice.settings.prod']],
+            self.load(DJANGO_SETTINGS_MODULE='drf_practice.settings',
+                      settings_profile='prod'))
+        self.assertEqual(
+            [True, [base, 'drf_practice.settings.dev']],
+            self.load(DJANGO_SETTINGS_MODULE='drf_practice.settings',
+                      settings_profile='dev'))
@@ -2,15 +2,24 @@ from django.template.defaulttags import url
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
-from book.views import BookViewSet, auth, UserBookRelationView
+from book import async_views
+from book.views import BookViewSet, auth, UserBookRelationView, \
+    ProfileViewSet, MyBooksView
 
 router = SimpleRouter()
 
 router.register(r'book', BookViewSet)
 router.register(r'book_relation', UserBookRelationView)
+router.register(r'profiles', ProfileViewSet, basename='profile')
+router.register(r'me/books', MyBooksView, basename='my-book')
 
 urlpatterns = [
     path('auth/', auth),
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail,
+         name='async-book-detail'),
+    path('async/book_relation/<int:book>/', async_views.relation_detail,
+         name='async-userbookrelation-detail'),
 
 ]
 urlpatterns += router.urls
@@ -1,42 +1,233 @@
-from django.db.models import Count, Case, When, Avg, F
+import os
+from functools import partial
+from itertools import islice
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 
-from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework.viewsets import ModelViewSet, GenericViewSet, ViewSet
 
+from book.cache import cached_response
+from book.export import FORMATS, KINDS, export_rows
+from book.leaderboard import BOARDS, top_books, top_size
+from book.logic import bulk_update_relations, upsert_relation
 from book.models import Book, UserBookRelation
+from book.pagination import KeysetCursorPagination, \
+    LibraryCursorPagination, ReadersCursorPagination
 from book.permissions import IsOwnerOrStaffOrReadOnly
-from book.serializers import BookSerializer, UserBookRelationSerializer
+from book.profiling import ProfiledDispatchMixin, list_profiles, \
+    profile_file
+from book.search import BookSearchFilter
+from book.serializers import BookSerializer, UserBookRelationSerializer, \
+    BookReaderSerializer, \
+    UserBookRelationBulkItemSerializer, BookRowsSerializer, \
+    MY_RELATION_FIELDS, my_relation_annotations
+
+
+def streaming_response(request, chunks, **kwargs):
+    """
+    StreamingHttpResponse of ``chunks``, an iterator querying the database.
+    Under ASGI, Django 4.0 consumes streaming content on the event loop,
+    where queries are not allowed, so the chunks are produced here, in the
+    thread of the view, and held in memory.
+    """
+    if isinstance(request._request, ASGIRequest):
+        chunks = list(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
 
 
-class BookViewSet(ModelViewSet):
+class BookViewSet(ProfiledDispatchMixin, ModelViewSet):
     queryset = Book.objects.all().annotate(
-        annotate_likes=Count(Case(When(
-            userbookrelation__like=True,
-            then=1))),
         owner_name=F('owner__username')
-    ).prefetch_related('readers').order_by('id')
+    ).order_by('id')
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
     filter_fields = ['price']
     search_fields = ['author_name', 'title']
     ordering_fields = ['price', 'author_name']
+    ordering = ['id']
+    pagination_class = KeysetCursorPagination
     permission_classes = [IsOwnerOrStaffOrReadOnly]
 
+    stream_chunk_size = 500
+
+    @property
+    def my_relation(self):
+        """Whether books come with the relation of the current user."""
+        return self.request.user.is_authenticated
+
+    def get_queryset(self):
+        return self.with_my_relation(super().get_queryset())
+
+    def with_my_relation(self, queryset):
+        if self.my_relation:
+            queryset = queryset.annotate(
+                **my_relation_annotations(self.request.user))
+        return queryset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(),
+                'my_relation': self.my_relation}
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == '1':
+            return self.stream_rows(request)
+        return cached_response(
+            request, 'list', partial(self.list_rows, request),
+            validators=self.get_list_validators)
+
+    def list_rows(self, request):
+        """``super().list()`` over ``.values()`` rows and BookRowsSerializer."""
+        rows = self.filter_queryset(self.get_queryset()).values()
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(BookRowsSerializer(
+                list(rows), self.my_relation).data)
+        return self.get_paginated_response(
+            BookRowsSerializer(page, self.my_relation).data)
+
+    def stream_rows(self, request):
+        """
+        Every matching book as one JSON array, read with a server-side
+        cursor and serialized ``stream_chunk_size`` rows at a time, so memory
+        does not grow with the result under WSGI (see streaming_response).
+        Not paginated nor cached.
+        """
+        rows = self.filter_queryset(self.get_queryset()).values()
+        rows = rows.order_by(*self.paginator.get_ordering(request, rows, self))
+        renderer = JSONRenderer()
+
+        def chunks():
+            yield b'['
+            iterator = rows.iterator(chunk_size=self.stream_chunk_size)
+            separator = b''
+            while chunk := list(islice(iterator, self.stream_chunk_size)):
+                # Rendered as a list, without its brackets.
+                yield separator + renderer.render(
+                    BookRowsSerializer(chunk, self.my_relation).data)[1:-1]
+                separator = b','
+            yield b']'
+
+        return streaming_response(request, chunks(),
+                                  content_type=renderer.media_type)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        return cached_response(
+            request, 'detail',
+            partial(super().retrieve, request, *args, **kwargs),
+            pk=pk, validators=partial(self.get_detail_validators, pk))
+
+    def get_object(self):
+        self.object = super().get_object()
+        return self.object
+
+    def get_list_validators(self):
+        page = getattr(self.paginator, 'page', None)
+        if page is None:
+            # Conditional request: the same page of plain Book rows, without
+            # readers, serializer or annotations other than the user's
+            # relation.
+            page = self.paginate_queryset(self.filter_queryset(
+                self.with_my_relation(Book.objects.all())).values())
+        state = [(row['id'], row['updated_at'],
+                  *(row[name] for name in MY_RELATION_FIELDS if name in row))
+                 for row in page]
+        state.append((self.paginator.has_next, self.paginator.has_previous))
+        # No Last-Modified: deleting a book changes the page without a newer
+        # updated_at, which only the ETag state sees.
+        return state, None
+
+    def get_detail_validators(self, pk):
+        book = getattr(self, 'object', None)
+        if book is None:
+            book = self.with_my_relation(
+                Book.objects.only('updated_at')).filter(pk=pk).first()
+        if book is None:
+            return None, None
+        state = book.updated_at
+        if self.my_relation:
+            state = (state, *(getattr(book, name)
+                              for name in MY_RELATION_FIELDS))
+        return state, book.updated_at
+
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Stream the ``export_books`` output:
+        ``?kind=books|relations&output=ndjson|csv``.
+        """
+        kind = request.query_params.get('kind', 'books')
+        output_format = request.query_params.get('output', 'ndjson')
+        if kind not in KINDS or output_format not in FORMATS:
+            raise ValidationError({'non_field_errors': [
+                f'kind is one of {", ".join(KINDS)}, output one of '
+                f'{", ".join(FORMATS)}.']})
+        response = streaming_response(
+            request, export_rows(kind, output_format),
+            content_type=f'{FORMATS[output_format]}; charset=utf-8')
+        response['Content-Disposition'] = \
+            f'attachment; filename="{kind}.{output_format}"'
+        return response
+
+    @action(detail=False)
+    def top(self, request):
+        """
+        Best books of ``?board=likes|rating|recent`` (likes by default),
+        ``?limit=`` of them at most, from book.leaderboard.
+        """
+        board = request.query_params.get('board', 'likes')
+        try:
+            limit = int(request.query_params.get('limit', top_size()))
+        except ValueError:
+            limit = 0
+        if board not in BOARDS or limit < 1:
+            raise ValidationError({'non_field_errors': [
+                f'board is one of {", ".join(BOARDS)}, limit a positive '
+                f'integer.']})
+        books = self.with_my_relation(
+            Book.objects.annotate(owner_name=F('owner__username')))
+        return Response(BookRowsSerializer(top_books(board, limit, books),
+                                           self.my_relation).data)
 
-class UserBookRelationView(UpdateModelMixin, GenericViewSet):
+    @action(detail=True, pagination_class=ReadersCursorPagination)
+    def readers(self, request, pk=None):
+        book = get_object_or_404(Book.objects.only('id'), pk=pk)
+        relations = UserBookRelation.objects.filter(
+            book=book
+        ).select_related('user').only(
+            'user', 'user__first_name', 'user__last_name'
+        )
+        page = self.paginate_queryset(relations)
+        serializer = BookReaderSerializer(
+            [relation.user for relation in page], many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class UserBookRelationView(ProfiledDispatchMixin, UpdateModelMixin,
+                           GenericViewSet):
     permission_classes = [IsAuthenticated]
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     lookup_field = 'book'
 
+    bulk_max_items = 1000
+
     def get_object(self):
         obj, created = UserBookRelation.objects.get_or_create(
             user=self.request.user,
@@ -44,6 +235,128 @@ class UserBookRelationView(UpdateModelMixin, GenericViewSet):
         )
         return obj
 
+    def update(self, request, *args, **kwargs):
+        # PUT and moves to another book keep the generic path.
+        if not kwargs.get('partial') or 'book' in request.data:
+            return super().update(request, *args, **kwargs)
+        try:
+            book_id = int(self.kwargs['book'])
+        except ValueError:
+            raise NotFound()
+        serializer = self.get_serializer(data=request.data, partial=True)
+        valid = serializer.is_valid()
+        # Like get_object() above, an invalid PATCH still creates the
+        # relation.
+        relation = upsert_relation(
+            request.user, book_id, serializer.validated_data if valid else {})
+        if relation is None:
+            raise NotFound()
+        if not valid:
+            raise ValidationError(serializer.errors)
+        return Response(self.get_serializer(relation).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Apply a list of ``{book, like, rate, in_bookmarks}`` items at once.
+        Invalid items are reported and skipped, the rest is applied in one
+        transaction.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': [
+                'Expected a list of items.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.bulk_max_items} items per request.']})
+
+        results = [None] * len(request.data)
+        valid = []
+        for index, item in enumerate(request.data):
+            serializer = UserBookRelationBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {
+                    'book': item.get('book') if isinstance(item, dict)
+                    else None,
+                    'status': 'invalid',
+                    'errors': serializer.errors,
+                }
+
+        outcomes = bulk_update_relations(request.user,
+                                         [data for _, data in valid])
+        for (index, data), (outcome, relation) in zip(valid, outcomes):
+            results[index] = {'book': data['book'], 'status': outcome}
+            if relation is not None:
+                results[index].update(
+                    UserBookRelationSerializer(relation).data)
+        return Response({'results': results})
+
+
+class MyBooksView(ProfiledDispatchMixin, GenericViewSet):
+    """
+    Books the current user liked (``?like=1``), bookmarked
+    (``?bookmarks=1``) or rated (``?rated=1``), most recently related
+    first. Filters combine; at least one is required so that pages are read
+    from the partial (user, id) index of the filter.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = LibraryCursorPagination
+    library_filters = {
+        'like': ('like', True),
+        'bookmarks': ('in_bookmarks', True),
+        'rated': ('rate__isnull', False),
+    }
+
+    def get_queryset(self):
+        lookups = {
+            f'userbookrelation__{lookup}': value
+            for name, (lookup, value) in self.library_filters.items()
+            if self.request.query_params.get(name) == '1'
+        }
+        if not lookups:
+            raise ValidationError({'non_field_errors': [
+                'Pass one or more of ' +
+                ', '.join(f'{name}=1' for name in self.library_filters) +
+                '.']})
+        # One filter() call: every condition applies to the same relation,
+        # which also gives the user's relation fields without subqueries.
+        return Book.objects.filter(
+            userbookrelation__user=self.request.user, **lookups
+        ).annotate(
+            owner_name=F('owner__username'),
+            relation_id=F('userbookrelation__id'),
+            my_like=F('userbookrelation__like'),
+            my_bookmark=F('userbookrelation__in_bookmarks'),
+            my_rate=F('userbookrelation__rate'),
+        )
+
+    def list(self, request):
+        page = self.paginate_queryset(self.get_queryset().values())
+        return self.get_paginated_response(
+            BookRowsSerializer(page, my_relation=True).data)
+
+
+class ProfileViewSet(ViewSet):
+    """Request profiles kept by ProfiledDispatchMixin, newest first."""
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = r'[\w-]+'
+
+    def list(self, request):
+        return Response(list_profiles())
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        """
+        ``?file=collapsed|pstats|sql|meta``, the profile written by the
+        request's BOOK_PROFILE_MODE by default.
+        """
+        path = profile_file(pk, request.query_params.get('file'))
+        if path is None:
+            raise NotFound()
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename=f'{pk}-{os.path.basename(path)}')
+
 
 def auth(request):
     return render(request, 'book/index.html')
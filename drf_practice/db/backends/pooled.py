@@ -0,0 +1,72 @@
+"""
+Pooled versions of Django's database backends.
+
+``connect()`` checks a connection out of a process-wide ConnectionPool
+instead of opening one, and ``close()``, which Django calls at the end of
+every request when ``CONN_MAX_AGE`` is 0, returns it. The pool is set with
+a ``POOL`` entry next to ``ENGINE``::
+
+    'ENGINE': 'drf_practice.db.backends.postgresql',
+    'CONN_MAX_AGE': 0,
+    'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 20, 'TIMEOUT': 10,
+             'MAX_LIFETIME': 1800, 'CHECK_INTERVAL': 0},
+
+Each thread (WSGI worker threads, the sync_to_async threads of ASGI) has
+its own DatabaseWrapper and so holds at most one pooled connection at a
+time; MAX_SIZE bounds them all together.
+"""
+from drf_practice.db.pool import ConnectionPool, PoolTimeout, get_pool
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 30,
+    'MAX_LIFETIME': 1800,
+    'CHECK_INTERVAL': 0,
+}
+
+
+class PooledDatabaseWrapperMixin:
+    pool = None
+
+    def pool_enabled(self):
+        return True
+
+    def get_pool(self, conn_params):
+        options = {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+        new_connection = super().get_new_connection
+
+        def factory():
+            pool = ConnectionPool(
+                lambda: new_connection(conn_params),
+                min_size=options['MIN_SIZE'],
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_lifetime=options['MAX_LIFETIME'],
+                check_interval=options['CHECK_INTERVAL'],
+            )
+            pool.fill()
+            return pool
+
+        # The test runner renames the database, so NAME is part of the key.
+        return get_pool((self.alias, self.vendor, repr(conn_params)), factory)
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_enabled():
+            return super().get_new_connection(conn_params)
+        self.pool = self.get_pool(conn_params)
+        try:
+            return self.pool.acquire()
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        pool, self.pool = self.pool, None
+        # A connection closed inside atomic() or broken by an error may hold
+        # a transaction or be dead; don't hand it to the next request.
+        discard = self.in_atomic_block or (self.errors_occurred
+                                           and not self.is_usable())
+        with self.wrap_database_errors:
+            pool.release(self.connection, discard=discard)
@@ -0,0 +1,13 @@
+from django.db.backends.postgresql import base
+
+from drf_practice.db.backends.pooled import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        # Set by Django when it opens the connection, which another thread's
+        # wrapper may have done for this pooled one.
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
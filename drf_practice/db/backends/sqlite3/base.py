@@ -0,0 +1,11 @@
+from django.db.backends.sqlite3 import base
+
+from drf_practice.db.backends.pooled import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite stand-in for the pooled PostgreSQL backend, for tests."""
+
+    def pool_enabled(self):
+        # Closing the connection of an in-memory database drops it.
+        return not self.is_in_memory_db()
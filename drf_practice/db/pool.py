@@ -0,0 +1,241 @@
+"""
+A thread-safe pool of DB-API connections, used by the pooled database
+backends in ``drf_practice.db.backends``.
+
+Connections are handed out newest first, so a lightly loaded process keeps
+reusing a few warm connections. A checkout waits up to ``timeout`` seconds
+when ``max_size`` connections are in use. It drops connections older than
+``max_lifetime`` and checks the others with ``check`` when they have been
+idle for ``check_interval`` seconds or more. Released connections are
+rolled back before they are reused.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def select_one(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+
+def rollback(connection):
+    connection.rollback()
+
+
+def close(connection):
+    connection.close()
+
+
+class Entry:
+    __slots__ = ('connection', 'created', 'released')
+
+    def __init__(self, connection, created):
+        self.connection = connection
+        self.created = created
+        self.released = created
+
+
+class ConnectionPool:
+    def __init__(self, connect, *, min_size=0, max_size=10, timeout=30,
+                 max_lifetime=None, check_interval=0, check=select_one,
+                 reset=rollback, close=close, clock=time.monotonic):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Pool sizes need 0 <= min_size <= max_size '
+                             'and max_size >= 1.')
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.check = check
+        self.reset = reset
+        self.close_connection = close
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.in_use = {}
+        # Idle, in use and being opened.
+        self.size = 0
+        self.closed = False
+        self.stats = dict.fromkeys((
+            'checkouts', 'waits', 'wait_seconds', 'timeouts', 'opened',
+            'closed', 'expired', 'failed_checks',
+        ), 0)
+
+    def fill(self):
+        """Open connections until ``min_size`` of them exist."""
+        while True:
+            with self.condition:
+                if self.closed or self.size >= self.min_size:
+                    return
+                self.size += 1
+            entry = self.open()
+            with self.condition:
+                self.idle.appendleft(entry)
+                self.condition.notify()
+
+    def acquire(self):
+        """Check a connection out; raise PoolTimeout when none frees up."""
+        start = self.clock()
+        while True:
+            entry, stale = self.take(start)
+            for old in stale:
+                self.discard(old)
+            if entry is None:
+                # take() reserved a slot for a new connection.
+                entry = self.open()
+            elif (self.check is not None
+                  and self.clock() - entry.released >= self.check_interval):
+                try:
+                    self.check(entry.connection)
+                except Exception:
+                    with self.condition:
+                        self.stats['failed_checks'] += 1
+                    self.discard(entry)
+                    continue
+            with self.condition:
+                self.in_use[id(entry.connection)] = entry
+            return entry.connection
+
+    def take(self, start):
+        """
+        An idle entry, or None with a slot reserved for a new connection,
+        and the expired entries met on the way, which the caller closes
+        outside of the lock.
+        """
+        stale = []
+        with self.condition:
+            waited = False
+            while True:
+                if self.closed:
+                    raise PoolTimeout('The connection pool is closed.')
+                while self.idle:
+                    entry = self.idle.pop()
+                    if self.expired(entry):
+                        self.stats['expired'] += 1
+                        stale.append(entry)
+                        continue
+                    self.record_checkout(start, waited)
+                    return entry, stale
+                if self.size < self.max_size:
+                    self.size += 1
+                    self.record_checkout(start, waited)
+                    return None, stale
+                remaining = start + self.timeout - self.clock()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    # Keep the pool size right before giving up.
+                    for entry in stale:
+                        self.discard(entry, locked=True)
+                    raise PoolTimeout(
+                        f'No database connection was released within '
+                        f'{self.timeout}s ({self.max_size} in use).')
+                waited = True
+                self.condition.wait(remaining)
+
+    def record_checkout(self, start, waited):
+        self.stats['checkouts'] += 1
+        if waited:
+            self.stats['waits'] += 1
+            self.stats['wait_seconds'] += self.clock() - start
+
+    def release(self, connection, discard=False):
+        """Return a checked out connection, closing it when ``discard``."""
+        with self.condition:
+            entry = self.in_use.pop(id(connection), None)
+        if entry is None:
+            self.close_connection(connection)
+            return
+        if not discard and not self.closed and not self.expired(entry):
+            try:
+                self.reset(connection)
+            except Exception:
+                discard = True
+            else:
+                with self.condition:
+                    if not self.closed:
+                        entry.released = self.clock()
+                        self.idle.append(entry)
+                        self.condition.notify()
+                        return
+        self.discard(entry)
+
+    def close(self):
+        """Close idle connections; the ones in use close when released."""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = list(self.idle), deque()
+            self.condition.notify_all()
+        for entry in idle:
+            self.discard(entry)
+
+    def open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.stats['opened'] += 1
+        return Entry(connection, self.clock())
+
+    def discard(self, entry, locked=False):
+        try:
+            self.close_connection(entry.connection)
+        except Exception:
+            pass
+        if locked:
+            self.size -= 1
+            self.stats['closed'] += 1
+            return
+        with self.condition:
+            self.size -= 1
+            self.stats['closed'] += 1
+            self.condition.notify()
+
+    def expired(self, entry):
+        return (self.max_lifetime is not None
+                and self.clock() - entry.created >= self.max_lifetime)
+
+    def status(self):
+        """Gauges and counters, for metrics."""
+        with self.condition:
+            return {'size': self.size, 'idle': len(self.idle),
+                    'in_use': len(self.in_use), **self.stats}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """The pool registered under ``key``, created with ``factory()``."""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = _pools[key] = factory()
+    return pool
+
+
+def pools():
+    with _pools_lock:
+        return dict(_pools)
+
+
+def close_pools():
+    with _pools_lock:
+        closing = list(_pools.values())
+        _pools.clear()
+    for pool in closing:
+        pool.close()
@@ -0,0 +1,140 @@
+"""
+Read replicas for the book API.
+
+During GET, HEAD and OPTIONS requests, ReplicaRouter reads models of
+``ReplicaRouter.route_app_labels`` from one of ``DATABASE_REPLICAS``, the
+same one for the whole request. Everything else reads from and writes to
+``default``: writes, other apps (sessions, users), and code that runs
+outside of a request, such as management commands and tests.
+
+To read their own writes, clients are pinned to ``default``. This lasts
+for the rest of the request that wrote anything, and for
+``DATABASE_REPLICA_PIN_SECONDS`` afterwards through a cookie, so the pin
+holds across worker processes. The pin window should exceed the usual
+replication lag. Data that outlives the request, such as the cached
+responses built during that window, is read in ``primary_reads()`` blocks.
+"""
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaState:
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+_state = ContextVar('db_replica_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """Route the reads of the block like those of a safe request."""
+    available = replicas()
+    state = ReplicaState(
+        None if pinned or not available else random.choice(available))
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Read from ``default`` in the block, without pinning the client."""
+    state = _state.get()
+    if state is None or state.replica is None:
+        yield
+        return
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaRouter:
+    route_app_labels = {'book'}
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or state.replica is None
+                or model._meta.app_label not in self.route_app_labels):
+            return None
+        return DEFAULT_DB_ALIAS if state.wrote else state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Not None: Django would then write instances read from a replica
+        # back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let ReplicaRouter use replicas for safe, unpinned requests and pin the
+    clients of requests that wrote. Must come before SessionMiddleware so
+    that session writes pin too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with replica_reads(pinned=pinned(request)) as state:
+            response = self.get_response(request)
+        return pin(response, state)
+
+    async def __acall__(self, request):
+        # Sync code run for the request in other threads, views included,
+        # gets the state along with the request's context.
+        with replica_reads(pinned=pinned(request)) as state:
+            response = await self.get_response(request)
+        return pin(response, state)
+
+
+def pinned(request):
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+def pin(response, state):
+    if state.wrote:
+        response.set_cookie(
+            PIN_COOKIE, '1', httponly=True, samesite='Lax',
+            max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+    return response
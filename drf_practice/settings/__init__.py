@@ -0,0 +1,21 @@
+"""
+The settings profile named by the ``settings_profile`` environment setting,
+``dev`` by default or ``prod``. With DJANGO_SETTINGS_MODULE pointing at a
+profile module instead, e.g. ``drf_practice.settings.prod``, this package
+loads no profile of its own.
+"""
+import os
+
+from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+
+if not os.environ.get('DJANGO_SETTINGS_MODULE', '').startswith(
+        f'{__name__}.'):
+    _profile = config('settings_profile', default='dev')
+    if _profile == 'dev':
+        from .dev import *  # noqa: F401,F403
+    elif _profile == 'prod':
+        from .prod import *  # noqa: F401,F403
+    else:
+        raise ImproperlyConfigured(
+            f"settings_profile must be 'dev' or 'prod', not {_profile!r}")
@@ -1,5 +1,8 @@
 """
-Django settings for drf_practice project.
+Django settings for drf_practice project, shared by the dev and prod
+profiles. ``drf_practice.settings`` is the dev profile unless
+``settings_profile=prod``; deployments may also set
+``DJANGO_SETTINGS_MODULE=drf_practice.settings.prod``.
 
 Generated by 'django-admin startproject' using Django 4.0.3.
 
@@ -14,7 +17,7 @@ from pathlib import Path
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.0/howto/deployment/checklist/
@@ -23,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('secret_key')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = False
 
 ALLOWED_HOSTS = []
 
@@ -36,9 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    "debug_toolbar",
     'rest_framework',
-    'django_extensions',
     'social_django',
 
     'book.apps.BookConfig',
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'book.metrics.RequestMetricsMiddleware',
+    'drf_practice.db.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,16 +56,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
-    'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware'
 ]
 
 ROOT_URLCONF = 'drf_practice.urls'
 
-INTERNAL_IPS = [
-    "127.0.0.1",
-]
-
+# Imported on the first authenticate() or login, not at startup.
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -101,6 +99,11 @@ DATABASES = {
     }
 }
 
+# Aliases of read replicas of 'default', see drf_practice/db/routers.py
+DATABASE_ROUTERS = ['drf_practice.db.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_PIN_SECONDS = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -154,7 +157,49 @@ REST_FRAMEWORK = {
     )
 }
 
+# social_django is an installed app, so like every app it is imported at
+# startup, in both profiles, along with social_core and requests.
 SOCIAL_AUTH_JSONFIELD_ENABLED = True
 
 SOCIAL_AUTH_GITHUB_KEY = config('social_git_key')
-SOCIAL_AUTH_GITHUB_SECRET = config('social_git_secret')
\ No newline at end of file
+SOCIAL_AUTH_GITHUB_SECRET = config('social_git_secret')
+
+# Per process; the prod profile shares a redis cache between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Versioned response cache of the book API, see book/cache.py
+BOOK_CACHE_ALIAS = 'default'
+BOOK_CACHE_TIMEOUT = 300
+BOOK_CACHE_LOCK_TIMEOUT = 10
+
+# Opt-in: 'background' leaves counters and ratings of books whose relations
+# changed to a worker applying their summed changes every
+# BOOK_RATING_INTERVAL seconds. Changes pending in a killed process are lost
+# until reconcile_book_counters runs, see book/rating_queue.py
+BOOK_RATING_MODE = 'sync'
+BOOK_RATING_INTERVAL = 1.0
+
+# Top books of /book/top/, see book/leaderboard.py. Run rebuild_leaderboards
+# after changing BOOK_TOP_CAPACITY or BOOK_TOP_MIN_VOTES.
+BOOK_TOP_SIZE = 20
+BOOK_TOP_CAPACITY = 50
+BOOK_TOP_MIN_VOTES = 3
+
+# Threads running the database work of the async views, see book/async_views.py
+BOOK_ASYNC_DB_WORKERS = 8
+
+# Bearer token of Prometheus scrapers of /metrics, which is otherwise only
+# served to staff users, see book/metrics.py
+BOOK_METRICS_TOKEN = config('metrics_token', default='')
+
+# Sampled request profiling, see book/profiling.py
+BOOK_PROFILE_DIR = BASE_DIR / 'profiles'
+BOOK_PROFILE_KEEP = 50
+BOOK_PROFILE_SAMPLE_RATE = 0
+BOOK_PROFILE_MODE = 'sampler'
+BOOK_PROFILE_INTERVAL = 0.005
+BOOK_PROFILE_TOKEN_MAX_AGE = 3600
@@ -0,0 +1,24 @@
+"""
+Development profile: DEBUG, django-debug-toolbar and django-extensions.
+"""
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
+
+ALLOWED_HOSTS = []
+
+INSTALLED_APPS = [
+    *INSTALLED_APPS,
+    'debug_toolbar',
+    'django_extensions',
+]
+
+MIDDLEWARE = [
+    *MIDDLEWARE,
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
+]
+
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
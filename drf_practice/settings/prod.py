@@ -0,0 +1,56 @@
+"""
+Production profile: no development apps or middleware, no DEBUG query
+capture, cached templates, pooled database connections and a shared cache.
+
+``python manage.py bench_settings`` compares its startup time and
+per-request overhead with the dev profile.
+"""
+from decouple import Csv, config
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = config('allowed_hosts', default='', cast=Csv())
+
+# Requests borrow connections from an in-process pool instead of opening
+# one each, see drf_practice/db/backends/pooled.py. CONN_MAX_AGE = 0 hands
+# them back at the end of every request.
+DATABASES = {
+    **DATABASES,
+    'default': {
+        **DATABASES['default'],
+        'ENGINE': 'drf_practice.db.backends.postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': config('db_pool_min_size', default=2, cast=int),
+            'MAX_SIZE': config('db_pool_max_size', default=20, cast=int),
+            'TIMEOUT': config('db_pool_timeout', default=10, cast=float),
+            'MAX_LIFETIME': config('db_pool_max_lifetime', default=1800,
+                                   cast=float),
+            'CHECK_INTERVAL': config('db_pool_check_interval', default=0,
+                                     cast=float),
+        },
+    },
+}
+
+# One alias per host of db_replica_hosts, e.g. "10.0.0.2,10.0.0.3".
+DATABASE_REPLICAS = []
+for number, host in enumerate(config('db_replica_hosts', default='',
+                                     cast=Csv()), 1):
+    DATABASE_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Every worker process must share the cache: the versions of the book
+# response cache (book/cache.py) only invalidate entries for the workers
+# that see them. cache_url is e.g. redis://10.0.0.4:6379/1.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('cache_url'),
+    },
+}
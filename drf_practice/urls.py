@@ -13,22 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf import settings
+from django.apps import apps
 from django.contrib import admin
 from django.template.defaulttags import url
 from django.templatetags.static import static
 from django.urls import path, include
 
-from drf_practice.settings import MEDIA_URL
+from book.metrics import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('', include('book.urls')),
     path('', include('social_django.urls', namespace='social')),
 
 ]
 
-if settings.DEBUG:
+if apps.is_installed('debug_toolbar'):
     import debug_toolbar
     urlpatterns = [
         path('__debug__/', include('debug_toolbar.urls')),